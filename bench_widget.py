@@ -0,0 +1,840 @@
+"""Benchmarks for the TrafficWidget sampling path.
+
+Uses the same .env as the widget (AP_HOST, AP_USER, AP_PASSWORD/AP_SSH_KEY, INTERFACE).
+
+  python bench_widget.py probe [-n 50]          # combined probe vs. legacy three-call tick
+  python bench_widget.py parse [--ifaces 500]   # /proc/net/dev parser on synthetic output
+  python bench_widget.py tray [-n 3000]         # tray icon update cost, uncached vs. cached
+  python bench_widget.py suite [--ifaces 20 200] # every sampling mode against a local fake AP
+  python bench_widget.py stations [--clients 50 500] # top-talker refresh cost per station count
+  python bench_widget.py transports [--ifaces 20 200] # SSH vs. ubus HTTP against a local fake AP
+  python bench_widget.py startup [-n 5]         # time to import, first window and first sample
+  python bench_widget.py replay [FILE ...]      # replay recordings through the pipeline at full speed
+  python bench_widget.py alerts [--windows 60 3600] # alert rule cost per sample vs. window length
+  python bench_widget.py ifaces [--ifaces 20 200 1000] # auto-detect + all-interface table, Python vs. NumPy
+  python bench_widget.py agent [--ifaces 20 200] # bytes per sample: full /proc/net/dev vs. delta agent
+  python bench_widget.py links [--samplers poll stream] # link flip to status change, LINK_WATCH on vs. off
+"""
+import argparse
+import heapq
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+import traffic_widget as tw
+
+
+def _report(label, samples):
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<28} n={len(samples):<5} p50={p50 * 1000:8.2f} ms  p95={p95 * 1000:8.2f} ms  max={samples[-1] * 1000:8.2f} ms")
+
+
+def _pct(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))] if samples else float("nan")
+
+
+def _timed(fn, n):
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def bench_probe(args):
+    monitor = tw.APMonitor(tw.AP_HOST, tw.AP_USER, tw.AP_PASSWORD or None, tw.AP_SSH_KEY)
+    iface = args.iface or tw.INTERFACE
+    monitor.connect()
+    try:
+        if not iface or iface.lower() == "auto":
+            iface = next(iter(monitor.read_all_counters()), "eth0")
+
+        def legacy_tick():
+            # What a tick cost before the combined probe: counters + operstate + ip link fallback
+            monitor.read_counters(iface)
+            monitor.read_link_status(iface)
+
+        def legacy_aggregate_tick():
+            monitor.read_all_counters()
+            monitor.read_link_status(iface)
+
+        print(f"AP {tw.AP_HOST}, interface {iface}")
+        _report("legacy read_counters+link", _timed(legacy_tick, args.n))
+        _report("legacy read_all+link", _timed(legacy_aggregate_tick, args.n))
+        _report("combined probe", _timed(monitor.probe, args.n))
+    finally:
+        monitor.close()
+
+
+def synthetic_proc_net_dev(count, seed=1):
+    """Return /proc/net/dev bytes with about `count` interfaces (VLANs, WDS links, wlan VAPs)."""
+    rnd = random.Random(seed)
+    names = ["lo", "eth0", "eth1", "br-lan", "wwan0"]
+    kinds = ("eth0.{}", "wds0-{}", "wlan0-{}", "wlan1-{}", "phy0-ap{}", "br-vlan{}")
+    i = 0
+    while len(names) < count:
+        names.append(kinds[i % len(kinds)].format(i // len(kinds)))
+        i += 1
+    lines = [
+        "Inter-|   Receive                                                |  Transmit",
+        " face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed",
+    ]
+    for name in names:
+        fields = [rnd.randrange(2**40), rnd.randrange(2**32)] + [rnd.randrange(100) for _ in range(6)]
+        fields += [rnd.randrange(2**40), rnd.randrange(2**32)] + [rnd.randrange(100) for _ in range(6)]
+        lines.append(f"{name:>6}: " + " ".join(f"{v:>8}" for v in fields))
+    return ("\n".join(lines) + "\n").encode(), names
+
+
+def _legacy_parse_all(data):
+    # Text parser used by read_all_counters before the shared bytes-level parser
+    result = {}
+    for line in data.decode(errors="ignore").splitlines():
+        line = line.strip()
+        if not line or ":" not in line:
+            continue
+        name, rest = line.split(":", 1)
+        parts = rest.split()
+        if len(parts) < 2:
+            continue
+        try:
+            rx_bytes = int(parts[0])
+            tx_bytes = int(parts[8]) if len(parts) > 8 else int(parts[-1])
+            result[name.strip()] = (rx_bytes, tx_bytes)
+        except Exception:
+            continue
+    return result
+
+
+def _legacy_parse_one(data, iface):
+    # Text parser used by read_counters before the shared bytes-level parser
+    for line in data.decode(errors="ignore").splitlines():
+        line = line.strip()
+        if not line or ":" not in line:
+            continue
+        name, rest = line.split(":", 1)
+        if name.strip() != iface:
+            continue
+        parts = rest.split()
+        if not parts:
+            continue
+        try:
+            return int(parts[0]), int(parts[8]) if len(parts) > 8 else int(parts[-1])
+        except Exception:
+            continue
+    return None, None
+
+
+def bench_parse(args):
+    for count in args.ifaces:
+        data, names = synthetic_proc_net_dev(count)
+        target = names[len(names) // 2]
+        assert tw.parse_proc_net_dev(data) == _legacy_parse_all(data)
+        assert tw.parse_proc_net_dev(data, names=(target,))[target] == _legacy_parse_one(data, target)
+        cases = [
+            ("legacy all", lambda: _legacy_parse_all(data)),
+            ("parse_proc_net_dev all", lambda: tw.parse_proc_net_dev(data)),
+            ("legacy one", lambda: _legacy_parse_one(data, target)),
+            ("parse_proc_net_dev one", lambda: tw.parse_proc_net_dev(data, names=(target,))),
+        ]
+        print(f"{count} interfaces, {len(data)} bytes per snapshot")
+        for label, fn in cases:
+            loops, total = timeit.Timer(fn).autorange()
+            best = min(timeit.Timer(fn).repeat(repeat=5, number=loops)) / loops
+            print(f"  {label:<26} {best * 1e6:10.1f} us/snapshot")
+
+
+class _StubIcon:
+    # Stands in for pystray.Icon and counts the native updates it would trigger
+    def __init__(self):
+        self.__dict__["pushes"] = {"icon": 0, "title": 0}
+
+    def __setattr__(self, name, value):
+        if name in self.pushes:
+            self.pushes[name] += 1
+        self.__dict__[name] = value
+
+
+def _legacy_tray_update(icon, down, up):
+    # TrayManager.update before the icon cache: full redraw and push every tick
+    def short(v):
+        if v >= 1024 * 1024:
+            return f"{v/(1024*1024):.1f}M"
+        return f"{max(v/1024, 0):.0f}K"
+    img = tw.Image.new("RGBA", (32, 32), (0, 0, 0, 0))
+    draw = tw.ImageDraw.Draw(img)
+    font = tw.ImageFont.load_default()
+    draw.rounded_rectangle([0, 0, 31, 31], radius=6, fill=(32, 32, 32, 240))
+    draw.text((3, 4), "D:", fill=(100, 160, 255, 255), font=font)
+    draw.text((3, 16), "U:", fill=(120, 220, 120, 255), font=font)
+    draw.text((14, 4), short(down), fill=(220, 220, 220, 255), font=font)
+    draw.text((14, 16), short(up), fill=(220, 220, 220, 255), font=font)
+    icon.title = f"Down: {tw.format_rate_bytes_per_sec(down)} | Up: {tw.format_rate_bytes_per_sec(up)}"
+    icon.icon = img
+
+
+def bench_tray(args):
+    tw.load_tray()
+    if not tw.HAS_PIL:
+        raise SystemExit("Pillow is required for the tray benchmark")
+    # Typical trace: idle stretches with background chatter, then busy transfers
+    rnd = random.Random(2)
+    rates = []
+    while len(rates) < args.n:
+        if rnd.random() < 0.6:
+            rates += [(rnd.uniform(0, 1500), rnd.uniform(0, 800)) for _ in range(rnd.randint(10, 60))]
+        else:
+            level = rnd.uniform(0.5e6, 12e6)
+            rates += [(level * rnd.uniform(0.9, 1.1), level * 0.03) for _ in range(rnd.randint(5, 30))]
+    rates = rates[:args.n]
+
+    legacy_icon = _StubIcon()
+    t0 = time.process_time()
+    for d, u in rates:
+        _legacy_tray_update(legacy_icon, d, u)
+    legacy = (time.process_time() - t0) / len(rates)
+
+    tray = tw.TrayManager(lambda: None, lambda: None)
+    tray.icon = _StubIcon()
+    has_tray, tw.HAS_TRAY = tw.HAS_TRAY, True
+    try:
+        t0 = time.process_time()
+        for d, u in rates:
+            tray.update(d, u)
+        cached = (time.process_time() - t0) / len(rates)
+    finally:
+        tw.HAS_TRAY = has_tray
+    print(f"{len(rates)} updates")
+    print(f"  uncached  {legacy * 1e6:8.1f} us CPU/update  pystray pushes {legacy_icon.pushes}")
+    print(f"  cached    {cached * 1e6:8.1f} us CPU/update  pystray pushes {tray.icon.pushes}  cached icons {len(tray._images)}")
+
+
+def _suite_legacy(monitor, iface, ticks, interval):
+    # Pre-probe tick: separate counter and link status commands
+    out = []
+    for _ in range(ticks):
+        t0 = time.perf_counter()
+        monitor.read_counters(iface)
+        monitor.read_link_status(iface)
+        out.append((time.perf_counter() - t0, None))
+        time.sleep(interval)
+    return out
+
+
+def _suite_poll(monitor, iface, ticks, interval):
+    out = []
+    for _ in range(ticks):
+        t0 = time.perf_counter()
+        ts, _, _ = monitor.probe()
+        out.append((time.perf_counter() - t0, time.monotonic() - ts))
+        time.sleep(interval)
+    return out
+
+
+def _suite_stream(monitor, iface, ticks, interval):
+    # No per-tick call: only the age of each pushed snapshot on arrival
+    out = []
+    for ts, _, _ in monitor.stream_snapshots(interval):
+        out.append((None, time.monotonic() - ts))
+        if len(out) >= ticks:
+            break
+    return out
+
+
+def _suite_burst(monitor, iface, ticks, interval):
+    # One frame per tick carrying five sub-samples of iface; age of the newest one
+    out = []
+    for ts, _, _, subs in monitor.burst_snapshots(interval, interval / 5, tw.burst_patterns(iface)):
+        out.append((None, time.monotonic() - (subs[-1][0] if subs else ts)))
+        if len(out) >= ticks:
+            break
+    return out
+
+
+def _suite_agent(monitor, iface, ticks, interval):
+    # Like stream, decoded from the agent's delta frames
+    out = []
+    for ts, _, _ in monitor.agent_snapshots(interval):
+        out.append((None, time.monotonic() - ts))
+        if len(out) >= ticks:
+            break
+    return out
+
+
+# Sampling modes the suite runs: name -> fn(monitor, iface, ticks, interval) returning
+# one (call seconds or None, sample age seconds or None) pair per tick
+SUITE_MODES = {
+    "legacy": _suite_legacy,
+    "poll": _suite_poll,
+    "stream": _suite_stream,
+    "burst": _suite_burst,
+    "agent": _suite_agent,
+}
+
+
+def start_fake_ap(*args, http=False):
+    """Run fake_ap.py in a subprocess on a free port; returns (process, port, ubus URL or None)."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_ap.py")
+    extra = ["--http-port", "0"] if http else []
+    proc = subprocess.Popen(
+        [sys.executable, script, "--port", "0", *extra, *map(str, args)], stdout=subprocess.PIPE, text=True
+    )
+    line = proc.stdout.readline()
+    if not line:
+        raise SystemExit("fake AP failed to start")
+    url = proc.stdout.readline().split(" on ", 1)[1].strip() if http else None
+    return proc, int(line.rsplit(":", 1)[1]), url
+
+
+# Fields `iw dev <vap> station dump` prints per station besides the ones STATIONS_SCRIPT keeps
+_STATION_EXTRA = (
+    "inactive time:\t{n} ms", "rx packets:\t{n}", "tx packets:\t{n}", "tx retries:\t{n}",
+    "tx failed:\t0", "rx drop misc:\t0", "signal:  \t-{s} [-{s}, -{s}] dBm", "signal avg:\t-{s} dBm",
+    "tx bitrate:\t866.7 MBit/s VHT-MCS 9 80MHz short GI VHT-NSS 2", "rx bitrate:\t650.0 MBit/s",
+    "expected throughput:\t49.987Mbps", "authorized:\tyes", "authenticated:\tyes", "associated:\tyes",
+    "preamble:\tlong", "WMM/WME:\tyes", "MFP:\t\tno", "TDLS peer:\tno", "DTIM period:\t2",
+    "beacon interval:100", "short slot time:yes", "connected time:\t{n} seconds",
+)
+
+
+def synthetic_station_dump(count, ts, full=False, seed=3):
+    """Return STATIONS_SCRIPT-style output for `count` stations (all iw fields if full)."""
+    rnd = random.Random(seed)
+    out = [f"@@ {ts:.2f}"]
+    for i in range(count):
+        out.append(f"Station 02:00:00:{i >> 16 & 255:02x}:{i >> 8 & 255:02x}:{i & 255:02x} (on wlan{i % 2})")
+        out.append(f"\trx bytes:\t{int(rnd.random() * 1e6 + ts * 1e4 * (i % 7))}")
+        out.append(f"\ttx bytes:\t{int(rnd.random() * 1e6 + ts * 1e5 * (i % 11))}")
+        if full:
+            out += ["\t" + f.format(n=rnd.randrange(10**6), s=rnd.randrange(30, 90)) for f in _STATION_EXTRA]
+    out.append("--")
+    out += [f"0 02:00:00:{i >> 16 & 255:02x}:{i >> 8 & 255:02x}:{i & 255:02x} 10.0.{i >> 8 & 255}.{i & 255} host{i} *" for i in range(count)]
+    out.append("##")
+    return ("\n".join(out) + "\n").encode()
+
+
+def bench_stations(args):
+    for count in args.clients:
+        dumps = [synthetic_station_dump(count, 100.0 + 5 * i) for i in range(20)]
+        parsed = [tw.parse_stations(d)[1] for d in dumps]
+        full = len(synthetic_station_dump(count, 100.0, full=True))
+        tracker = tw.StationTracker(args.k)
+        clock = itertools.count(100)
+        rates = [(random.random() * 1e6, f"{i}") for i in range(count)]
+
+        def update(i=[0]):
+            i[0] += 1
+            return tracker.update(next(clock) * 5.0, parsed[i[0] % len(parsed)])
+
+        cases = (
+            ("parse_stations", lambda: tw.parse_stations(dumps[1])),
+            ("StationTracker.update", update),
+            ("  top-k by heap", lambda: heapq.nlargest(args.k, rates)),
+            ("  top-k by full sort", lambda: sorted(rates, reverse=True)[:args.k]),
+        )
+        print(f"{count} stations: {len(dumps[1])} bytes per refresh (unfiltered iw output {full} bytes)")
+        for label, fn in cases:
+            loops, _ = timeit.Timer(fn).autorange()
+            best = min(timeit.Timer(fn).repeat(repeat=5, number=loops)) / loops
+            print(f"  {label:<26} {best * 1e6:10.1f} us/refresh")
+
+
+def bench_suite(args):
+    modes = args.modes or list(SUITE_MODES)
+    print(
+        f"fake AP: profile {args.profile}, latency {args.latency:g} ms; "
+        f"{args.ticks} ticks every {args.interval:g}s per mode"
+    )
+    print(f"{'ifaces':>6} {'mode':<8} {'call p50':>9} {'p95':>8} {'p99':>8} {'age p50':>8} {'p95':>8} "
+          f"{'cmds/tick':>9} {'KB/tick':>8} {'CPU/tick':>9}")
+    for count in args.ifaces:
+        proc, port, _ = start_fake_ap("--ifaces", count, "--profile", args.profile, "--latency", args.latency)
+        try:
+            for mode in modes:
+                monitor = tw.APMonitor("127.0.0.1", "bench", "bench", port=port)
+                monitor.connect()
+                try:
+                    SUITE_MODES[mode](monitor, "eth0", 2, args.interval)  # warm up
+                    before = json.loads(monitor._run("fakeap stats"))
+                    cpu = time.process_time()
+                    rows = SUITE_MODES[mode](monitor, "eth0", args.ticks, args.interval)
+                    cpu = (time.process_time() - cpu) / len(rows)
+                    after = json.loads(monitor._run("fakeap stats"))
+                finally:
+                    monitor.shutdown()
+                calls = [c for c, _ in rows if c is not None]
+                ages = [a for _, a in rows if a is not None]
+                ms = lambda v: f"{v * 1000:6.1f}ms" if v == v else "     -  "
+                print(
+                    f"{count:>6} {mode:<8} {ms(_pct(calls, 0.5)):>9} {ms(_pct(calls, 0.95)):>8} {ms(_pct(calls, 0.99)):>8} "
+                    f"{ms(_pct(ages, 0.5)):>8} {ms(_pct(ages, 0.95)):>8} "
+                    f"{(after['commands'] - before['commands']) / len(rows):>9.2f} "
+                    f"{(after['bytes'] - before['bytes']) / len(rows) / 1024:>8.1f} {cpu * 1000:>7.2f}ms"
+                )
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+def bench_transports(args):
+    print(f"fake AP: latency {args.latency:g} ms; {args.connects} connects and {args.ticks} probes per transport")
+    print(f"{'ifaces':>6} {'transport':<9} {'connect p50':>11} {'p95':>8} {'probe p50':>9} {'p95':>8} {'p99':>8} "
+          f"{'KB/probe':>8} {'CPU/probe':>9}")
+    for count in args.ifaces:
+        proc, port, url = start_fake_ap("--ifaces", count, "--latency", args.latency, http=True)
+        control = tw.APMonitor("127.0.0.1", "bench", "bench", port=port)
+        control.connect()
+        monitors = {
+            "ssh": lambda: tw.APMonitor("127.0.0.1", "bench", "bench", port=port),
+            "ubus": lambda: tw.UbusMonitor(url, "bench", "bench"),
+        }
+        try:
+            for name, make in monitors.items():
+                connects = []
+                for _ in range(args.connects):
+                    monitor = make()
+                    t0 = time.perf_counter()
+                    monitor.connect()
+                    connects.append(time.perf_counter() - t0)
+                    monitor.shutdown()
+                monitor = make()
+                monitor.connect()
+                try:
+                    for _ in range(3):
+                        monitor.probe()  # warm up
+                    before = json.loads(control._run("fakeap stats"))
+                    calls = []
+                    cpu = time.process_time()
+                    for _ in range(args.ticks):
+                        t0 = time.perf_counter()
+                        monitor.probe()
+                        calls.append(time.perf_counter() - t0)
+                    cpu = (time.process_time() - cpu) / args.ticks
+                    after = json.loads(control._run("fakeap stats"))
+                finally:
+                    monitor.shutdown()
+                ms = lambda v: f"{v * 1000:6.1f}ms"
+                print(
+                    f"{count:>6} {name:<9} {ms(_pct(connects, 0.5)):>11} {ms(_pct(connects, 0.95)):>8} "
+                    f"{ms(_pct(calls, 0.5)):>9} {ms(_pct(calls, 0.95)):>8} {ms(_pct(calls, 0.99)):>8} "
+                    f"{(after['bytes'] - before['bytes']) / args.ticks / 1024:>8.1f} {cpu * 1000:>7.2f}ms"
+                )
+        finally:
+            control.shutdown()
+            proc.terminate()
+            proc.wait()
+
+
+def bench_agent(args):
+    print(f"fake AP: {args.frames} samples every {args.interval:g}s per mode; SSH payload bytes from the AP")
+    print(f"{'ifaces':>6} {'profile':<8} {'stream B/sample':>15} {'agent B/sample':>14} {'ratio':>7}")
+    for count in args.ifaces:
+        for profile in args.profiles:
+            proc, port, _ = start_fake_ap("--ifaces", count, "--profile", profile)
+            control = tw.APMonitor("127.0.0.1", "bench", "bench", port=port)
+            control.connect()
+            try:
+                sizes = {}
+                for mode in ("stream", "agent"):
+                    monitor = tw.APMonitor("127.0.0.1", "bench", "bench", port=port)
+                    monitor.connect()
+                    frames = (monitor.agent_snapshots if mode == "agent" else monitor.stream_snapshots)(args.interval)
+                    next(frames)  # the agent's first frame carries every name and counter
+                    before = json.loads(control._run("fakeap stats"))
+                    for _ in range(args.frames):
+                        next(frames)
+                    after = json.loads(control._run("fakeap stats"))
+                    frames.close()
+                    monitor.shutdown()
+                    sizes[mode] = (after["bytes"] - before["bytes"]) / args.frames
+                print(f"{count:>6} {profile:<8} {sizes['stream']:>15,.0f} {sizes['agent']:>14,.0f} "
+                      f"{sizes['stream'] / max(sizes['agent'], 1):>6.0f}x")
+            finally:
+                control.shutdown()
+                proc.terminate()
+                proc.wait()
+
+
+def bench_links(args):
+    # A scheduler-driven poller on eth0 per sampler, with and without LINK_WATCH;
+    # eth0 is flipped at random points between ticks
+    print(f"fake AP: {args.ifaces} ifaces, POLL_INTERVAL={args.interval:g}s, {args.flips} link flips per run")
+    print(f"{'sampler':<8} {'watch':<5} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'B/tick':>8}")
+    saved = tw.SAMPLER, tw.LINK_WATCH, tw.POLL_INTERVAL, tw.AUTO_SWITCH, tw.TOP_TALKERS
+    rnd = random.Random(5)
+    try:
+        tw.POLL_INTERVAL, tw.AUTO_SWITCH, tw.TOP_TALKERS = args.interval, False, 0
+        for sampler in args.samplers:
+            for watch in (False, True):
+                tw.SAMPLER, tw.LINK_WATCH = sampler, watch
+                proc, port, _ = start_fake_ap("--ifaces", args.ifaces)
+                control = tw.APMonitor("127.0.0.1", "bench", "bench", port=port)
+                control.connect()
+                changed = threading.Event()
+                want = ["up"]
+
+                def on_update(poller):
+                    if poller.link_status == want[0]:
+                        changed.set()
+
+                monitor = tw.APMonitor("127.0.0.1", "bench", "bench", port=port)
+                poller = tw.APPoller("bench", monitor, "eth0", on_update=on_update)
+                scheduler = tw.PollScheduler([poller], args.interval)
+                try:
+                    scheduler.start()
+                    if not changed.wait(10) or (watch and not _wait_for(lambda: monitor._watched_links() is not None)):
+                        raise SystemExit(f"{sampler}: no sample from the fake AP")
+                    time.sleep(args.interval * 2)  # let a stream restart with the watcher
+                    before = json.loads(control._run("fakeap stats"))["bytes"], poller.samples
+                    delays = []
+                    for i in range(args.flips):
+                        time.sleep(args.interval * rnd.uniform(0.5, 1.5))
+                        want[0] = "down" if i % 2 == 0 else "up"
+                        changed.clear()
+                        t0 = time.perf_counter()
+                        control._run(f"fakeap link eth0 {want[0]}")
+                        if changed.wait(args.interval * 5):
+                            delays.append(time.perf_counter() - t0)
+                    sent = json.loads(control._run("fakeap stats"))["bytes"] - before[0]
+                    ticks = max(poller.samples - before[1], 1)
+                finally:
+                    scheduler.stop()
+                    control.shutdown()
+                    proc.terminate()
+                    proc.wait()
+                if not delays:
+                    print(f"{sampler:<8} {'on' if watch else 'off':<5} {'(status never changed)':>26}")
+                    continue
+                print(f"{sampler:<8} {'on' if watch else 'off':<5} {_pct(delays, 0.5) * 1000:>8.1f} "
+                      f"{_pct(delays, 0.95) * 1000:>8.1f} {max(delays) * 1000:>8.1f} {sent / ticks:>8,.0f}")
+    finally:
+        tw.SAMPLER, tw.LINK_WATCH, tw.POLL_INTERVAL, tw.AUTO_SWITCH, tw.TOP_TALKERS = saved
+
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+# Runs in a fresh interpreter and prints "<event> <wall time>" for import, window
+# (first paint; skipped without a display) and sample (first rate shown). argv[1] = 1
+# imports the heavy dependencies up front first, as the widget used to.
+_STARTUP_DRIVER = r"""
+import sys, threading, time
+done = threading.Event()
+def mark(event):
+    print(event, time.time(), flush=True)
+if sys.argv[1] == "1":
+    import paramiko, requests
+    try:
+        import PIL.Image, pystray
+    except Exception:
+        pass
+import traffic_widget as tw
+mark("import")
+def on_update(poller):
+    if not done.is_set():
+        done.set()
+        mark("sample")
+try:
+    app = tw.App()
+except Exception:
+    app = None
+if app is None:
+    pollers = tw.build_pollers(on_update=on_update)
+    scheduler = tw.PollScheduler(pollers, tw.POLL_INTERVAL)
+    scheduler.start()
+    done.wait(30)
+    scheduler.stop()
+else:
+    def on_expose(event):
+        app.root.unbind("<Expose>")
+        mark("window")
+    app.root.bind("<Expose>", on_expose)
+    for p in app.pollers:
+        p.on_update = lambda poller, cb=p.on_update: (on_update(poller), cb(poller))
+    def check():
+        if done.is_set():
+            app.exit_app()
+        else:
+            app.root.after(20, check)
+    check()
+    app.run()
+"""
+
+
+def bench_startup(args):
+    proc, port, _ = start_fake_ap("--ifaces", 20)
+    env = dict(
+        os.environ, AP_HOST="127.0.0.1", AP_PORT=str(port), AP_USER="bench", AP_PASSWORD="bench",
+        AP_SSH_KEY="", AP_HOSTS="", AP_TRANSPORT="ssh", INTERFACE=args.iface,
+        POLL_INTERVAL=str(args.interval), HISTORY_DIR="", METRICS_PORT="", TOP_TALKERS="0",
+        INSTRUMENT="0", START_MINIMIZED="0",
+    )
+    print(f"{args.n} runs each, POLL_INTERVAL={args.interval:g}, INTERFACE={args.iface}; seconds from process start")
+    print(f"{'imports':<8} {'import':>8} {'window':>8} {'sample':>8}")
+    try:
+        for eager, label in ((True, "eager"), (False, "lazy")):
+            runs = []
+            for _ in range(args.n):
+                t0 = time.time()
+                out = subprocess.run(
+                    [sys.executable, "-c", _STARTUP_DRIVER, "1" if eager else "0"],
+                    env=env, capture_output=True, text=True, timeout=60,
+                ).stdout
+                events = {}
+                for line in out.splitlines():
+                    name, _, stamp = line.partition(" ")
+                    if name in ("import", "window", "sample"):
+                        events[name] = float(stamp) - t0
+                runs.append(events)
+            cols = []
+            for name in ("import", "window", "sample"):
+                values = [r[name] for r in runs if name in r]
+                cols.append(f"{statistics.median(values):7.3f}s" if values else "      - ")
+            print(f"{label:<8} {cols[0]:>8} {cols[1]:>8} {cols[2]:>8}")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def record_fake_session(path, samples, ifaces, mode="probe"):
+    """Record `samples` probes (or burst frames) from a local fake AP with some link
+    flaps, counter resets and an interface that becomes the busiest halfway."""
+    proc, port, _ = start_fake_ap(
+        "--ifaces", ifaces, "--profile", "bursty",
+        "--script", "0.5:link eth1 down,1:link eth1 up,1.5:reset eth0,2:profile wlan0 steady",
+    )
+    monitor = tw.APMonitor("127.0.0.1", "bench", "bench", port=port)
+    monitor.connect()
+    monitor.recorder = tw.Recorder(path, dict(ap="fake", iface="auto", transport="ssh", sampler=mode,
+                                              interval=0.02, started=time.time()))
+    try:
+        if mode == "burst":
+            frames = monitor.burst_snapshots(0.1, 0.02, "*")
+            for _ in range(samples):
+                next(frames)
+            frames.close()
+        else:
+            for _ in range(samples):
+                monitor.probe()
+                time.sleep(0.02)
+    finally:
+        monitor.shutdown()
+        proc.terminate()
+        proc.wait()
+
+
+def bench_replay(args):
+    paths = args.files
+    tmp = None
+    if not paths:
+        tmp = tempfile.TemporaryDirectory()
+        paths = []
+        for mode in ("probe", "burst"):
+            path = os.path.join(tmp.name, f"fake-{mode}.twrec")
+            print(f"recording {args.samples} {mode} samples of {args.ifaces} interfaces from a fake AP...")
+            record_fake_session(path, args.samples, args.ifaces, mode)
+            paths.append(path)
+    try:
+        for path in paths:
+            header, records = tw.read_recording(path)
+            count = sum(1 for _ in records)
+            switches = []
+            rates = []
+            t0 = time.perf_counter()
+            poller = tw.replay_file(
+                path,
+                on_update=lambda p: rates.append((p.down_bps, p.up_bps)),
+                on_iface=lambda p: switches.append(p.iface),
+            )
+            took = time.perf_counter() - t0
+            print(
+                f"{os.path.basename(path)}: {count} samples, {os.path.getsize(path) / max(count, 1):.0f} bytes/sample "
+                f"on disk, replayed at {count / took:,.0f} samples/s"
+            )
+            digest = hash(tuple(rates)) & 0xFFFFFFFF
+            print(f"  {len(rates)} rates (digest {digest:08x}), interface {header.get('iface')} -> "
+                  f"{' -> '.join(switches) or poller.iface}, zero-rate samples {sum(1 for r in rates if r == (0, 0))}")
+    finally:
+        if tmp:
+            tmp.cleanup()
+
+
+def _python_table(prev, cur, dt, count):
+    # What the all-interface table costs without numpy: one unwrap per counter, then a sort
+    rows = []
+    for name, (rx, tx) in cur.items():
+        old = prev.get(name)
+        if old is None:
+            continue
+        drx = tw.unwrap_delta(old[0], rx, dt, tw.RATE_MAX_BPS)
+        dtx = tw.unwrap_delta(old[1], tx, dt, tw.RATE_MAX_BPS)
+        if drx is not None and dtx is not None:
+            rows.append((drx / dt, dtx / dt, name))
+    return heapq.nlargest(count, rows)
+
+
+def bench_ifaces(args):
+    if not tw.load_numpy():
+        raise SystemExit("needs numpy (pip install numpy)")
+    rnd = random.Random(7)
+    for count in args.ifaces:
+        data, names = synthetic_proc_net_dev(count)
+        base = tw.parse_proc_net_dev(data)
+        snapshots = []
+        for i in range(args.snapshots):
+            snap = {}
+            for name, (rx, tx) in base.items():
+                rx = (rx + rnd.randrange(10**6)) % 2**64
+                tx = (tx + rnd.randrange(10**6)) % 2**64
+                snap[name] = base[name] = (rx, tx)
+            snapshots.append((float(i), snap))
+        results = {}
+        for label, vectorized in (("python", False), ("numpy", True)):
+            selector = tw.InterfaceSelector(vectorized=vectorized)
+            picks = []
+            t0 = time.perf_counter()
+            prev = None
+            for ts, snap in snapshots:
+                selector.update(ts, snap)
+                picks.append(selector.busiest()[0])
+                selector.challenger(names[1], ts)
+                if vectorized:
+                    selector.table.top("rx", args.rows)
+                elif prev is not None:
+                    _python_table(prev, snap, 1.0, args.rows)
+                prev = snap
+            results[label] = (time.perf_counter() - t0) / len(snapshots), picks
+        assert results["python"][1] == results["numpy"][1], "busiest interface differs"
+        print(f"{count:>5} interfaces: python {results['python'][0] * 1e6:8.1f} us/snapshot, "
+              f"numpy {results['numpy'][0] * 1e6:8.1f} us/snapshot (auto-detect + {args.rows}-row table)")
+
+
+class _Poller:
+    name = "bench"
+
+
+def _naive_holds(values, ts, rule):
+    # Rescan every value in the window on each sample (what the deques avoid)
+    window = [v for t, v in values if t >= ts - rule.duration]
+    level = {"min": min, "max": max, "avg": lambda w: sum(w) / len(w)}[rule.agg](window)
+    return level < rule.threshold if rule.below else level > rule.threshold
+
+
+def bench_alerts(args):
+    rnd = random.Random(5)
+    samples = [(i * args.interval, rnd.choice((2e3, 4e4, 3e6)), rnd.random() * 1e5) for i in range(args.samples)]
+    for span in args.windows:
+        rules = [
+            tw.AlertRule({"name": f"r{i}", "metric": ("down", "up", "total")[i % 3], "below": 51200 * (i + 1),
+                          "for": span, "agg": ("max", "avg")[i % 2], "link": "up"})
+            for i in range(args.rules)
+        ]
+        fired = []
+        engine = tw.AlertEngine(rules, on_alert=lambda *a: fired.append(a), gap=1e9)
+        poller = _Poller()
+        t0 = time.perf_counter()
+        for ts, down, up in samples:
+            engine.evaluate(poller, ts, down, up, "up")
+        took = time.perf_counter() - t0
+        # Rescanning, timed on 50 samples once the window is full
+        start = min(int(span / args.interval), len(samples) - 50)
+        values = [(ts, down) for ts, down, _ in samples[max(0, start - int(span / args.interval)):start]]
+        t0 = time.perf_counter()
+        for ts, down, up in samples[start:start + 50]:
+            values.append((ts, down))
+            for rule in rules:
+                _naive_holds(values, ts, rule)
+        naive = (time.perf_counter() - t0) / 50
+        print(f"window {span:>6g}s ({span / args.interval:>6.0f} samples), {args.rules} rules: "
+              f"{took / args.samples * 1e6:7.1f} us/sample sliding, "
+              f"{naive * 1e6:9.1f} us/sample rescanning; {len(fired)} alerts")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("probe", help="time one tick: combined probe vs. legacy per-read commands")
+    p.add_argument("-n", type=int, default=50)
+    p.add_argument("--iface", default=None)
+    p.set_defaults(func=bench_probe)
+    p = sub.add_parser("parse", help="time the /proc/net/dev parser on synthetic output")
+    p.add_argument("--ifaces", type=int, nargs="+", default=[20, 200, 1000])
+    p.set_defaults(func=bench_parse)
+    p = sub.add_parser("tray", help="time tray icon updates with and without the icon cache")
+    p.add_argument("-n", type=int, default=3000)
+    p.set_defaults(func=bench_tray)
+    p = sub.add_parser("stations", help="time a top-talker refresh for many associated clients")
+    p.add_argument("--clients", type=int, nargs="+", default=[50, 500, 2000])
+    p.add_argument("-k", type=int, default=5)
+    p.set_defaults(func=bench_stations)
+    p = sub.add_parser("suite", help="run every sampling mode against a local fake AP")
+    p.add_argument("--ifaces", type=int, nargs="+", default=[20, 200])
+    p.add_argument("--modes", nargs="+", choices=sorted(SUITE_MODES), default=None)
+    p.add_argument("--ticks", type=int, default=100)
+    p.add_argument("--interval", type=float, default=0.1, help="seconds between ticks")
+    p.add_argument("--profile", default="bursty")
+    p.add_argument("--latency", type=float, default=0.0, help="added AP delay per command, ms")
+    p.set_defaults(func=bench_suite)
+    p = sub.add_parser("transports", help="compare the SSH and ubus HTTP transports against a local fake AP")
+    p.add_argument("--ifaces", type=int, nargs="+", default=[20, 200])
+    p.add_argument("--connects", type=int, default=10)
+    p.add_argument("--ticks", type=int, default=200)
+    p.add_argument("--latency", type=float, default=0.0, help="added AP delay per request, ms")
+    p.set_defaults(func=bench_transports)
+    p = sub.add_parser("startup", help="time to first window and first sample, lazy vs. eager imports")
+    p.add_argument("-n", type=int, default=5)
+    p.add_argument("--iface", default="auto")
+    p.add_argument("--interval", type=float, default=0.25, help="POLL_INTERVAL for the run")
+    p.set_defaults(func=bench_startup)
+    p = sub.add_parser("replay", help="replay recordings (RECORD_DIR files) through the pipeline as fast as possible")
+    p.add_argument("files", nargs="*", help="recordings; default: record fresh ones from a local fake AP")
+    p.add_argument("--samples", type=int, default=200)
+    p.add_argument("--ifaces", type=int, default=20)
+    p.set_defaults(func=bench_replay)
+    p = sub.add_parser("alerts", help="time alert rule evaluation per sample for long windows")
+    p.add_argument("--windows", type=float, nargs="+", default=[60, 600, 3600])
+    p.add_argument("--rules", type=int, default=10)
+    p.add_argument("--samples", type=int, default=20000)
+    p.add_argument("--interval", type=float, default=0.1, help="seconds between samples (SAMPLER=burst rate)")
+    p.set_defaults(func=bench_alerts)
+    p = sub.add_parser("agent", help="bytes per sample of SAMPLER=stream vs. agent against a local fake AP")
+    p.add_argument("--ifaces", type=int, nargs="+", default=[20, 200])
+    p.add_argument("--profiles", nargs="+", default=["idle", "bursty"])
+    p.add_argument("--frames", type=int, default=30)
+    p.add_argument("--interval", type=float, default=0.1)
+    p.set_defaults(func=bench_agent)
+    p = sub.add_parser("links", help="time from a link flip to the status change, LINK_WATCH on vs. off")
+    p.add_argument("--samplers", nargs="+", choices=["poll", "stream", "burst", "agent"], default=["poll", "stream"])
+    p.add_argument("--ifaces", type=int, default=20)
+    p.add_argument("--flips", type=int, default=20)
+    p.add_argument("--interval", type=float, default=1.0, help="POLL_INTERVAL for the run")
+    p.set_defaults(func=bench_links)
+    p = sub.add_parser("ifaces", help="time auto-detect and the all-interface table, pure Python vs. NumPy")
+    p.add_argument("--ifaces", type=int, nargs="+", default=[20, 200, 1000])
+    p.add_argument("--snapshots", type=int, default=300)
+    p.add_argument("--rows", type=int, default=10)
+    p.set_defaults(func=bench_ifaces)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
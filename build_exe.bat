@@ -35,6 +35,14 @@ if exist "dist\%_EXE_NAME%" (
   )
 )
 
+REM numpy (IFACE_TABLE, optional) would add tens of MB to unpack at every launch;
+REM set WITH_NUMPY=1 to bundle it
+set _EXCLUDE=--exclude-module numpy
+if "%WITH_NUMPY%"=="1" (
+  python -m pip install -r requirements-numpy.txt >nul 2>&1
+  set _EXCLUDE=
+)
+
 REM Build using module invocation to avoid PATH issues
 python -m PyInstaller --noconfirm --clean ^
   --name TrafficWidget ^
@@ -42,6 +50,7 @@ python -m PyInstaller --noconfirm --clean ^
   --hidden-import=paramiko ^
   --hidden-import=pystray ^
   --hidden-import=PIL.Image --hidden-import=PIL.ImageDraw --hidden-import=PIL.ImageFont ^
+  %_EXCLUDE% ^
   traffic_widget.py
 
 echo.
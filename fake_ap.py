@@ -0,0 +1,653 @@
+"""Local stand-in for an OpenWrt AP, for testing and benchmarking without hardware.
+
+Runs a paramiko SSH server that answers the commands TrafficWidget sends (the combined
+probe, the stream and burst loops, the awk agent (run by the host's awk), the link
+watch (ip monitor link), cat /proc/net/dev, operstate reads, ip link show, station
+dumps) from synthetic interfaces and clients whose counters follow a traffic profile,
+and emulates the commands.json actions (a reboot drops every connection, an interface
+bounce takes the link down for its sleep). With --http-port it also serves ubus
+JSON-RPC (session login, network.device status) like rpcd behind uhttpd's /ubus. Any
+user/password or key is accepted.
+
+  python fake_ap.py [--port 2222] [--http-port 8080] [--ifaces 20] [--profile bursty]
+                    [--latency 20] [--drop-every 30] [--stations 40]
+                    [--script "10:link eth0 down,20:reset eth0"]
+
+Point the widget at it with AP_HOST=127.0.0.1 AP_PORT=2222 AP_USER=x AP_PASSWORD=x
+(plus AP_TRANSPORT=ubus AP_UBUS_URL=http://{host}:8080/ubus for the HTTP backend).
+While it runs, `fakeap <action>` over SSH changes it on the fly and `fakeap stats`
+returns its counters as JSON (these control commands are not counted).
+
+Actions (also usable in --script as "<seconds>:<action>"):
+  link <iface> up|down        reset <iface>          profile <iface|*> <name>
+  latency <ms> [jitter_ms]    disconnect             expire (drop ubus sessions)
+"""
+import argparse
+import fnmatch
+import json
+import logging
+import math
+import os
+import queue
+import random
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import paramiko
+
+import traffic_widget as tw
+
+
+def _bursty(t, scale, phase):
+    # Full rate in roughly one second out of five, background chatter otherwise
+    second = int(t + phase * 3)
+    return scale if (second * 2654435761 ^ int(phase * 1e6)) % 5 == 0 else scale * 0.002
+
+
+# Traffic profiles: name -> bytes/s at time t for an interface with the given
+# scale and phase. Rates are deterministic for a given seed.
+PROFILES = {
+    "idle": lambda t, scale, phase: scale * 0.0005 * (1 + math.sin(t / 7 + phase)),
+    "steady": lambda t, scale, phase: scale,
+    "sine": lambda t, scale, phase: scale * (1 + math.sin(2 * math.pi * t / 30 + phase)) / 2,
+    "ramp": lambda t, scale, phase: scale * (((t + phase * 10) % 60) / 60),
+    "bursty": _bursty,
+}
+
+
+def interface_names(count):
+    """Return `count` plausible OpenWrt interface names (lo and eth0 first)."""
+    names = ["lo", "eth0", "eth1", "br-lan", "wwan0", "wlan0", "wlan1"][:count]
+    kinds = ("eth0.{}", "wlan0-{}", "wlan1-{}", "phy0-ap{}", "wds0-{}", "br-vlan{}")
+    i = 0
+    while len(names) < count:
+        names.append(kinds[i % len(kinds)].format(i // len(kinds) + 1))
+        i += 1
+    return names
+
+
+class FakeInterface:
+    def __init__(self, name, profile, scale, phase, bits=64):
+        self.name = name
+        self.profile = profile
+        self.scale = scale
+        self.phase = phase
+        self.mask = (1 << bits) - 1
+        self.rx = 0
+        self.tx = 0
+        self.link = "up"
+
+    def advance(self, t, dt):
+        if self.link != "up" or self.name == "lo":
+            return
+        rate = PROFILES[self.profile](t, self.scale, self.phase)
+        self.rx = (self.rx + int(rate * dt)) & self.mask
+        self.tx = (self.tx + int(rate * 0.08 * dt)) & self.mask
+
+
+class FakeAP:
+    """A paramiko SSH server emulating the parts of an AP TrafficWidget reads.
+
+    Counters advance lazily whenever a command reads them, so idle servers cost
+    nothing. stats counts connections, commands and bytes sent so benchmarks can
+    report round trips per tick.
+    """
+
+    def __init__(self, ifaces=20, profile="bursty", rate=5e6, latency=0.0, jitter=0.0,
+                 drop_every=0.0, counter_bits=64, seed=1, host="127.0.0.1", port=0, stations=0,
+                 http_port=None):
+        rnd = random.Random(seed)
+        self.interfaces = {}
+        for name in interface_names(ifaces):
+            scale = rate if name == "eth0" else rate * rnd.uniform(0.01, 0.5)
+            self.interfaces[name] = FakeInterface(name, profile, scale, rnd.uniform(0, 10), counter_bits)
+        # `stations` clients on every wireless VAP, keyed by MAC; a few heavy users
+        self.stations = {}
+        for vap in [n for n in self.interfaces if n.startswith(("wlan", "phy"))]:
+            for _ in range(stations):
+                mac = "02:" + ":".join(f"{rnd.randrange(256):02x}" for _ in range(5))
+                scale = rate * (rnd.uniform(0.05, 0.3) if rnd.random() < 0.1 else rnd.uniform(0, 0.01))
+                station = FakeInterface(vap, profile, scale, rnd.uniform(0, 10), 32)
+                station.host = f"client-{len(self.stations) + 1}"
+                self.stations[mac] = station
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_every = drop_every
+        self.host = host
+        self.port = port
+        self.http_port = http_port  # None = no ubus HTTP endpoint
+        self.ubus_timeout = 300  # idle seconds before a ubus session expires, like rpcd
+        self._ubus_sessions = {}  # sid -> expiry (monotonic)
+        self.files = {}  # path -> bytes written with "cat > path" (the agent)
+        self._watchers = set()  # queue.SimpleQueue per link watch channel
+        self._http = None
+        self.stats = {"connections": 0, "commands": 0, "bytes": 0, "drops": 0}
+        self._start = time.monotonic()
+        self._last = self._start
+        self._lock = threading.Lock()
+        self._transports = set()
+        self._sock = None
+        self._stop = threading.Event()
+        self._key = paramiko.RSAKey.generate(2048)
+        self._rnd = random.Random(seed)
+        # (compiled pattern, handler(match, chan) -> exit status); first match wins
+        self.commands = [
+            (re.compile(re.escape(tw.PROBE_SCRIPT.strip())), self._cmd_probe),
+            (re.compile(re.escape(tw.COUNTERS_SCRIPT.strip())), self._cmd_probe),
+            (re.compile(re.escape(tw.WATCH_SCRIPT.strip())), self._cmd_watch),
+            (re.compile(r"cat > (\S+)\.tmp && mv \S+ (\S+)"), self._cmd_write_file),
+            (re.compile(r"\[ -f (\S+) \] \|\| exit 3; while :; do .*?sleep (\S+) .*done "
+                        r"\| awk -v inc='([^']*)' -v exc='([^']*)' -f \S+", re.S), self._cmd_agent),
+            (re.compile(r"now\(\) .*?while :; do .*echo '%%'; i=0; while \[ \$i -lt (\d+) \]; do usleep (\d+) "
+                        r".*case \"\$l\" in (\S+)\) .*done", re.S), self._cmd_burst),
+            (re.compile(r"while :; do .*?sleep (\S+) .*done", re.S), self._cmd_stream),
+            (re.compile(r".*case \"\$n\" in (\S+)\) m=.*iw dev \$n station dump.*", re.S), self._cmd_stations),
+            (re.compile(r"cat /proc/net/dev\b.*"), self._cmd_proc_net_dev),
+            (re.compile(r"cat /sys/class/net/([^/ ]+)/operstate\b.*"), self._cmd_operstate),
+            (re.compile(r"ip link show ([^ ]+).*"), self._cmd_ip_link),
+            # commands.json actions
+            (re.compile(r".*ip link set dev (\S+) down.*&& sleep (\d+) &&.*", re.S), self._cmd_bounce),
+            (re.compile(r".*\breboot\b.*", re.S), self._cmd_reboot),
+            (re.compile(r".*(?:wifi reload|/etc/init\.d/network).*", re.S), self._cmd_restart),
+        ]
+
+    # Emulated AP state
+
+    def _advance(self):
+        with self._lock:
+            now = time.monotonic()
+            dt, self._last = now - self._last, now
+            t = now - self._start
+            for iface in self.interfaces.values():
+                iface.advance(t, dt)
+            for station in self.stations.values():
+                station.advance(t, dt)
+        return now
+
+    def proc_net_dev(self, advance=True):
+        if advance:
+            self._advance()
+        lines = [
+            "Inter-|   Receive                                                |  Transmit",
+            " face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed",
+        ]
+        lines.extend(self._net_dev_line(i) for i in self.interfaces.values())
+        return "\n".join(lines) + "\n"
+
+    def _net_dev_line(self, i):
+        return (
+            f"{i.name:>6}: {i.rx:>8} {i.rx // 900:>7}    0    0    0     0          0         0 "
+            f"{i.tx:>8} {i.tx // 300:>7}    0    0    0     0       0          0"
+        )
+
+    def operstates(self):
+        return "".join(
+            f"/sys/class/net/{i.name}/operstate:{'unknown' if i.name == 'lo' else i.link}\n"
+            for i in self.interfaces.values()
+        )
+
+    def probe(self, links=True):
+        # Uptime follows this host's monotonic clock so a benchmark on the same host
+        # can tell how old a sample is when it arrives
+        now = self._advance()
+        return f"@@ {now:.3f}\n{self.proc_net_dev(advance=False)}--\n{self.operstates() if links else ''}##\n"
+
+    def _ip_link_line(self, iface):
+        index = list(self.interfaces).index(iface.name) + 1
+        flags = "BROADCAST,MULTICAST,UP,LOWER_UP" if iface.link == "up" else "BROADCAST,MULTICAST"
+        return (
+            f"{index}: {iface.name}: <{flags}> mtu 1500 qdisc mq state {iface.link.upper()} mode DEFAULT group default qlen 1000\n"
+            f"    link/ether 02:00:00:00:{index // 256:02x}:{index % 256:02x} brd ff:ff:ff:ff:ff:ff\n"
+        )
+
+    def set_link(self, name, state):
+        """Change a link and tell every link watch, like the kernel's netlink events."""
+        self._advance()
+        iface = self.interfaces[name]
+        iface.link = state
+        # ip -o puts each event on one line, with "\" for the line breaks
+        event = self._ip_link_line(iface).rstrip("\n").replace("\n", "\\") + "\n"
+        with self._lock:
+            for q in self._watchers:
+                q.put(event)
+
+    # Command handlers
+
+    def _send(self, chan, text):
+        data = text.encode()
+        chan.sendall(data)
+        self.stats["bytes"] += len(data)
+
+    def _cmd_probe(self, match, chan):
+        self._send(chan, self.probe(links="operstate" in match.group(0)))
+        return 0
+
+    def _cmd_stream(self, match, chan):
+        try:
+            interval = float(match.group(1))
+        except ValueError:
+            interval = 1.0
+        links = "operstate" in match.group(0)
+        while not self._stop.is_set() and not chan.closed:
+            self._send(chan, self.probe(links))
+            time.sleep(interval)
+        return 0
+
+    def _cmd_watch(self, match, chan):
+        q = queue.SimpleQueue()
+        with self._lock:
+            self._watchers.add(q)
+        try:
+            self._send(chan, self.operstates() + "##\n")
+            while not self._stop.is_set() and not chan.closed:
+                try:
+                    self._send(chan, q.get(timeout=0.5))
+                except queue.Empty:
+                    pass
+        finally:
+            with self._lock:
+                self._watchers.discard(q)
+        return 0
+
+    def _cmd_write_file(self, match, chan):
+        data = b""
+        while True:
+            chunk = chan.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+        self.files[match.group(2)] = data
+        return 0
+
+    def _cmd_agent(self, match, chan):
+        # Feed the stream frames through the host's awk, as the AP's shell would
+        program = self.files.get(match.group(1))
+        awk = shutil.which("awk")
+        if program is None or awk is None:
+            return 3 if program is None else 127
+        interval = float(match.group(2))
+        links = "operstate" in match.group(0)
+        with tempfile.NamedTemporaryFile("wb", suffix=".awk", delete=False) as f:
+            f.write(program)
+        # mawk holds piped input back until its buffer fills; BusyBox awk and gawk don't
+        extra = ["-W", "interactive"] if "mawk" in os.path.basename(os.path.realpath(awk)) else []
+        proc = subprocess.Popen(
+            [awk, *extra, "-v", f"inc={match.group(3)}", "-v", f"exc={match.group(4)}", "-f", f.name],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+
+        def relay():
+            while True:
+                chunk = os.read(proc.stdout.fileno(), 65536)
+                if not chunk:
+                    return
+                try:
+                    self._send(chan, chunk.decode())
+                except Exception:
+                    return
+
+        threading.Thread(target=relay, daemon=True).start()
+        try:
+            while not self._stop.is_set() and not chan.closed and proc.poll() is None:
+                proc.stdin.write(self.probe(links).encode())
+                proc.stdin.flush()
+                time.sleep(interval)
+        except OSError:
+            pass
+        finally:
+            proc.kill()
+            proc.wait()
+            os.unlink(f.name)
+        return 0
+
+    def _cmd_burst(self, match, chan):
+        count, interval = int(match.group(1)), int(match.group(2)) / 1e6
+        patterns = [p[:-2] for p in match.group(3).split("|") if p.endswith(":*")]
+        names = [n for n in self.interfaces if any(fnmatch.fnmatchcase(n, p) for p in patterns)]
+        links = "operstate" in match.group(0)
+        while not self._stop.is_set() and not chan.closed:
+            out = [self.probe(links)[:-3], "%%\n"]
+            for _ in range(count):
+                time.sleep(interval)
+                now = self._advance()
+                out.append(f"@ {now:.3f}\n")
+                out.extend(self._net_dev_line(self.interfaces[n]) + "\n" for n in names)
+            out.append("##\n")
+            self._send(chan, "".join(out))
+            time.sleep(interval)
+        return 0
+
+    def _cmd_stations(self, match, chan):
+        now = self._advance()
+        vaps = {i.name for i in self.stations.values()}
+        wanted = {v for v in vaps if any(fnmatch.fnmatchcase(v, p) for p in match.group(1).split("|"))} or vaps
+        out = [f"@@ {now:.3f}\n"]
+        for mac, st in self.stations.items():
+            if st.name in wanted:
+                # Station counters are the AP's view: tx is what the client downloads
+                out.append(f"Station {mac} (on {st.name})\n\trx bytes:\t{st.tx}\n\ttx bytes:\t{st.rx}\n")
+        out.append("--\n")
+        out.extend(f"{int(time.time()) + 3600} {mac} 192.168.1.{i % 250 + 2} {st.host} *\n"
+                   for i, (mac, st) in enumerate(self.stations.items()))
+        out.append("##\n")
+        self._send(chan, "".join(out))
+        return 0
+
+    def _cmd_proc_net_dev(self, match, chan):
+        self._send(chan, self.proc_net_dev())
+        return 0
+
+    def _cmd_operstate(self, match, chan):
+        iface = self.interfaces.get(match.group(1))
+        if iface is not None:
+            self._send(chan, ("unknown" if iface.name == "lo" else iface.link) + "\n")
+        return 0
+
+    def _cmd_ip_link(self, match, chan):
+        iface = self.interfaces.get(match.group(1))
+        if iface is not None:
+            self._send(chan, self._ip_link_line(iface))
+        return 0
+
+    def _cmd_bounce(self, match, chan):
+        if match.group(1) not in self.interfaces:
+            return 0
+        self.set_link(match.group(1), "down")
+        time.sleep(float(match.group(2)))
+        self.set_link(match.group(1), "up")
+        return 0
+
+    def _cmd_reboot(self, match, chan):
+        # The AP goes away shortly after, before it can report an exit status
+        threading.Timer(0.2, self.disconnect_all).start()
+        time.sleep(1)
+        return None
+
+    def _cmd_restart(self, match, chan):
+        time.sleep(1)
+        return 0
+
+    # Control actions (fakeap <action> over SSH, or --script)
+
+    def action(self, line):
+        """Apply one control action; returns a short result string."""
+        args = line.split()
+        if not args:
+            return ""
+        verb = args[0]
+        if verb == "stats":
+            return json.dumps(self.stats)
+        if verb == "disconnect":
+            self.disconnect_all()
+        elif verb == "expire":
+            self._ubus_sessions.clear()
+        elif verb == "link" and len(args) == 3:
+            self.set_link(args[1], args[2])
+        elif verb == "reset" and len(args) == 2:
+            with self._lock:
+                self.interfaces[args[1]].rx = self.interfaces[args[1]].tx = 0
+        elif verb == "profile" and len(args) == 3 and args[2] in PROFILES:
+            self._advance()
+            for iface in self.interfaces.values():
+                if args[1] in ("*", iface.name):
+                    iface.profile = args[2]
+        elif verb == "latency" and len(args) in (2, 3):
+            self.latency = float(args[1]) / 1000
+            self.jitter = float(args[2]) / 1000 if len(args) == 3 else 0.0
+        else:
+            raise ValueError(f"unknown action: {line}")
+        return "ok"
+
+    def disconnect_all(self):
+        with self._lock:
+            transports = list(self._transports)
+        for t in transports:
+            t.close()
+        self.stats["drops"] += len(transports)
+
+    def run_script(self, script):
+        """Run "<seconds>:<action>,..." on a background thread, timed from now."""
+        events = sorted(
+            (float(at), action.strip())
+            for at, _, action in (item.partition(":") for item in script.split(",") if item.strip())
+        )
+
+        def run():
+            start = time.monotonic()
+            for at, action in events:
+                if self._stop.wait(max(0, start + at - time.monotonic())):
+                    return
+                try:
+                    self.action(action)
+                except Exception as e:
+                    print(f"script: {e}", flush=True)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    # ubus JSON-RPC (rpcd behind uhttpd's /ubus)
+
+    def ubus_call(self, sid, obj, method, args):
+        """Return the JSON-RPC result list for one ubus call ([status, data])."""
+        now = time.monotonic()
+        if obj == "session" and method == "login":
+            sid = f"{self._rnd.getrandbits(128):032x}"
+            self._ubus_sessions[sid] = now + self.ubus_timeout
+            return [0, {"ubus_rpc_session": sid, "timeout": self.ubus_timeout, "expires": self.ubus_timeout}]
+        if self._ubus_sessions.get(sid, 0) < now:
+            self._ubus_sessions.pop(sid, None)
+            return [6]  # UBUS_STATUS_PERMISSION_DENIED
+        self._ubus_sessions[sid] = now + self.ubus_timeout
+        if obj == "network.device" and method == "status":
+            self._advance()
+            with self._lock:
+                return [0, {
+                    i.name: {
+                        "type": "Network device",
+                        "up": True,
+                        "carrier": i.link == "up",
+                        "statistics": {"rx_bytes": i.rx, "tx_bytes": i.tx,
+                                       "rx_packets": i.rx // 900, "tx_packets": i.tx // 300},
+                    }
+                    for i in self.interfaces.values()
+                }]
+        return [3]  # UBUS_STATUS_METHOD_NOT_FOUND
+
+    def _serve_http(self):
+        ap = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like uhttpd
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    ap.stats["commands"] += 1
+                    delay = ap.latency + (ap._rnd.uniform(0, ap.jitter) if ap.jitter else 0)
+                    if delay:
+                        time.sleep(delay)
+                    result = ap.ubus_call(*request["params"][:4])
+                    reply = {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+                except Exception as e:
+                    reply = {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": str(e)}}
+                body = json.dumps(reply).encode()
+                ap.stats["bytes"] += len(body)
+                self.send_response(200 if self.path == "/ubus" else 404)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._http = ThreadingHTTPServer((self.host, self.http_port), Handler)
+        self._http.daemon_threads = True
+        self.http_port = self._http.server_address[1]
+        threading.Thread(target=self._http.serve_forever, daemon=True).start()
+
+    # SSH server
+
+    def _exec(self, chan, command):
+        status = 127
+        try:
+            if command.startswith("fakeap "):
+                try:
+                    chan.sendall((self.action(command[7:]) + "\n").encode())
+                    status = 0
+                except Exception as e:
+                    chan.sendall_stderr(f"fakeap: {e}\n".encode())
+                    status = 1
+            else:
+                self.stats["commands"] += 1
+                delay = self.latency + (self._rnd.uniform(0, self.jitter) if self.jitter else 0)
+                if delay:
+                    time.sleep(delay)
+                for pattern, handler in self.commands:
+                    match = pattern.fullmatch(command.strip())
+                    if match:
+                        status = handler(match, chan)
+                        break
+                else:
+                    chan.sendall_stderr(f"sh: {command.split()[0] if command.split() else ''}: not found\n".encode())
+        except Exception:
+            pass
+        try:
+            # EOF rather than close: this may run before paramiko has acknowledged the
+            # exec request, and a client sees a close before that as a failure. The
+            # client closes the channel; _serve reaps any it leaves open.
+            chan.send_exit_status(status)
+            chan.shutdown_write()
+            chan.done_at = time.monotonic()
+        except Exception:
+            pass
+
+    def _serve(self, sock):
+        ap = self
+
+        class Server(paramiko.ServerInterface):
+            def get_allowed_auths(self, username):
+                return "password,publickey"
+
+            def check_auth_password(self, username, password):
+                return paramiko.AUTH_SUCCESSFUL
+
+            def check_auth_publickey(self, username, key):
+                return paramiko.AUTH_SUCCESSFUL
+
+            def check_channel_request(self, kind, chanid):
+                return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+            def check_channel_exec_request(self, channel, command):
+                threading.Thread(target=ap._exec, args=(channel, command.decode(errors="ignore")), daemon=True).start()
+                return True
+
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(self._key)
+        try:
+            transport.start_server(server=Server())
+        except Exception:
+            return
+        with self._lock:
+            self._transports.add(transport)
+        self.stats["connections"] += 1
+        # Accepted channels must stay referenced or paramiko closes them on collection
+        channels = set()
+        while transport.is_active() and not self._stop.is_set():
+            chan = transport.accept(1)
+            now = time.monotonic()
+            for c in [c for c in channels if now - getattr(c, "done_at", now) > 5]:
+                c.close()
+            channels = {c for c in channels if not c.closed}
+            if chan is not None:
+                channels.add(chan)
+        with self._lock:
+            self._transports.discard(transport)
+
+    def _accept(self):
+        while not self._stop.is_set():
+            try:
+                sock, _ = self._sock.accept()
+            except OSError:
+                return
+            # Like sshd: without this, Nagle holds back the exit status and EOF
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(sock,), daemon=True).start()
+
+    def _dropper(self):
+        while not self._stop.wait(self.drop_every):
+            self.disconnect_all()
+
+    def start(self):
+        """Start listening; returns the bound port."""
+        self._sock = socket.socket()
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen(50)
+        self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+        if self.drop_every:
+            threading.Thread(target=self._dropper, daemon=True).start()
+        if self.http_port is not None:
+            self._serve_http()
+        return self.port
+
+    def stop(self):
+        self._stop.set()
+        try:
+            self._sock.close()
+        except Exception:
+            pass
+        if self._http:
+            self._http.shutdown()
+            self._http.server_close()
+        self.disconnect_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2222, help="0 picks a free port")
+    parser.add_argument("--http-port", type=int, default=None, help="also serve ubus JSON-RPC on /ubus (0 = free port)")
+    parser.add_argument("--ifaces", type=int, default=20, help="number of interfaces (default 20)")
+    parser.add_argument("--profile", default="bursty", choices=sorted(PROFILES))
+    parser.add_argument("--rate", type=float, default=5e6, help="peak bytes/s of eth0 (default 5e6)")
+    parser.add_argument("--latency", type=float, default=0.0, help="added delay per command, ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra delay per command, ms")
+    parser.add_argument("--drop-every", type=float, default=0.0, help="drop all connections every N seconds")
+    parser.add_argument("--counter-bits", type=int, default=64, choices=(32, 64))
+    parser.add_argument("--stations", type=int, default=0, help="associated clients per wireless VAP")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--script", default="", help='timed actions, e.g. "10:link eth0 down,20:disconnect"')
+    args = parser.parse_args()
+    # Clients hanging up mid-stream is normal here
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    ap = FakeAP(
+        ifaces=args.ifaces, profile=args.profile, rate=args.rate,
+        latency=args.latency / 1000, jitter=args.jitter / 1000, drop_every=args.drop_every,
+        counter_bits=args.counter_bits, seed=args.seed, host=args.host, port=args.port,
+        stations=args.stations, http_port=args.http_port,
+    )
+    port = ap.start()
+    print(f"fake AP listening on {args.host}:{port}", flush=True)
+    if ap.http_port is not None:
+        print(f"ubus on http://{args.host}:{ap.http_port}/ubus", flush=True)
+    if args.script:
+        ap.run_script(args.script)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ap.stop()
+
+
+if __name__ == "__main__":
+    main()
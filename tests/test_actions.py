@@ -0,0 +1,30 @@
+import threading
+from types import SimpleNamespace
+
+import traffic_widget as tw
+
+
+def _poller(run_action):
+    return SimpleNamespace(name="ap", monitor=SimpleNamespace(run_action=run_action))
+
+
+def test_submit_after_stop_does_not_leave_the_action_pending():
+    ex = tw.ActionExecutor({"reboot": "reboot"})
+    ex.stop()
+    poller = _poller(lambda cmd, timeout: (0, ""))
+    assert ex.submit(poller, "reboot") is None
+    assert not ex._pending
+
+
+def test_cancelled_action_is_released():
+    release = threading.Event()
+    ex = tw.ActionExecutor({"a": "a", "b": "b"}, workers=1)
+    poller = _poller(lambda cmd, timeout: (release.wait(5), (0, ""))[1])
+    running = ex.submit(poller, "a")
+    queued = ex.submit(poller, "b")
+    assert ex.submit(poller, "b") is None
+    ex.stop()
+    release.set()
+    running.result(5)
+    assert queued.cancelled()
+    assert not ex._pending
@@ -0,0 +1,35 @@
+import traffic_widget as tw
+
+
+def _manager():
+    return tw.ConnectionManager(lambda: object(), alive=lambda client: True)
+
+
+def test_short_lived_connection_counts_toward_the_backoff():
+    conn = _manager()
+    for n in (1, 2, 3):
+        conn.adopt(object())
+        conn.drop("connection lost")
+        assert conn.attempts == n
+    # Connects succeeded, so none of them failed
+    assert conn.failures == 0
+    assert "attempt" not in conn.describe()
+
+
+def test_long_lived_connection_resets_the_backoff():
+    conn = _manager()
+    conn.attempts = 4
+    conn.adopt(object())
+    conn._connected_at -= 31
+    conn.drop("connection lost")
+    assert conn.attempts == 0
+
+
+def test_connecting_clears_the_failure_count():
+    conn = _manager()
+    conn.failures = conn.attempts = 3
+    conn.adopt(object())
+    assert conn.failures == 0
+    assert conn.connected.is_set()
+    conn.drop()
+    assert not conn.connected.is_set()
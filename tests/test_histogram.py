@@ -0,0 +1,27 @@
+import traffic_widget as tw
+
+
+def test_zero_duration_lands_in_the_lowest_bucket():
+    h = tw.Histogram()
+    h.add(0.0)
+    stats = h.stats()
+    assert stats["count"] == 1
+    assert stats["max"] < 2e-6
+
+
+def test_sub_microsecond_and_negative_durations_stay_in_the_lowest_bucket():
+    h = tw.Histogram()
+    for seconds in (1e-12, 1e-9, -1e-9):
+        h.add(seconds)
+    assert h.counts[0] == 3
+
+
+def test_percentiles_track_the_samples():
+    # Bucket upper bounds: at most 1/8 above the sample
+    h = tw.Histogram()
+    for _ in range(99):
+        h.add(0.001)
+    h.add(0.5)
+    stats = h.stats()
+    assert 0.001 <= stats["p50"] < 0.001 * 1.13
+    assert 0.5 <= stats["max"] < 0.5 * 1.13
@@ -0,0 +1,28 @@
+import traffic_widget as tw
+
+DAY = 86400.0
+
+
+def test_evict_keeps_recent_records_and_later_appends(tmp_path):
+    log = tw.SeriesLog(str(tmp_path), "ap_eth0")
+    for day in range(10):
+        log.append(day * DAY, day, day, 1.0, 2.0)
+    log.evict(10 * DAY, (3, 30, 365))
+    assert [r[0] for r in log.read(0, 0, 11 * DAY)] == [7 * DAY, 8 * DAY, 9 * DAY]
+    log.append(10 * DAY, 10, 10, 1.0, 2.0)
+    assert [r[1] for r in log.read(0, 0, 11 * DAY)] == [7, 8, 9, 10]
+    log.close()
+
+
+def test_backwards_timestamp_keeps_the_log_sorted(tmp_path):
+    log = tw.SeriesLog(str(tmp_path), "ap_eth0")
+    for ts in (100.0, 200.0, 150.0, 300.0):
+        log.append(ts, int(ts), 0, 0.0, 0.0)
+    log.close()
+    # A reopened log continues from the last record on disk
+    log = tw.SeriesLog(str(tmp_path), "ap_eth0")
+    log.append(250.0, 250, 0, 0.0, 0.0)
+    records = log.read(0, 0, 1000)
+    assert [r[0] for r in records] == [100.0, 200.0, 200.0, 300.0, 300.0]
+    assert [r[1] for r in log.read(0, 200.0, 301.0)] == [200, 150, 300, 250]
+    log.close()
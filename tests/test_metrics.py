@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+
+import traffic_widget as tw
+
+
+def _poller():
+    conn = tw.ConnectionManager(lambda: object(), alive=lambda client: True)
+    return tw.APPoller("ap", SimpleNamespace(conn=conn), "eth0")
+
+
+def _sample(poller, ts, rx, links):
+    poller._handle_snapshot(ts, {"eth0": (rx, 0)}, links)
+
+
+def test_link_change_is_scraped_without_a_new_sample():
+    poller = _poller()
+    exporter = tw.MetricsExporter([poller])
+    _sample(poller, 1.0, 0, {"eth0": "up"})
+    _sample(poller, 2.0, 1000, {"eth0": "up"})
+    assert b'link_up{ap="ap",interface="eth0"} 1' in exporter.render()
+    poller._links_changed({"eth0": "down"})
+    assert b'link_up{ap="ap",interface="eth0"} 0' in exporter.render()
+
+
+def test_connection_changes_are_scraped():
+    poller = _poller()
+    exporter = tw.MetricsExporter([poller])
+    assert b"ssh_connect_failures{ap=\"ap\"} 0" in exporter.render()
+    poller.monitor.conn.failures = 2
+    poller.monitor.conn._set_state("backoff")
+    assert b"ssh_connect_failures{ap=\"ap\"} 2" in exporter.render()
@@ -0,0 +1,138 @@
+import pytest
+
+import traffic_widget as tw
+
+MAX_RATE = 1.25e9
+
+
+def _delta(prev, cur, dt):
+    return tw.RateEstimator(max_rate=MAX_RATE)._delta(prev, cur, dt)
+
+
+def _rates(estimator, readings):
+    """Feed [(ts, {name: (rx, tx)}), ...]; return the rate after each reading."""
+    return [estimator.update(ts, counters) for ts, counters in readings]
+
+
+def test_delta_handles_32_and_64_bit_wraps():
+    assert _delta(100, 150, 1.0) == 50
+    assert _delta(2 ** 32 - 1000, 500, 1.0) == 1500
+    assert _delta(2 ** 64 - 1000, 500, 1.0) == 1500
+
+
+def test_delta_reports_a_reset_when_the_wrap_is_implausible():
+    # Wrapping a 32-bit counter from 10 MB would mean ~4 GB in one second
+    assert _delta(10_000_000, 5, 1.0) is None
+    assert _delta(2 ** 40, 5, 1.0) is None
+
+
+def test_drop_below_2_32_is_a_wrap_only_near_the_32_bit_limit():
+    # Below 2**32 the counter may be 32-bit (and wrapped) or 64-bit (and reset); only a
+    # wrap that fits a plausible rate counts as one
+    assert _delta(2 ** 32 - 4000, 1000, 1.0) == 5000
+    assert _delta(1_000_000_000, 1000, 1.0) is None
+    # The same drop spread over a long enough interval is a plausible wrap again
+    assert _delta(1_000_000_000, 1000, 10.0) == 2 ** 32 - 1_000_000_000 + 1000
+
+
+def test_64_bit_reset_below_2_32_holds_the_rate():
+    est = tw.RateEstimator()
+    out = _rates(est, [
+        (0, {"eth0": (1_000_000_000, 0)}),
+        (1, {"eth0": (1_000_500_000, 0)}),
+        (2, {"eth0": (1000, 0)}),  # 64-bit counter reset, not a ~3.3 GB 32-bit wrap
+        (3, {"eth0": (501_000, 0)}),
+    ])
+    assert out[1:] == [(500_000.0, 0.0)] * 3
+
+
+def test_steady_counters_give_exact_rates():
+    est = tw.RateEstimator()
+    out = _rates(est, [(t, {"eth0": (1000 * t, 100 * t)}) for t in range(5)])
+    assert out[0] is None
+    assert out[1:] == [(1000.0, 100.0)] * 4
+
+
+def test_32_bit_wrap_keeps_the_rate():
+    est = tw.RateEstimator()
+    start = 2 ** 32 - 1500
+    readings = [(t, {"eth0": ((start + 1000 * t) % 2 ** 32, 0)}) for t in range(4)]
+    assert _rates(est, readings)[1:] == [(1000.0, 0.0)] * 3
+
+
+def test_64_bit_wrap_keeps_the_rate():
+    est = tw.RateEstimator()
+    start = 2 ** 64 - 1500
+    readings = [(t, {"eth0": (0, (start + 1000 * t) % 2 ** 64)}) for t in range(4)]
+    assert _rates(est, readings)[1:] == [(0.0, 1000.0)] * 3
+
+
+def test_reset_holds_the_previous_rate_and_rebaselines():
+    est = tw.RateEstimator()
+    out = _rates(est, [
+        (0, {"eth0": (10_000_000, 5_000_000)}),
+        (1, {"eth0": (10_002_000, 5_001_000)}),
+        (2, {"eth0": (300, 100)}),  # driver reload: counters start over
+        (3, {"eth0": (4300, 600)}),
+    ])
+    assert out[1] == (2000.0, 1000.0)
+    assert out[2] == (2000.0, 1000.0)  # held, not a zero blip or a huge spike
+    assert out[3] == (4000.0, 500.0)  # measured from the new baseline
+
+
+def test_timestamp_going_backwards_restarts():
+    est = tw.RateEstimator(smoothing="ewma", alpha=0.5)
+    out = _rates(est, [
+        (1000.0, {"eth0": (0, 0)}),
+        (1001.0, {"eth0": (1000, 0)}),
+        (5.0, {"eth0": (20, 0)}),  # AP rebooted: uptime clock starts over
+        (6.0, {"eth0": (220, 0)}),
+    ])
+    assert out[1] == (1000.0, 0.0)
+    assert out[2] is None
+    # No smoothing carried over from before the reboot
+    assert out[3] == (200.0, 0.0)
+
+
+def test_member_joining_is_baselined_first():
+    est = tw.RateEstimator()
+    out = _rates(est, [
+        (0, {"eth0": (0, 0)}),
+        (1, {"eth0": (1000, 0)}),
+        (2, {"eth0": (2000, 0), "wlan0": (9_000_000, 0)}),  # joins with a large count
+        (3, {"eth0": (3000, 0), "wlan0": (9_000_500, 0)}),
+    ])
+    assert out[2] == (1000.0, 0.0)
+    assert out[3] == (1500.0, 0.0)
+
+
+def test_member_leaving_drops_out_of_the_sum():
+    est = tw.RateEstimator()
+    out = _rates(est, [
+        (0, {"eth0": (0, 0), "wlan0": (0, 0)}),
+        (1, {"eth0": (1000, 0), "wlan0": (500, 0)}),
+        (2, {"eth0": (2000, 0)}),
+    ])
+    assert out[1:] == [(1500.0, 0.0), (1000.0, 0.0)]
+
+
+def test_ewma_weights_the_newest_rate_by_alpha():
+    est = tw.RateEstimator(smoothing="ewma", alpha=0.25)
+    out = _rates(est, [(0, {"eth0": (0, 0)}), (1, {"eth0": (1000, 0)}), (2, {"eth0": (1000, 0)}),
+                       (3, {"eth0": (3000, 0)})])
+    assert out[1] == (1000.0, 0.0)  # first rate seeds the average
+    assert out[2] == (750.0, 0.0)
+    assert out[3] == (pytest.approx(0.25 * 2000 + 0.75 * 750), 0.0)
+
+
+def test_window_averages_bytes_over_time():
+    est = tw.RateEstimator(smoothing="window", window=2)
+    out = _rates(est, [
+        (0.0, {"eth0": (0, 0)}),
+        (1.0, {"eth0": (1000, 0)}),
+        (3.0, {"eth0": (2000, 0)}),  # uneven interval: 1000 B over 2 s
+        (4.0, {"eth0": (5000, 0)}),
+    ])
+    assert out[1] == (1000.0, 0.0)
+    assert out[2] == (pytest.approx(2000 / 3), 0.0)
+    assert out[3] == (pytest.approx(4000 / 3), 0.0)  # the first interval left the window
@@ -0,0 +1,26 @@
+import json
+import threading
+
+import traffic_widget as tw
+
+
+def _recording(path, samples=5):
+    rec = tw.Recorder(str(path), {"ap": "ap", "iface": "eth0"})
+    for i in range(samples):
+        payload = json.dumps({"c": {"eth0": [i * 1000, i * 500]}, "l": {"eth0": "up"}}).encode()
+        rec.write("agent", payload, ts=float(i))
+    rec.close()
+    return str(path)
+
+
+def test_end_of_replay_finishes_the_poller(tmp_path):
+    poller = tw.replay_pollers([_recording(tmp_path / "ap.twrec.gz")], speed=0)[0]
+    stop = threading.Event()
+    thread = threading.Thread(target=poller.run_stream, args=(stop,), daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert poller.finished.is_set()
+    assert poller.samples == 4
+    assert poller.errors == 0
+    assert poller.state()[3] == "Replay finished"
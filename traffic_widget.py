@@ -1,14 +1,37 @@
 import os
+import re
+import mmap
+import random
+import shutil
+import socket
+import math
+import json
+import gzip
+import hashlib
+import struct
 import time
+import sys
 import threading
-import tkinter as tk
-from tkinter import messagebox
 import fnmatch
+import heapq
+import itertools
+import queue
+import shlex
+import collections
+from array import array
+from pathlib import Path
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+# Tk is only needed for the window; headless mode runs without it
+try:
+    import tkinter as tk
+    from tkinter import messagebox
+except ImportError:
+    tk = None
 
 # Load configuration from a .env file if present (CWD and alongside script/EXE)
 try:
-    from pathlib import Path
-    import sys
     from dotenv import load_dotenv
     # Current working directory .env
     load_dotenv(dotenv_path=Path.cwd() / ".env", override=False)
@@ -19,160 +42,3343 @@ except Exception:
     pass
 
 
-try:
-    import paramiko
-except ImportError:
-    raise SystemExit("Missing dependency: paramiko. Install via 'pip install paramiko'.")
+# Heavy dependencies are imported on first use, off the UI thread, so the window
+# shows at once: paramiko (and its crypto stack) by the first SSH connect,
+# requests by the first ubus login, Pillow and pystray by load_tray(), numpy by
+# the first snapshot (optional; see InterfaceRates)
+paramiko = None
+requests = HTTPAdapter = None
+np = None
+Image = ImageDraw = ImageFont = pystray = None
+HAS_PIL = HAS_TRAY = False
+
+
+def load_ssh():
+    """Import paramiko (once) and return it."""
+    global paramiko
+    if paramiko is None:
+        try:
+            import paramiko
+        except ImportError:
+            raise RuntimeError("Missing dependency: paramiko. Install via 'pip install paramiko'.")
+    return paramiko
+
+
+def load_http():
+    """Import requests (once) for AP_TRANSPORT=ubus and return it."""
+    global requests, HTTPAdapter
+    if requests is None:
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter
+        except ImportError:
+            raise RuntimeError("AP_TRANSPORT=ubus needs requests (pip install requests)")
+    return requests
+
+
+def load_numpy():
+    """Import numpy (once) if it is installed; returns it or None."""
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            np = False
+    return np or None
+
+
+def tray_available():
+    """Whether Pillow and pystray are installed, without importing them."""
+    return all(importlib.util.find_spec(name) is not None for name in ("PIL", "pystray"))
+
+
+def load_tray():
+    """Import Pillow and pystray (once); returns HAS_TRAY."""
+    global Image, ImageDraw, ImageFont, pystray, HAS_PIL, HAS_TRAY
+    if not HAS_PIL:
+        try:
+            from PIL import Image, ImageDraw, ImageFont
+            HAS_PIL = True
+        except Exception:
+            HAS_PIL = False
+    if HAS_PIL and not HAS_TRAY:
+        try:
+            import pystray
+            HAS_TRAY = True
+        except Exception:
+            HAS_TRAY = False
+    return HAS_TRAY
+
+
+"""AP-only configuration (router is ignored).
+
+Set these in .env (dist/.env when running the EXE):
+  AP_HOST, AP_USER, AP_PASSWORD/AP_SSH_KEY, INTERFACE (or INTERFACE=auto)
+"""
+
+# AP connection
+AP_HOST = os.getenv("AP_HOST", os.getenv("ROUTER_HOST", "192.168.1.1"))
+AP_USER = os.getenv("AP_USER", os.getenv("ROUTER_USER", "admin"))
+AP_PASSWORD = os.getenv("AP_PASSWORD", os.getenv("PASSWORD", ""))
+AP_SSH_KEY = (os.getenv("AP_SSH_KEY", os.getenv("SSH_KEY", "")) or None)
+AP_PORT = int(os.getenv("AP_PORT", os.getenv("ROUTER_PORT", "22")))
+# Counter transport: ssh, or ubus (HTTP JSON-RPC to rpcd's /ubus on the AP's web
+# server; one pooled keep-alive session, no SSH handshake). {host} = the AP's host
+AP_TRANSPORT = os.getenv("AP_TRANSPORT", "ssh").strip().lower()
+AP_UBUS_URL = os.getenv("AP_UBUS_URL", "http://{host}/ubus").strip()
+
+# Monitoring
+INTERFACE = os.getenv("INTERFACE", "auto").strip()  # "auto" picks the busiest iface on the AP
+# When monitoring from the AP's LAN perspective, the data flowing "down" to clients
+# is TX on the client-facing interface(s). Set LAN_PERSPECTIVE=1 to swap directions
+# so Down=TX and Up=RX on the chosen interface/pattern.
+LAN_PERSPECTIVE = os.getenv("LAN_PERSPECTIVE", "0") in ("1", "true", "True")
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "1.0"))  # seconds
+ALWAYS_ON_TOP = os.getenv("ALWAYS_ON_TOP", "0") in ("1", "true", "True")
+START_MINIMIZED = os.getenv("START_MINIMIZED", "0") in ("1", "true", "True")
+TEXT_OVERLAY = os.getenv("TEXT_OVERLAY", "1") in ("1", "true", "True")
+# Minimum time between window/overlay/tray redraws; samples arriving faster are
+# coalesced into the next redraw
+UI_REFRESH_MS = int(os.getenv("UI_REFRESH_MS", "250"))
+# Sampling mode: "poll" runs one exec_command per tick, "stream" keeps a single
+# long-lived remote loop that pushes timestamped snapshots every POLL_INTERVAL,
+# "agent" streams through an awk agent on the AP that sends only counter deltas.
+SAMPLER = os.getenv("SAMPLER", "poll").strip().lower()
+# Link state: follow `ip monitor link` on a channel of its own and apply up/down changes
+# as they happen, instead of reading every operstate with each sample (SSH only)
+LINK_WATCH = os.getenv("LINK_WATCH", "1") in ("1", "true", "True")
+# SAMPLER=burst: sub-sample period on the AP (ms) and how far back the p95 looks (s)
+BURST_INTERVAL_MS = min(max(float(os.getenv("BURST_INTERVAL_MS", "100")), 20.0), POLL_INTERVAL * 1000)
+BURST_P95_WINDOW = float(os.getenv("BURST_P95_WINDOW", "10"))
+# Samples kept in memory per interface (rate history for the sparklines)
+HISTORY_SIZE = int(os.getenv("HISTORY_SIZE", "300"))
+# Rate smoothing: "none", "ewma" (RATE_EWMA_ALPHA weight on the newest sample) or
+# "window" (average over the last RATE_WINDOW intervals). RATE_MAX_BPS bounds what a
+# counter wrap may imply; larger drops are treated as counter resets.
+RATE_SMOOTHING = os.getenv("RATE_SMOOTHING", "none").strip().lower()
+RATE_EWMA_ALPHA = float(os.getenv("RATE_EWMA_ALPHA", "0.3"))
+RATE_WINDOW = int(os.getenv("RATE_WINDOW", "5"))
+RATE_MAX_BPS = float(os.getenv("RATE_MAX_BPS", "1.25e9"))  # 10 Gbit/s
+# Interface auto-switching: when a non-aggregate INTERFACE is monitored, switch to
+# another interface that has been AUTO_SWITCH_RATIO times busier (and above
+# AUTO_SWITCH_MIN_BPS bytes/s) for AUTO_SWITCH_HOLD seconds
+AUTO_SWITCH = os.getenv("AUTO_SWITCH", "1") in ("1", "true", "True")
+AUTO_SWITCH_RATIO = float(os.getenv("AUTO_SWITCH_RATIO", "4"))
+AUTO_SWITCH_MIN_BPS = float(os.getenv("AUTO_SWITCH_MIN_BPS", str(200 * 1024)))
+AUTO_SWITCH_HOLD = float(os.getenv("AUTO_SWITCH_HOLD", "5"))
+# Top talkers (SSH only): stations to list (0 = off), seconds between per-station counter reads,
+# and the VAPs to read (INTERFACE syntax; empty = the wireless interfaces INTERFACE
+# matches, or every wireless interface when it matches none)
+TOP_TALKERS = int(os.getenv("TOP_TALKERS", "0"))
+TOP_TALKERS_INTERVAL = float(os.getenv("TOP_TALKERS_INTERVAL", "5"))
+TOP_TALKERS_INTERFACES = os.getenv("TOP_TALKERS_INTERFACES", "").strip()
+# All-interfaces table: rows to show in the window (0 = off), sorted by clicking a
+# column header. Needs numpy, which also vectorizes auto-detect when installed
+IFACE_TABLE = int(os.getenv("IFACE_TABLE", "0"))
+# SSH connection management: keepalive interval, connect and per-command timeouts,
+# and the exponential reconnect backoff (seconds)
+SSH_KEEPALIVE = int(os.getenv("SSH_KEEPALIVE", "15"))
+SSH_CONNECT_TIMEOUT = float(os.getenv("SSH_CONNECT_TIMEOUT", "15"))
+SSH_COMMAND_TIMEOUT = float(os.getenv("SSH_COMMAND_TIMEOUT", "0")) or max(10.0, POLL_INTERVAL * 5)
+SSH_BACKOFF_BASE = float(os.getenv("SSH_BACKOFF_BASE", "1"))
+SSH_BACKOFF_MAX = float(os.getenv("SSH_BACKOFF_MAX", "60"))
+# Remote actions: JSON file of name -> shell command ({iface} = the AP's INTERFACE);
+# empty looks for commands.json in the CWD and next to the script/EXE
+ACTIONS_FILE = os.getenv("ACTIONS_FILE", "").strip()
+ACTION_TIMEOUT = float(os.getenv("ACTION_TIMEOUT", "60"))
+# Alert rules: JSON list of sliding-window threshold rules checked on every sample;
+# empty looks for alerts.json in the CWD and next to the script/EXE
+ALERTS_FILE = os.getenv("ALERTS_FILE", "").strip()
+# Headless: poll without a window (also via --headless); needs no Tk/tray/PIL
+HEADLESS = os.getenv("HEADLESS", "0") in ("1", "true", "True") or "--headless" in sys.argv[1:]
+# Prometheus/OpenMetrics exporter: port to serve /metrics on (empty disables)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0") or 0)
+METRICS_BIND = os.getenv("METRICS_BIND", "0.0.0.0").strip()
+# Persistent history: directory for the on-disk log (empty disables it) and how many
+# days to keep raw samples, 1 min rollups and 1 h rollups
+HISTORY_DIR = os.getenv("HISTORY_DIR", "").strip()
+HISTORY_RETENTION_DAYS = tuple(
+    float(d) for d in os.getenv("HISTORY_RETENTION_DAYS", "2,30,730").split(",")
+)
+# Per-stage timing histograms (connect, lock wait, exec, read, parse, rate, UI), shown
+# in a debug window (F12 / tray) and optionally appended as JSON lines to
+# INSTRUMENT_DUMP every INSTRUMENT_DUMP_INTERVAL seconds. Off: nothing is recorded.
+INSTRUMENT = os.getenv("INSTRUMENT", "0") in ("1", "true", "True")
+INSTRUMENT_DUMP = os.getenv("INSTRUMENT_DUMP", "").strip()
+INSTRUMENT_DUMP_INTERVAL = float(os.getenv("INSTRUMENT_DUMP_INTERVAL", "60"))
+# Record raw probe outputs per AP into this folder (empty = off), for replay
+RECORD_DIR = os.getenv("RECORD_DIR", "").strip()
+# Replay recordings (comma-separated files) instead of connecting to APs;
+# REPLAY_SPEED 1 = recorded pace, 10 = ten times faster, 0 = as fast as possible
+REPLAY = os.getenv("REPLAY", "").strip()
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", "1"))
+
+
+class Histogram:
+    """Log-bucketed duration histogram: O(1) add, ~6% resolution from 1 us to 4 min.
+
+    Adds take no lock; a racing increment can be lost, which is fine for timings.
+    """
+
+    SUB = 8  # buckets per power of two
+    MIN_EXP = -19  # frexp exponent of ~1 us
+    MAX_EXP = 8  # ~4 min
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * (self.MAX_EXP - self.MIN_EXP + 1) * self.SUB))
+        self.total = 0.0
+
+    def add(self, seconds):
+        m, e = math.frexp(seconds)
+        # frexp(0) is (0, 0): zero (a coarse clock's uncontended wait) is below ~1 us
+        if seconds <= 0 or e < self.MIN_EXP:
+            i = 0
+        elif e > self.MAX_EXP:
+            i = len(self.counts) - 1
+        else:
+            i = (e - self.MIN_EXP) * self.SUB + int((m - 0.5) * 2 * self.SUB)
+        self.counts[i] += 1
+        self.total += seconds
+
+    def _upper(self, i):
+        return math.ldexp(0.5 + (i % self.SUB + 1) / (2.0 * self.SUB), i // self.SUB + self.MIN_EXP)
+
+    def snapshot(self):
+        return array("Q", self.counts), self.total
+
+    def stats(self, since=None):
+        """Return {count, mean, p50, p95, p99, max} in seconds, optionally only for the
+        additions after the snapshot() `since`."""
+        counts, total = self.snapshot()
+        if since is not None:
+            counts = [c - b for c, b in zip(counts, since[0])]
+            total -= since[1]
+        n = sum(counts)
+        out = {"count": n}
+        if not n:
+            return out
+        out["mean"] = total / n
+        targets = [("p50", 0.5), ("p95", 0.95), ("p99", 0.99)]
+        seen = top = 0
+        for i, c in enumerate(counts):
+            if not c:
+                continue
+            seen += c
+            top = i
+            while targets and seen >= targets[0][1] * n:
+                out[targets.pop(0)[0]] = self._upper(i)
+        out["max"] = self._upper(top)
+        return out
+
+
+class StageTimers:
+    """Named Histograms for the sampling and UI stages, plus the periodic JSON-lines dump."""
+
+    def __init__(self):
+        self.stages = {}
+        self._stop = threading.Event()
+
+    def add(self, stage, seconds):
+        hist = self.stages.get(stage)
+        if hist is None:
+            hist = self.stages.setdefault(stage, Histogram())
+        hist.add(seconds)
+
+    def stats(self, since=None):
+        since = since or {}
+        return {name: h.stats(since.get(name)) for name, h in sorted(self.stages.items())}
+
+    def table(self):
+        """Return the stats as a fixed-width text table (milliseconds)."""
+        lines = [f"{'stage':<11}{'count':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}"]
+        for name, st in self.stats().items():
+            if st["count"]:
+                lines.append(
+                    f"{name:<11}{st['count']:>8}"
+                    + "".join(f"{st[k] * 1000:>8.1f}" for k in ("p50", "p95", "p99", "max"))
+                )
+        return "\n".join(lines)
+
+    def start_dump(self, path, interval):
+        def run():
+            since = {}
+            while not self._stop.wait(interval):
+                stages = {
+                    name: {k: round(v, 7) for k, v in st.items()} for name, st in self.stats(since).items()
+                }
+                line = {"ts": round(time.time(), 3), "interval": interval, "stages": stages}
+                since = {name: h.snapshot() for name, h in list(self.stages.items())}
+                try:
+                    with open(path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(line) + "\n")
+                except Exception:
+                    pass
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+
+STAGES = StageTimers() if INSTRUMENT else None
+
+
+# One /proc/net/dev line: "\n  name: rx_bytes <7 more RX fields> tx_bytes ...".
+# Matching the raw bytes with one compiled regex (literal spaces, no backtracking into
+# the name) avoids decoding, stripping and splitting every line in Python.
+_NET_DEV_RE = re.compile(rb"\n *([^ \n:|]+): *(\d+) +\d+ +\d+ +\d+ +\d+ +\d+ +\d+ +\d+ +(\d+)")
+
+
+def _parse_net_dev_line(data, name):
+    # Locate "name:" at the start of a line and split only that line
+    key = name.encode() + b":"
+    i = data.find(key)
+    while i > 0 and data[i - 1] not in b" \n":
+        i = data.find(key, i + 1)
+    if i < 0:
+        return None
+    end = data.find(b"\n", i)
+    parts = data[i + len(key):end if end >= 0 else None].split()
+    try:
+        return int(parts[0]), int(parts[8])
+    except (IndexError, ValueError):
+        return None
+
+
+def parse_proc_net_dev(data, names=None):
+    """Return dict{name:(rx_bytes, tx_bytes)} parsed from /proc/net/dev output (bytes or str).
+
+    With names, only those interfaces are looked up (each with a direct search instead
+    of a full parse); missing ones are left out.
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    if names is not None:
+        result = {}
+        for name in names:
+            counters = _parse_net_dev_line(data, name)
+            if counters:
+                result[name] = counters
+        return result
+    return {
+        name.decode(errors="ignore"): (int(rx), int(tx))
+        for name, rx, tx in _NET_DEV_RE.findall(b"\n" + data)
+    }
+
+
+def parse_operstates(data):
+    """Return dict{name:'up'|'down'|'unknown'} from 'grep -H . /sys/class/net/*/operstate' output."""
+    result = {}
+    for line in data.splitlines():
+        path, _, state = line.strip().partition(":")
+        parts = path.split("/")
+        if len(parts) < 5 or parts[-1] != "operstate":
+            continue
+        state = state.strip().lower()
+        result[parts[-2]] = state if state in ("up", "down") else "unknown"
+    return result
+
+
+_LINK_EVENT_RE = re.compile(rb"(Deleted )?\d+: ([^:@\s]+)(?:@\S*)?: <([^>]*)>(?:.*? state ([A-Z]+))?")
+
+
+def parse_link_event(line):
+    """Return (name, state) from one `ip -o monitor link` line, or None for other lines.
+
+    state is 'up', 'down' or 'unknown' like parse_operstates, or None when the
+    interface was deleted.
+    """
+    m = _LINK_EVENT_RE.match(line.strip())
+    if not m:
+        return None
+    deleted, name, flags, state = m.groups()
+    name = name.decode(errors="ignore")
+    if deleted:
+        return name, None
+    if state in (b"UP", b"DOWN"):
+        return name, state.decode().lower()
+    if state == b"LOWERLAYERDOWN" or b"UP" not in flags.split(b","):
+        return name, "down"
+    return name, "unknown"
+
+
+def _with_operstates(frame, links):
+    # Put watched link states (LINK_WATCH) back into a frame's operstate section, so
+    # recordings replay with the links they were sampled with
+    if links is None:
+        return frame
+    head, sep, tail = frame.partition(b"\n--")
+    return head + sep + "".join(
+        f"\n/sys/class/net/{name}/operstate:{state}" for name, state in links.items()
+    ).encode() + tail
+
+
+# One probe frame carries everything a tick needs from the AP:
+#   @@ <uptime seconds>
+#   <contents of /proc/net/dev>
+#   --
+#   <grep -H . /sys/class/net/*/operstate>
+#   ##
+# Using the AP's uptime as the timestamp keeps SSH latency jitter out of the rates.
+_NET_DEV = "cat /proc/net/dev 2>/dev/null; echo '--'; "
+_COUNTERS_BODY = "read up _ < /proc/uptime; echo \"@@ $up\"; " + _NET_DEV
+_OPERSTATES = "grep -H . /sys/class/net/*/operstate 2>/dev/null; "
+_PROBE_BODY = _COUNTERS_BODY + _OPERSTATES
+PROBE_SCRIPT = _PROBE_BODY + "echo '##'; "
+# With LINK_WATCH the link states come from WATCH_SCRIPT, so frames skip the operstates
+COUNTERS_SCRIPT = _COUNTERS_BODY + "echo '##'; "
+STREAM_FRAME_END = b"\n##\n"
+# SAMPLER=stream repeats the probe ({probe}) in a remote loop on a single channel.
+STREAM_SCRIPT = "while :; do {probe}sleep {interval} 2>/dev/null || sleep 1; done"
+# LINK_WATCH: a long-lived channel that pushes link changes instead of reading them
+# every tick. It starts with the current states and a terminator, like a probe frame:
+#   /sys/class/net/<iface>/operstate:<state>
+#   ##
+# then follows `ip -o monitor link`, one line per change:
+#   <index>: <iface>: <FLAGS> mtu ... state UP|DOWN|UNKNOWN ...
+#   Deleted <index>: <iface>: ...
+# An ip without monitor support (e.g. BusyBox) fails at once; the shell then re-reads
+# the operstates every second and sends a new block only when they changed.
+WATCH_SCRIPT = (
+    "p=$(" + _OPERSTATES.rstrip("; ") + "); echo \"$p\"; echo '##'; "
+    "ip -o monitor link 2>/dev/null || while sleep 1; do "
+    "s=$(" + _OPERSTATES.rstrip("; ") + "); "
+    "[ \"$s\" = \"$p\" ] || { echo \"$s\"; echo '##'; p=$s; }; "
+    "done"
+)
+# SAMPLER=burst adds {count} sub-samples to each frame, taken every {usec} microseconds
+# with shell builtins only (no fork per sub-sample besides sleep) and filtered to the
+# monitored interfaces by a case pattern, so a frame still arrives once per interval:
+#   %%
+#   @ <seconds>
+#   <matching /proc/net/dev lines>
+#   ... (repeated)
+#   ##
+# /proc/uptime only ticks every 10 ms, which is 10% of a 100 ms sub-interval, so where
+# `date` prints nanoseconds (GNU, BusyBox with FEATURE_DATE_NANO) the frame and its
+# sub-samples are stamped with it instead, at the cost of one fork per stamp. Both
+# stamps of a frame always come from the same clock; that one is wall time, so an NTP
+# step shows as a single odd sub-sample rate (backwards steps are dropped as usual).
+BURST_SCRIPT = (
+    "now() {{ read up _ < /proc/uptime; }}; "
+    "case $(date +%s.%N 2>/dev/null) in *.[0-9][0-9][0-9][0-9]*) "
+    "now() {{ up=$(date +%s.%N); }};; esac; "
+    "while :; do now; echo \"@@ $up\"; {body}"
+    "echo '%%'; i=0; "
+    "while [ $i -lt {count} ]; do "
+    "usleep {usec} 2>/dev/null || sleep {sec} 2>/dev/null || sleep 1; "
+    "now; echo \"@ $up\"; "
+    "while read -r l; do case \"$l\" in {patterns}) echo \"$l\";; esac; done < /proc/net/dev; "
+    "i=$((i+1)); done; "
+    "echo '##'; usleep {usec} 2>/dev/null || sleep {sec} 2>/dev/null || sleep 1; "
+    "done"
+)
+_BURST_PATTERN_RE = re.compile(r"[A-Za-z0-9_.@*?-]+")
+
+
+# SAMPLER=agent pipes the stream loop through an awk program installed in the AP's
+# tmpfs once per connection. It keeps the previous counters and prints per frame only
+# what changed, for the interfaces matching the EREs inc (empty = all) and not exc:
+#   T<uptime> or t<ms since the previous frame>
+#   +<index> <name> <rx> <tx>   first sight of an interface
+#   <index> <drx> [<dtx>]       counters moved (dtx omitted when 0)
+#   =<index> <rx> <tx>          a counter went backwards (wrap/reset): absolute values
+#   ~<index> <operstate>        link state changed
+#   -<index>                    interface gone
+#   .
+# An idle interface costs nothing; awk's doubles keep counters exact below 2**53.
+AGENT_AWK = r"""$1 == "@@" {
+    ms = int($2 * 1000 + 0.5)
+    if (last == "") print "T" $2; else print "t" (ms - last)
+    last = ms; sect = 1; split("", seen); next
+}
+$0 == "--" { sect = 2; next }
+$0 == "##" {
+    k = 0
+    for (name in idx) if (!(name in seen)) gone[++k] = name
+    for (j = 1; j <= k; j++) {
+        name = gone[j]; print "-" idx[name]
+        delete idx[name]; delete rx[name]; delete tx[name]; delete link[name]
+    }
+    print "."; fflush(); sect = 0; next
+}
+sect == 1 {
+    i = index($0, ":")
+    if (!i || index($0, "|")) next
+    name = substr($0, 1, i - 1); gsub(/[ \t]/, "", name)
+    if (name == "lo" || (inc != "" && name !~ inc) || (exc != "" && name ~ exc)) next
+    split(substr($0, i + 1), f, " ")
+    seen[name] = 1
+    if (!(name in idx)) {
+        idx[name] = n++
+        printf "+%d %s %.0f %.0f\n", idx[name], name, f[1], f[9]
+    } else {
+        drx = f[1] - rx[name]; dtx = f[9] - tx[name]
+        if (drx < 0 || dtx < 0) printf "=%d %.0f %.0f\n", idx[name], f[1], f[9]
+        else if (dtx) printf "%d %.0f %.0f\n", idx[name], drx, dtx
+        else if (drx) printf "%d %.0f\n", idx[name], drx
+    }
+    rx[name] = f[1]; tx[name] = f[9]; next
+}
+sect == 2 {
+    i = index($0, "/operstate:")
+    if (!i) next
+    name = substr($0, 1, i - 1); sub(/.*\//, "", name)
+    if (!(name in idx)) next
+    st = substr($0, i + 11)
+    if (link[name] != st) { link[name] = st; print "~" idx[name] " " st }
+}
+"""
+AGENT_PATH = "/tmp/traffic_widget_agent_{}.awk".format(hashlib.sha1(AGENT_AWK.encode()).hexdigest()[:8])
+AGENT_PUSH = "cat > {path}.tmp && mv {path}.tmp {path}"
+AGENT_SCRIPT = (
+    "[ -f {path} ] || exit 3; while :; do {probe}sleep {interval} 2>/dev/null || sleep 1; "
+    "done | awk -v inc='{inc}' -v exc='{exc}' -f {path}"
+)
+AGENT_FRAME_END = b"\n.\n"
+
+
+def _glob_ere(globs):
+    # Shell globs (restricted to _BURST_PATTERN_RE characters) as one anchored ERE
+    if not globs or not all(_BURST_PATTERN_RE.fullmatch(g) for g in globs):
+        return ""
+    ere = {".": "[.]", "*": ".*", "?": "."}
+    return "^(" + "|".join(re.sub(r"[.*?]", lambda m: ere[m.group()], g) for g in globs) + ")$"
+
+
+def agent_filters(spec):
+    """Return dict(inc=..., exc=...) EREs for the agent from an INTERFACE spec (None = all)."""
+    if not spec:
+        return dict(inc="", exc="")
+    return dict(inc=_glob_ere(_spec_globs(spec)), exc=_glob_ere(InterfaceMatcher(spec).exclude))
+
+
+class AgentDecoder:
+    """Rebuilds full (remote_ts, counters, links) snapshots from the agent's frames.
+
+    The state follows one agent process, so every new stream needs a new decoder.
+    """
+
+    def __init__(self):
+        self.ms = None
+        self.names = {}  # index -> name
+        self.counters = {}  # name -> (rx, tx)
+        self.links = {}
+
+    def decode(self, frame):
+        names, counters = self.names, self.counters
+        for line in frame.split(b"\n"):
+            tag = line[:1]
+            if tag == b"t":
+                self.ms += int(line[1:])
+            elif tag == b"T":
+                self.ms = round(float(line[1:]) * 1000)
+            elif tag == b"+":
+                i, name, rx, tx = line[1:].split()
+                name = names[int(i)] = name.decode(errors="ignore")
+                counters[name] = (int(rx), int(tx))
+            elif tag == b"=":
+                i, rx, tx = line[1:].split()
+                counters[names[int(i)]] = (int(rx), int(tx))
+            elif tag == b"~":
+                i, state = line[1:].split()
+                state = state.decode(errors="ignore").lower()
+                self.links[names[int(i)]] = state if state in ("up", "down") else "unknown"
+            elif tag == b"-":
+                name = names.pop(int(line[1:]))
+                counters.pop(name, None)
+                self.links.pop(name, None)
+            elif line:
+                parts = line.split()
+                name = names[int(parts[0])]
+                rx, tx = counters[name]
+                counters[name] = (rx + int(parts[1]), tx + (int(parts[2]) if len(parts) > 2 else 0))
+        if self.ms is None:
+            raise ValueError("Malformed agent frame")
+        return self.ms / 1000.0, dict(counters), dict(self.links)
+
+
+def parse_stream_frame(frame):
+    """Return (remote_ts, counters, links) for one probe frame (bytes, without the '##' line)."""
+    head, _, body = (frame + b"\n").partition(b"\n")
+    head = head.strip()
+    if not head.startswith(b"@@"):
+        raise ValueError("Malformed stream frame")
+    ts = float(head[2:].strip())
+    counters_data, _, links_data = (b"\n" + body).partition(b"\n--\n")
+    counters = parse_proc_net_dev(counters_data)
+    counters.pop("lo", None)
+    return ts, counters, parse_operstates(links_data.decode(errors="ignore"))
+
+
+def parse_burst_frame(frame):
+    """Return (remote_ts, counters, links, [(sub_ts, counters), ...]) for one burst frame."""
+    probe, _, subs_data = frame.partition(b"\n%%\n")
+    ts, counters, links = parse_stream_frame(probe)
+    subs = []
+    for chunk in (b"\n" + subs_data).split(b"\n@ ")[1:]:
+        head, _, body = chunk.partition(b"\n")
+        subs.append((float(head), parse_proc_net_dev(b"\n" + body)))
+    return ts, counters, links, subs
+
+
+class InterfaceMatcher:
+    """An INTERFACE spec compiled once: comma-separated names/globs, `!glob` excludes.
+
+    Globs are folded into one regex each for includes and excludes, and the matching
+    names are cached per set of interface names, so a snapshot is only rescanned when
+    interfaces appear or disappear. A spec of only exclusions matches everything else.
+    """
+
+    def __init__(self, spec):
+        self.spec = (spec or "").strip()
+        parts = [p.strip() for p in self.spec.split(",") if p.strip()]
+        self.include = [p for p in parts if not p.startswith("!")]
+        self.exclude = [p[1:].strip() for p in parts if p.startswith("!") and p[1:].strip()]
+        # A single plain name is looked up directly; anything else sums its matches
+        self.aggregate = len(parts) > 1 or bool(self.exclude) or any(c in self.spec for c in "*?[")
+        self._include_re = self._compile(self.include or (["*"] if self.exclude else []))
+        self._exclude_re = self._compile(self.exclude)
+        self._cache = {}  # frozenset of interface names -> matching names
+
+    @staticmethod
+    def _compile(globs):
+        if not globs:
+            return None
+        return re.compile("|".join(f"(?:{fnmatch.translate(g)})" for g in globs))
+
+    def excludes(self, name):
+        return bool(self._exclude_re and self._exclude_re.match(name))
+
+    def match(self, name):
+        return bool(self._include_re and self._include_re.match(name)) and not self.excludes(name)
+
+    def select(self, allc):
+        """Return {name: counters} of the interfaces in allc the spec covers."""
+        if not self.aggregate:
+            counters = allc.get(self.spec)
+            return {self.spec: counters} if counters else {}
+        key = frozenset(allc)
+        names = self._cache.get(key)
+        if names is None:
+            if len(self._cache) >= 4:  # full snapshots and burst sub-samples differ
+                self._cache.clear()
+            names = self._cache[key] = tuple(n for n in key if self.match(n))
+        return {n: allc[n] for n in names}
+
+
+def _spec_globs(spec):
+    # Include parts of an INTERFACE spec usable as shell case patterns, or None for
+    # "everything"; exclusions are applied locally
+    matcher = InterfaceMatcher(spec)
+    parts = matcher.include
+    if not parts or matcher.spec.lower() == "auto" or not all(_BURST_PATTERN_RE.fullmatch(p) for p in parts):
+        return None
+    return parts
+
+
+def burst_patterns(spec):
+    """Shell case patterns matching the /proc/net/dev lines of an INTERFACE spec."""
+    parts = _spec_globs(spec)
+    return "|".join(f"{p}:*" for p in parts) if parts else "*"
+
+
+# Per-station byte counters of the wireless interfaces matching {patterns} (all of them
+# if none match), trimmed on the AP to three lines per station, plus the DHCP leases
+# for names:
+#   @@ <uptime seconds>
+#   Station <mac> (on <vap>) / rx bytes: <n> / tx bytes: <n>   (repeated)
+#   --
+#   <contents of /tmp/dhcp.leases>
+#   ##
+STATIONS_SCRIPT = (
+    "read up _ < /proc/uptime; echo \"@@ $up\"; m=; "
+    "for d in /sys/class/net/*/phy80211; do [ -e \"$d\" ] || continue; n=${{d%/phy80211}}; n=${{n##*/}}; "
+    "case \"$n\" in {patterns}) m=\"$m $n\";; esac; done; "
+    "[ -n \"$m\" ] || for d in /sys/class/net/*/phy80211; do [ -e \"$d\" ] || continue; "
+    "n=${{d%/phy80211}}; m=\"$m ${{n##*/}}\"; done; "
+    "for n in $m; do iw dev $n station dump 2>/dev/null | grep -E '^Station|[rt]x bytes:'; done; "
+    "echo '--'; cat /tmp/dhcp.leases 2>/dev/null; echo '##'"
+)
+_STATION_RE = re.compile(rb"Station ([0-9a-fA-F:]{17}) \(on ([^)\s]+)\)\s+rx bytes:\s*(\d+)\s+tx bytes:\s*(\d+)")
+
+
+def parse_stations(data):
+    """Return (remote_ts, {mac: (vap, rx_bytes, tx_bytes)}, {mac: name}) from STATIONS_SCRIPT output."""
+    start = data.find(b"@@")
+    if start < 0:
+        raise ValueError("Malformed station output")
+    head, _, body = data[start:].partition(b"\n")
+    ts = float(head[2:].strip())
+    dump, _, leases = body.partition(b"\n--\n")
+    stations = {
+        m.group(1).decode().lower(): (m.group(2).decode(), int(m.group(3)), int(m.group(4)))
+        for m in _STATION_RE.finditer(dump)
+    }
+    names = {}
+    for line in leases.decode(errors="ignore").splitlines():
+        # <expiry> <mac> <ip> <hostname or *> <client id>
+        parts = line.split()
+        if len(parts) >= 4 and parts[1].lower() in stations:
+            names[parts[1].lower()] = parts[3] if parts[3] != "*" else parts[2]
+    return ts, stations, names
+
+
+def parse_ubus_devices(devices):
+    """Return (counters, links) from the result of ubus `network.device status`."""
+    counters = {}
+    links = {}
+    for name, dev in devices.items():
+        if name == "lo" or not isinstance(dev, dict):
+            continue
+        stats = dev.get("statistics") or {}
+        if "rx_bytes" in stats and "tx_bytes" in stats:
+            counters[name] = (int(stats["rx_bytes"]), int(stats["tx_bytes"]))
+        if "carrier" in dev:
+            links[name] = "up" if dev.get("up", True) and dev["carrier"] else "down"
+    return counters, links
+
+
+def _timed_parse(parse, data):
+    if not STAGES:
+        return parse(data)
+    t0 = time.perf_counter()
+    result = parse(data)
+    STAGES.add("parse", time.perf_counter() - t0)
+    return result
+
+
+class APNotConnected(ConnectionError):
+    """Raised by APMonitor while its connection is being (re)established in the background."""
+
+
+def _ssh_alive(client):
+    transport = client.get_transport()
+    return transport is not None and transport.is_active()
+
+
+class ConnectionManager:
+    """Keeps one SSH connection up for an APMonitor without blocking the sampler.
+
+    Connecting happens on a background thread with exponential backoff plus jitter
+    (SSH_BACKOFF_BASE doubling up to SSH_BACKOFF_MAX). get() returns the live client
+    or raises APNotConnected at once, so a dead or flapping AP never stalls sampling.
+    Transports send SSH keepalives every SSH_KEEPALIVE seconds and are checked for
+    liveness on every use. state is "idle", "connecting", "connected" or "backoff";
+    on_change() is called whenever it changes, and the `connected` event is set
+    while a client is up. generation counts every change of what describe() and the
+    metrics show (state, failures, rtt).
+    """
+
+    def __init__(self, connect, on_change=None, alive=None):
+        self._connect = connect
+        self.on_change = on_change
+        self._alive = alive or _ssh_alive
+        self.client = None
+        self.state = "idle"
+        self.attempts = 0  # failed connects and short-lived connections, drives the backoff
+        self.failures = 0  # consecutive failed connects, reset once connected
+        self.last_error = ""
+        self.retry_at = None
+        self.handshake_ms = None
+        self.rtt_ms = None
+        self._connected_at = 0.0
+        self.generation = 0
+        self.connected = threading.Event()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _set_state(self, state, retry_at=None):
+        self.state = state
+        self.retry_at = retry_at
+        self.generation += 1
+        if self.on_change:
+            try:
+                self.on_change()
+            except Exception:
+                pass
+
+    def get(self):
+        """Return the connected client, or request a reconnect and raise APNotConnected."""
+        client = self.client
+        if client is not None:
+            if self._alive(client):
+                return client
+            self.drop("connection lost")
+        self.request()
+        raise APNotConnected(self.describe())
+
+    def request(self):
+        with self._lock:
+            if self.client is None and self.state == "idle":
+                self._set_state("connecting")
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def adopt(self, client):
+        try:
+            client.get_transport().set_keepalive(SSH_KEEPALIVE)
+        except Exception:
+            pass
+        self.client = client
+        self._connected_at = time.monotonic()
+        self.last_error = ""
+        self.failures = 0
+        self.connected.set()
+        self._set_state("connected")
+
+    def drop(self, reason=""):
+        """Forget the current connection; the next get() reconnects in the background."""
+        client, self.client = self.client, None
+        if client is not None:
+            self.connected.clear()
+            try:
+                client.close()
+            except Exception:
+                pass
+            # A connection that survived a while resets the backoff; one that dropped
+            # soon after connecting counts as a failure, so a flapping AP backs off too
+            if time.monotonic() - self._connected_at > 30:
+                self.attempts = 0
+            else:
+                self.attempts += 1
+            if reason:
+                self.last_error = reason
+            self.rtt_ms = None
+            self._set_state("idle")
+
+    def note_rtt(self, ms):
+        self.rtt_ms = ms if self.rtt_ms is None else 0.3 * ms + 0.7 * self.rtt_ms
+        self.generation += 1
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self.drop()
+
+    def describe(self):
+        if self.state == "connected":
+            ms = self.rtt_ms if self.rtt_ms is not None else self.handshake_ms
+            return f"connected, {ms:.0f} ms" if ms is not None else "connected"
+        if self.state == "backoff" and self.retry_at is not None:
+            wait = max(0, self.retry_at - time.monotonic())
+            return f"{self.last_error or 'offline'}; retry {max(self.failures, 1)} in {wait:.0f}s"
+        if self.state == "connecting":
+            return "connecting..." if not self.failures else f"reconnecting (attempt {self.failures + 1})..."
+        return self.last_error or "connecting..."
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            while not self._stop.is_set() and self.client is None:
+                if self.attempts:
+                    delay = min(SSH_BACKOFF_MAX, SSH_BACKOFF_BASE * 2 ** (self.attempts - 1))
+                    delay *= random.uniform(0.5, 1.0)  # jitter spreads a fleet's retries
+                    self._set_state("backoff", retry_at=time.monotonic() + delay)
+                    if self._stop.wait(delay):
+                        return
+                self._set_state("connecting")
+                t0 = time.perf_counter()
+                try:
+                    client = self._connect()
+                except Exception as e:
+                    self.attempts += 1
+                    self.failures += 1
+                    self.last_error = str(e) or type(e).__name__
+                    continue
+                if self._stop.is_set():
+                    client.close()
+                    return
+                self.handshake_ms = (time.perf_counter() - t0) * 1000
+                self.adopt(client)
+
+
+class NullConnection:
+    """The ConnectionManager interface for sources that need no connection (replays).
+
+    Always connected: request() only reports that to on_change, and there is nothing
+    to drop, retry or time.
+    """
+
+    def __init__(self, description="connected"):
+        self.on_change = None
+        self.client = None
+        self.state = "connected"
+        self.attempts = self.failures = 0
+        self.last_error = ""
+        self.retry_at = None
+        self.handshake_ms = self.rtt_ms = None
+        self.generation = 0
+        self.connected = threading.Event()
+        self.connected.set()
+        self._description = description
+
+    def request(self):
+        if self.on_change:
+            try:
+                self.on_change()
+            except Exception:
+                pass
+
+    def stop(self):
+        pass
+
+    def describe(self):
+        return self._description
+
+
+class LinkWatcher:
+    """Keeps one AP's link states current from a WATCH_SCRIPT channel (LINK_WATCH).
+
+    `states` ({name: 'up'|'down'|'unknown'}) is replaced on every change, never
+    mutated, so samplers can hand it out as is. `live` is True once the channel has
+    sent the initial states and until it closes; a closed channel is reopened after a
+    pause. on_change(states) runs on the watcher thread after each change.
+    """
+
+    def __init__(self, monitor, on_change=None):
+        self.monitor = monitor
+        self.on_change = on_change
+        self.states = {}
+        self.live = False
+        self.events = 0  # changes pushed so far
+        self._chan = None
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.live = False
+        chan = self._chan
+        if chan is not None:
+            try:
+                chan.close()
+            except Exception:
+                pass
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._watch()
+            except Exception:
+                pass
+            self.live = False
+            self._stop.wait(max(POLL_INTERVAL, 2.0))
+
+    def _watch(self):
+        ssh = self.monitor._ensure()
+        with self.monitor._lock:
+            chan = self._chan = ssh.get_transport().open_session()
+        try:
+            # No timeout: changes may be hours apart, keepalives catch a dead link
+            chan.exec_command(WATCH_SCRIPT)
+            buf, block = b"", []
+            while not self._stop.is_set():
+                chunk = chan.recv(65536)
+                if not chunk:
+                    return
+                *lines, buf = (buf + chunk).split(b"\n")
+                for line in lines:
+                    if line.startswith(b"/sys/"):
+                        block.append(line)
+                    elif line == b"##":
+                        self._apply(parse_operstates(b"\n".join(block).decode(errors="ignore")), replace=True)
+                        block = []
+                        self.live = True
+                    else:
+                        event = parse_link_event(line)
+                        if event is not None and self.live:
+                            self._apply(dict([event]))
+        finally:
+            self._chan = None
+            try:
+                chan.close()
+            except Exception:
+                pass
+
+    def _apply(self, changes, replace=False):
+        states = {} if replace else dict(self.states)
+        states.update(changes)
+        for name in [n for n, state in states.items() if state is None]:
+            del states[name]
+        if states == self.states:
+            return
+        self.states = states
+        self.events += 1
+        if self.on_change:
+            try:
+                self.on_change(states)
+            except Exception:
+                pass
+
+
+class APMonitor:
+    has_stations = True  # read_stations works (top talkers)
+
+    def __init__(self, host, user, password=None, key_filename=None, port=AP_PORT):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.key_filename = key_filename
+        self.port = port
+        self._lock = threading.Lock()
+        self.conn = ConnectionManager(self._open_client)
+        self.recorder = None  # Recorder for RECORD_DIR
+        self._agent_client = None  # the connection the agent was last installed over
+        self.links = None  # LinkWatcher (LINK_WATCH)
+
+    def _open_client(self):
+        load_ssh()
+        t0 = time.perf_counter()
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(
+            self.host,
+            port=self.port,
+            username=self.user,
+            password=self.password,
+            key_filename=self.key_filename,
+            timeout=SSH_CONNECT_TIMEOUT,
+            banner_timeout=SSH_CONNECT_TIMEOUT,
+            auth_timeout=SSH_CONNECT_TIMEOUT,
+            look_for_keys=False,
+            allow_agent=False,
+        )
+        try:
+            # Small request/response exchanges otherwise stall on Nagle + delayed ACK
+            ssh.get_transport().sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except Exception:
+            pass
+        if STAGES:
+            STAGES.add("connect", time.perf_counter() - t0)
+        return ssh
+
+    def connect(self):
+        """Connect in the calling thread (blocking); sampling uses the background manager."""
+        with self._lock:
+            if self.conn.client is None:
+                self.conn.adopt(self._open_client())
+
+    def close(self):
+        """Drop the connection; the next read reconnects in the background."""
+        self.conn.drop()
+
+    def shutdown(self):
+        """Close for good and stop reconnecting."""
+        if self.links:
+            self.links.stop()
+        self.conn.stop()
+        if self.recorder:
+            self.recorder.close()
+
+    def watch_links(self, on_change=None):
+        """Follow link changes on a channel of their own (LINK_WATCH) instead of reading
+        the operstates with every sample; on_change(states) is called on each change."""
+        if self.links is None:
+            self.links = LinkWatcher(self, on_change).start()
+        return True
+
+    def _watched_links(self):
+        # The watcher's link states, or None while it isn't following the AP
+        watcher = self.links
+        return watcher.states if watcher is not None and watcher.live else None
+
+    def _link_frames(self, frames, watched):
+        # Pair each frame with the watched link states (None: the frame carries its own).
+        # Ends when the watcher comes up or goes away, so the caller restarts the remote
+        # loop with the matching script
+        for frame in frames:
+            links = self._watched_links()
+            if (links is not None) != watched:
+                frames.close()
+                return
+            yield frame, links
+
+    def _ensure(self):
+        return self.conn.get()
+
+    def _run(self, cmd):
+        ssh = self._ensure()
+        t0 = time.perf_counter()
+        with self._lock:
+            t1 = time.perf_counter()
+            _, stdout, _ = ssh.exec_command(cmd, timeout=SSH_COMMAND_TIMEOUT)
+            t2 = time.perf_counter()
+            data = stdout.read()
+        t3 = time.perf_counter()
+        self.conn.note_rtt((t3 - t1) * 1000)
+        if STAGES:
+            STAGES.add("lock_wait", t1 - t0)
+            STAGES.add("exec", t2 - t1)
+            STAGES.add("read", t3 - t2)
+        return data
+
+    def read_counters(self, iface):
+        """Return (rx_bytes, tx_bytes) for iface, or (None, None)."""
+        data = self._run("cat /proc/net/dev 2>/dev/null || true")
+        return parse_proc_net_dev(data, names=(iface,)).get(iface, (None, None))
+
+    def read_all_counters(self):
+        """Return dict{name:(rx_bytes, tx_bytes)} parsed from /proc/net/dev (excludes 'lo')."""
+        data = self._run("cat /proc/net/dev 2>/dev/null || true")
+        result = parse_proc_net_dev(data)
+        result.pop("lo", None)
+        return result
+
+    def probe(self):
+        """Return (remote_ts, counters, links) for all interfaces in a single round trip."""
+        watched = self._watched_links() is not None
+        data = self._run(COUNTERS_SCRIPT if watched else PROBE_SCRIPT)
+        end = data.rfind(STREAM_FRAME_END)
+        if end < 0:
+            raise ValueError("Incomplete probe output")
+        frame = data[data.find(b"@@"):end]
+        ts, counters, links = _timed_parse(parse_stream_frame, frame)
+        if watched:
+            # Read after the round trip so a change pushed meanwhile isn't undone
+            links = self.links.states
+        if self.recorder:
+            self.recorder.write("probe", _with_operstates(frame, links if watched else None))
+        return ts, counters, links
+
+    def stream_snapshots(self, interval):
+        """Yield (remote_ts, counters, links) from one long-lived remote sampling loop.
+
+        The channel is opened once and read incrementally; frames are parsed as soon as
+        their terminator arrives. Raises when the channel closes or stalls so the caller
+        can reconnect and restart the stream.
+        """
+        watched = self._watched_links() is not None
+        script = STREAM_SCRIPT.format(probe=COUNTERS_SCRIPT if watched else PROBE_SCRIPT, interval=f"{interval:g}")
+        for frame, links in self._link_frames(self._frames(script, interval), watched):
+            if self.recorder:
+                self.recorder.write("probe", _with_operstates(frame, links))
+            ts, counters, own = _timed_parse(parse_stream_frame, frame)
+            yield ts, counters, own if links is None else links
+
+    def burst_snapshots(self, interval, sub_interval, patterns="*"):
+        """Yield (remote_ts, counters, links, subs) once per interval from a remote loop
+        that also samples the interfaces matching `patterns` every sub_interval seconds."""
+        count = max(int(round(interval / sub_interval)) - 1, 0)
+        watched = self._watched_links() is not None
+        script = BURST_SCRIPT.format(
+            body=_NET_DEV if watched else _NET_DEV + _OPERSTATES,
+            count=count, usec=int(sub_interval * 1e6), sec=f"{sub_interval:g}", patterns=patterns,
+        )
+        for frame, links in self._link_frames(self._frames(script, interval), watched):
+            if self.recorder:
+                self.recorder.write("burst", _with_operstates(frame, links))
+            ts, counters, own, subs = _timed_parse(parse_burst_frame, frame)
+            yield ts, counters, own if links is None else links, subs
+
+    def agent_snapshots(self, interval, spec=None):
+        """Yield (remote_ts, counters, links) from the delta-encoding agent (SAMPLER=agent).
+
+        The agent is installed over each new connection before its first stream. With
+        spec, only the interfaces of that INTERFACE spec are sent.
+        """
+        ssh = self._ensure()
+        if self._agent_client is not ssh:
+            self._push_agent(ssh)
+        decoder = AgentDecoder()
+        watched = self._watched_links() is not None
+        script = AGENT_SCRIPT.format(
+            path=AGENT_PATH, probe=COUNTERS_SCRIPT if watched else PROBE_SCRIPT,
+            interval=f"{interval:g}", **agent_filters(spec),
+        )
+        frames = self._frames(script, interval, AGENT_FRAME_END, start=None)
+        for frame, watched_links in self._link_frames(frames, watched):
+            ts, counters, links = _timed_parse(decoder.decode, frame)
+            if watched_links is not None:
+                links = watched_links
+            snapshot = ts, counters, links
+            if self.recorder:
+                record = json.dumps({"c": counters, "l": links}, separators=(",", ":")).encode()
+                self.recorder.write("agent", record, ts)
+            yield snapshot
+
+    def _push_agent(self, ssh):
+        with self._lock:
+            stdin, stdout, _ = ssh.exec_command(AGENT_PUSH.format(path=AGENT_PATH), timeout=SSH_COMMAND_TIMEOUT)
+            stdin.write(AGENT_AWK)
+            stdin.channel.shutdown_write()
+            status = stdout.channel.recv_exit_status()
+        if status != 0:
+            raise RuntimeError(f"Agent install failed (exit {status})")
+        self._agent_client = ssh
+
+    def _frames(self, script, interval, end=STREAM_FRAME_END, start=b"@@"):
+        # Run a remote loop on its own channel and yield each terminated frame
+        ssh = self._ensure()
+        with self._lock:
+            chan = ssh.get_transport().open_session()
+        try:
+            chan.settimeout(max(interval * 5, 10))
+            chan.exec_command(script)
+            buf = b""
+            while True:
+                chunk = chan.recv(65536)
+                if not chunk:
+                    raise EOFError("Stream channel closed")
+                buf += chunk
+                while True:
+                    i = buf.find(end)
+                    if i < 0:
+                        break
+                    frame, buf = buf[:i], buf[i + len(end):]
+                    if start is not None:
+                        j = frame.rfind(start)
+                        if j < 0:
+                            continue
+                        frame = frame[j:]
+                    yield frame
+        finally:
+            try:
+                chan.close()
+            except Exception:
+                pass
+
+    def run_action(self, cmd, timeout):
+        """Run cmd on a channel of its own and return (exit_status, output).
+
+        Doesn't take the sampling lock, so a long action never delays a sample.
+        exit_status is None when the connection went away first (e.g. a reboot).
+        Raises TimeoutError if the command is still running after timeout seconds.
+        """
+        ssh = self._ensure()
+        chan = ssh.get_transport().open_session()
+        deadline = time.monotonic() + timeout
+        out = b""
+        try:
+            chan.set_combine_stderr(True)
+            chan.exec_command(cmd)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"still running after {timeout:g}s")
+                chan.settimeout(remaining)
+                try:
+                    chunk = chan.recv(65536)
+                except socket.timeout:
+                    continue
+                if not chunk:
+                    break
+                out = (out + chunk)[-65536:]
+            # The exit status trails the EOF; it never comes (-1) if the AP went down
+            wait = max(0.0, min(2.0, deadline - time.monotonic()))
+            status = chan.recv_exit_status() if chan.status_event.wait(wait) else -1
+            return (status if status >= 0 else None), out.decode(errors="replace")
+        finally:
+            try:
+                chan.close()
+            except Exception:
+                pass
+
+    def read_stations(self, patterns="*"):
+        """Return (remote_ts, {mac: (vap, rx, tx)}, {mac: name}) for the stations on the
+        wireless interfaces matching the shell case `patterns`.
+
+        Runs on a channel of its own without the sampling lock, so a slow dump never
+        delays a sample.
+        """
+        ssh = self._ensure()
+        chan = ssh.get_transport().open_session()
+        try:
+            chan.settimeout(SSH_COMMAND_TIMEOUT)
+            chan.exec_command(STATIONS_SCRIPT.format(patterns=patterns))
+            data = b"".join(iter(lambda: chan.recv(65536), b""))
+        finally:
+            try:
+                chan.close()
+            except Exception:
+                pass
+        return _timed_parse(parse_stations, data)
+
+    def read_link_status(self, iface):
+        """Return 'up', 'down', or 'unknown' for interface link status on the AP."""
+        links = self._watched_links()
+        if links is not None:
+            return links.get(iface, "unknown")
+        self._ensure()
+        try:
+            cmd = f"cat /sys/class/net/{iface}/operstate 2>/dev/null || true"
+            s = self._run(cmd).decode(errors="ignore").strip().lower()
+            if s in ("up", "down", "dormant", "unknown"):
+                return "up" if s == "up" else ("down" if s == "down" else "unknown")
+        except Exception:
+            pass
+        try:
+            cmd = f"ip link show {iface} 2>/dev/null || true"
+            out = self._run(cmd).decode(errors="ignore")
+            if " state UP" in out or "<UP," in out:
+                return "up"
+            if " state DOWN" in out:
+                return "down"
+        except Exception:
+            pass
+        return "unknown"
+
+
+class UbusMonitor:
+    """Counter source over HTTP JSON-RPC to the AP's ubus (rpcd behind uhttpd's /ubus).
+
+    Same sampling interface as APMonitor. A probe is one `network.device status`
+    call returning the counters and carrier of every device, sent over one pooled
+    keep-alive requests.Session, so a sample costs a small POST and no SSH
+    handshake. The rpcd login is renewed when it expires. Timestamps are local
+    (ubus has no sub-second AP clock). Station dumps and remote actions need SSH.
+    """
+
+    LOGIN_SID = "0" * 32
+    UBUS_STATUS_PERMISSION_DENIED = 6
+    has_stations = False
+
+    def __init__(self, url, user, password=None):
+        self.url = url
+        self.user = user
+        self.password = password or ""
+        self._ids = iter(range(1, 1 << 62))
+        self.conn = ConnectionManager(self._open_client, alive=lambda session: True)
+        self.recorder = None
+
+    def _open_client(self):
+        load_http()
+        t0 = time.perf_counter()
+        session = requests.Session()
+        # The AP is on the LAN: skip the per-request proxy/netrc lookups in os.environ
+        session.trust_env = False
+        session.mount(self.url, HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0))
+        try:
+            session.ubus_sid = self._login(session)
+        except Exception:
+            session.close()
+            raise
+        if STAGES:
+            STAGES.add("connect", time.perf_counter() - t0)
+        return session
+
+    def _post(self, session, sid, obj, method, args):
+        payload = {"jsonrpc": "2.0", "id": next(self._ids), "method": "call", "params": [sid, obj, method, args]}
+        r = session.post(self.url, json=payload, timeout=(SSH_CONNECT_TIMEOUT, SSH_COMMAND_TIMEOUT))
+        r.raise_for_status()
+        reply = r.json()
+        if "error" in reply:
+            raise ConnectionError(f"ubus: {reply['error'].get('message', reply['error'])}")
+        result = reply.get("result") or [-1]
+        return result[0], (result[1] if len(result) > 1 else {})
+
+    def _login(self, session):
+        code, data = self._post(
+            session, self.LOGIN_SID, "session", "login", {"username": self.user, "password": self.password}
+        )
+        if code != 0 or "ubus_rpc_session" not in data:
+            raise PermissionError(f"ubus login failed (status {code})")
+        return data["ubus_rpc_session"]
+
+    def connect(self):
+        """Connect in the calling thread (blocking); sampling uses the background manager."""
+        if self.conn.client is None:
+            self.conn.adopt(self._open_client())
+
+    def close(self):
+        """Drop the session; the next read reconnects in the background."""
+        self.conn.drop()
+
+    def shutdown(self):
+        """Close for good and stop reconnecting."""
+        self.conn.stop()
+        if self.recorder:
+            self.recorder.close()
+
+    def _call(self, obj, method, args=None):
+        session = self.conn.get()
+        t0 = time.perf_counter()
+        code, data = self._post(session, session.ubus_sid, obj, method, args or {})
+        if code == self.UBUS_STATUS_PERMISSION_DENIED:
+            # Session expired (rpcd drops idle ones): log in again once
+            session.ubus_sid = self._login(session)
+            code, data = self._post(session, session.ubus_sid, obj, method, args or {})
+        t1 = time.perf_counter()
+        self.conn.note_rtt((t1 - t0) * 1000)
+        if STAGES:
+            STAGES.add("exec", t1 - t0)
+        if code != 0:
+            raise RuntimeError(f"ubus {obj} {method}: status {code}")
+        return data, (t0 + t1) / 2
+
+    def probe(self):
+        """Return (ts, counters, links) for all devices in a single request."""
+        data, ts = self._call("network.device", "status")
+        if self.recorder:
+            self.recorder.write("ubus", json.dumps(data, separators=(",", ":")).encode(), ts)
+        counters, links = _timed_parse(parse_ubus_devices, data)
+        return ts, counters, links
+
+    def read_all_counters(self):
+        return self.probe()[1]
+
+    def stream_snapshots(self, interval):
+        """Yield probes every interval; ubus can't push, so this polls on a fixed clock."""
+        next_at = time.monotonic()
+        while True:
+            yield self.probe()
+            next_at = max(next_at + interval, time.monotonic())
+            time.sleep(max(0.0, next_at - time.monotonic()))
+
+    def agent_snapshots(self, interval, spec=None):
+        """No shell behind ubus to run the agent on: same as stream_snapshots."""
+        return self.stream_snapshots(interval)
+
+    def burst_snapshots(self, interval, sub_interval, patterns="*"):
+        """Like stream_snapshots, without sub-samples (no sub-second sampling over HTTP)."""
+        for ts, counters, links in self.stream_snapshots(interval):
+            yield ts, counters, links, []
+
+    def watch_links(self, on_change=None):
+        """No push channel over ubus; every device status carries the link states."""
+        return False
+
+    def read_stations(self, patterns="*"):
+        raise NotImplementedError("top talkers need AP_TRANSPORT=ssh")
+
+    def run_action(self, cmd, timeout):
+        raise NotImplementedError("remote actions need AP_TRANSPORT=ssh")
+
+
+class Recorder:
+    """Appends raw probe outputs of one AP to a gzip file, for ReplayMonitor.
+
+    Format: MAGIC, one JSON header line (ap, iface, transport, sampler, interval,
+    started), then per sample a <dBI record head (time, kind, payload length) and the
+    payload exactly as the parsers get it: a probe or stream frame, a burst frame,
+    the JSON of a ubus `network.device status`, or an agent's decoded counters.
+    Consecutive frames differ in little but their counters, so they compress well.
+    Write errors stop the recording, never the sampling.
+
+    The record time is whatever the sample is timed with, so one file keeps one
+    clock: time.monotonic() at receipt for probe and burst frames (which carry the
+    AP's own stamps), the request's perf_counter() midpoint for ubus, and the AP
+    uptime of the frame for agent. Replays use it for pacing, and ubus and agent
+    samples also as their timestamp; only differences within a file matter.
+    """
+
+    MAGIC = b"TWREC1\n"
+    KINDS = ("probe", "burst", "ubus", "agent")
+    HEAD = struct.Struct("<dBI")
+    FLUSH_INTERVAL = 5.0
+
+    def __init__(self, path, header):
+        self.path = path
+        self._file = gzip.open(path, "wb", compresslevel=6)
+        self._file.write(self.MAGIC + json.dumps(header).encode() + b"\n")
+        self._file.flush()
+        self._flushed = time.monotonic()
+
+    def write(self, kind, payload, ts=None):
+        f = self._file
+        if f is None:
+            return
+        now = time.monotonic()
+        try:
+            f.write(self.HEAD.pack(now if ts is None else ts, self.KINDS.index(kind), len(payload)))
+            f.write(payload)
+            if now - self._flushed > self.FLUSH_INTERVAL:
+                f.flush()  # a crash loses at most FLUSH_INTERVAL seconds
+                self._flushed = now
+        except Exception:
+            self.close()
+
+    def close(self):
+        f, self._file = self._file, None
+        if f is not None:
+            try:
+                f.close()
+            except Exception:
+                pass
+
+
+def open_recorder(ap):
+    """Return a Recorder for one load_fleet() entry under RECORD_DIR, or None."""
+    try:
+        os.makedirs(RECORD_DIR, exist_ok=True)
+        name = re.sub(r"[^0-9A-Za-z_.-]", "_", ap["name"])
+        path = os.path.join(RECORD_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.twrec")
+        header = dict(ap=ap["name"], iface=ap["iface"], transport=ap["transport"], sampler=SAMPLER,
+                      interval=POLL_INTERVAL, started=time.time())
+        return Recorder(path, header)
+    except Exception:
+        return None
+
+
+def read_recording(path):
+    """Return (header, iterator of (ts, kind, payload)) for a Recorder file."""
+    f = gzip.open(path, "rb")
+    if f.read(len(Recorder.MAGIC)) != Recorder.MAGIC:
+        f.close()
+        raise ValueError(f"{path}: not a TrafficWidget recording")
+    header = json.loads(f.readline())
+    head = Recorder.HEAD
+
+    def records():
+        with f:
+            while True:
+                # A recording cut short by a crash ends at its last complete record
+                try:
+                    raw = f.read(head.size)
+                    if len(raw) < head.size:
+                        return
+                    ts, kind, size = head.unpack(raw)
+                    payload = f.read(size)
+                except (EOFError, OSError):
+                    return
+                if len(payload) < size:
+                    return
+                yield ts, Recorder.KINDS[kind], payload
+
+    return header, records()
+
+
+def parse_recorded(kind, payload, ts):
+    """Parse one recorded payload to (ts, counters, links, subs)."""
+    if kind == "burst":
+        return _timed_parse(parse_burst_frame, payload)
+    if kind == "ubus":
+        counters, links = _timed_parse(parse_ubus_devices, json.loads(payload))
+        return ts, counters, links, []
+    if kind == "agent":
+        # Decoded snapshots: the delta frames only make sense from the stream's start
+        data = json.loads(payload)
+        return ts, {name: tuple(c) for name, c in data["c"].items()}, data["l"], []
+    return (*_timed_parse(parse_stream_frame, payload), [])
+
+
+class ReplayFinished(EOFError):
+    """Raised by ReplayMonitor at the end of a recording."""
+
+
+class ReplayMonitor:
+    """Counter source that plays a Recorder file back through the normal pipeline.
+
+    stream_snapshots/burst_snapshots follow the recorded timing divided by speed
+    (0 = as fast as possible); probe() returns the next sample at once, so poll
+    ticks set the pace. Raises ReplayFinished at the end of the recording.
+    """
+
+    has_stations = False
+
+    def __init__(self, path, speed=1.0):
+        self.path = path
+        self.speed = speed
+        self.header, self._records = read_recording(path)
+        self.recorder = None
+        self.conn = NullConnection("replaying")
+
+    def connect(self):
+        pass
+
+    def close(self):
+        # A recording can't drop; errors keep the playback position
+        pass
+
+    def shutdown(self):
+        pass
+
+    def _next(self):
+        for ts, kind, payload in self._records:
+            return parse_recorded(kind, payload, ts), ts
+        raise ReplayFinished("end of recording")
+
+    def probe(self):
+        (ts, counters, links, _), _ = self._next()
+        return ts, counters, links
+
+    def read_all_counters(self):
+        return self.probe()[1]
+
+    def burst_snapshots(self, interval=None, sub_interval=None, patterns="*"):
+        """Yield (ts, counters, links, subs) at the recorded pace / speed."""
+        start = None
+        while True:
+            snapshot, rec_ts = self._next()
+            if self.speed > 0:
+                if start is None:
+                    start = (rec_ts, time.monotonic())
+                time.sleep(max(0.0, start[1] + (rec_ts - start[0]) / self.speed - time.monotonic()))
+            yield snapshot
+
+    def stream_snapshots(self, interval=None):
+        for ts, counters, links, _ in self.burst_snapshots():
+            yield ts, counters, links
+
+    def agent_snapshots(self, interval=None, spec=None):
+        return self.stream_snapshots(interval)
+
+    def watch_links(self, on_change=None):
+        """Recordings replay the link states they were sampled with."""
+        return False
+
+    def read_stations(self, patterns="*"):
+        raise NotImplementedError("no station dumps in recordings")
+
+    def run_action(self, cmd, timeout):
+        raise NotImplementedError("replaying a recording")
+
+
+def replay_pollers(paths, speed=REPLAY_SPEED, **kwargs):
+    """Return one APPoller per recording, named and configured as when recorded."""
+    pollers = []
+    for path in paths:
+        monitor = ReplayMonitor(path, speed)
+        pollers.append(APPoller(monitor.header.get("ap", path), monitor, monitor.header.get("iface", "auto"), **kwargs))
+    return pollers
+
+
+def replay_file(path, on_update=None, on_iface=None):
+    """Feed a recording through an APPoller as fast as possible and return the poller.
+
+    The same parse -> rate -> auto-detect path as live sampling, for offline
+    regression checks and benchmarks; on_update/on_iface fire as they would live.
+    """
+    poller = replay_pollers([path], speed=0, on_update=on_update, on_iface=on_iface)[0]
+    poller.monitor.connect()
+    try:
+        for ts, counters, links, subs in poller.monitor.burst_snapshots():
+            poller._handle_snapshot(ts, counters, links)
+            if subs:
+                poller._handle_burst(ts, counters, subs)
+    except ReplayFinished:
+        pass
+    return poller
+
+
+def open_monitor(ap):
+    """Return the counter source for one load_fleet() entry."""
+    if ap["transport"] == "ubus":
+        return UbusMonitor(ap["ubus_url"].replace("{host}", ap["host"]), ap["user"], ap["password"])
+    return APMonitor(ap["host"], ap["user"], ap["password"], ap["key"], port=ap["port"])
+
+
+def unwrap_delta(prev, cur, dt, max_rate):
+    """Return bytes since prev (unwrapping 32/64-bit wraps), or None on a reset."""
+    if cur >= prev:
+        return cur - prev
+    for bits in (32, 64):
+        if prev < 2 ** bits:
+            wrapped = cur + 2 ** bits - prev
+            if wrapped <= max_rate * dt:
+                return wrapped
+            break
+    return None
+
+
+class RateEstimator:
+    """Turns successive counter readings into byte rates.
+
+    Feed it the AP-side timestamp and the counters of every member interface. Each
+    member's delta is unwrapped separately: a decrease that fits a 32- or 64-bit
+    wrap at a plausible rate (<= RATE_MAX_BPS) is a wrap, anything else is a counter
+    reset, which re-baselines that member and holds the previous rate instead of
+    reporting a zero blip. A going-backwards timestamp (AP reboot) resets everything.
+
+    smoothing is "none", "ewma" (weight alpha on the newest rate) or "window"
+    (bytes over time across the last `window` intervals).
+    """
+
+    def __init__(self, smoothing="none", alpha=0.3, window=5, max_rate=None):
+        self.smoothing = smoothing
+        self.alpha = alpha
+        self.window = max(int(window), 1)
+        self.max_rate = max_rate or RATE_MAX_BPS
+        self.reset()
+
+    def reset(self):
+        self._prev = {}  # name -> (rx, tx)
+        self._prev_ts = None
+        self._rates = None  # last (rx_bps, tx_bps)
+        self._recent = collections.deque()  # (dt, drx, dtx) for smoothing="window"
+        self._sums = [0.0, 0.0, 0.0]
+
+    def _delta(self, prev, cur, dt):
+        return unwrap_delta(prev, cur, dt, self.max_rate)
+
+    def update(self, ts, counters):
+        """Feed {name: (rx, tx)} read at AP time ts; return (rx_bps, tx_bps) or None."""
+        prev, prev_ts = self._prev, self._prev_ts
+        self._prev, self._prev_ts = dict(counters), ts
+        if prev_ts is None or ts <= prev_ts:
+            self._rates = None
+            self._recent.clear()
+            self._sums = [0.0, 0.0, 0.0]
+            return None
+        dt = ts - prev_ts
+        drx = dtx = 0
+        rx_ok = tx_ok = True
+        for name, (rx, tx) in counters.items():
+            old = prev.get(name)
+            if old is None:
+                continue  # new member: baseline only
+            d = self._delta(old[0], rx, dt)
+            if d is None:
+                rx_ok = False
+            else:
+                drx += d
+            d = self._delta(old[1], tx, dt)
+            if d is None:
+                tx_ok = False
+            else:
+                dtx += d
+        held = self._rates or (0.0, 0.0)
+        if not rx_ok:
+            drx = held[0] * dt
+        if not tx_ok:
+            dtx = held[1] * dt
+        if self.smoothing == "window":
+            self._recent.append((dt, drx, dtx))
+            self._sums[0] += dt
+            self._sums[1] += drx
+            self._sums[2] += dtx
+            if len(self._recent) > self.window:
+                odt, orx, otx = self._recent.popleft()
+                self._sums[0] -= odt
+                self._sums[1] -= orx
+                self._sums[2] -= otx
+            rates = (self._sums[1] / self._sums[0], self._sums[2] / self._sums[0])
+        elif self.smoothing == "ewma" and self._rates is not None:
+            a = self.alpha
+            rates = (
+                a * drx / dt + (1 - a) * self._rates[0],
+                a * dtx / dt + (1 - a) * self._rates[1],
+            )
+        else:
+            rates = (drx / dt, dtx / dt)
+        self._rates = rates
+        return rates
+
+
+class StationTracker:
+    """Per-station rates from successive station dumps, with a bounded top-k view.
+
+    A dump costs O(n) for the deltas and O(n log k) for the heap selection, so hundreds
+    of associated clients stay cheap. Stations that leave are forgotten; one whose
+    counters went backwards (reassociation) is re-baselined.
+    """
+
+    def __init__(self, k=5, max_rate=None):
+        self.k = k
+        self.max_rate = max_rate or RATE_MAX_BPS
+        self._prev = {}
+        self._prev_ts = None
+
+    def update(self, ts, stations):
+        """Feed {mac: (vap, rx, tx)} read at AP time ts; return the top k as
+        [(mac, vap, down_bps, up_bps), ...] from the clients' point of view."""
+        prev, prev_ts = self._prev, self._prev_ts
+        self._prev, self._prev_ts = stations, ts
+        if prev_ts is None or ts <= prev_ts:
+            return []
+        dt = ts - prev_ts
+        rates = []
+        for mac, (vap, rx, tx) in stations.items():
+            old = prev.get(mac)
+            if old is None:
+                continue
+            drx = unwrap_delta(old[1], rx, dt, self.max_rate)
+            dtx = unwrap_delta(old[2], tx, dt, self.max_rate)
+            if drx is None or dtx is None:
+                continue
+            # The AP transmits what the client downloads
+            rates.append((dtx / dt + drx / dt, mac, vap, dtx / dt, drx / dt))
+        return [r[1:] for r in heapq.nlargest(self.k, rates)]
+
+
+class InterfaceRates:
+    """Rates of every interface in the snapshots, kept in NumPy arrays.
+
+    Each interface gets a stable row (new ones are appended) and each snapshot
+    becomes one (rows, 2) uint64 rx/tx counter matrix, so deltas, 32/64-bit wrap
+    handling (as unwrap_delta), rates, the auto-detect EWMA and sorting take a few
+    array operations however many VLAN/WDS/VAP interfaces the AP has. A counter reset
+    holds the interface's previous rate. `view` is replaced rather than modified, so
+    other threads read it without a lock.
+    """
+
+    def __init__(self, alpha=0.3, max_rate=None):
+        if not load_numpy():
+            raise RuntimeError("Missing dependency: numpy. Install via 'pip install numpy'.")
+        self.alpha = alpha
+        self.max_rate = max_rate or RATE_MAX_BPS
+        self.names = []  # row -> name, append-only
+        self.index = {}  # name -> row
+        self._keys = None  # names of the last snapshot, in order...
+        self._rows = None  # ...and their rows (None: every row, in row order)
+        self.reset()
+
+    def reset(self):
+        self._prev = None  # (ts, counters, present)
+        self.scores = None  # EWMA of rx+tx bytes/s per row, NaN if unknown
+        self.view = None  # (rows, rates, present); rates are rx/tx bytes/s, NaN if unknown
+
+    def _rows_of(self, counters):
+        keys = tuple(counters)
+        if keys != self._keys:
+            for name in keys:
+                if name not in self.index:
+                    self.index[name] = len(self.names)
+                    self.names.append(name)
+            self._keys = keys
+            rows = np.fromiter((self.index[k] for k in keys), dtype=np.intp, count=len(keys))
+            # The usual case: the same interfaces in the same order as their rows
+            self._rows = None if len(keys) == len(self.names) and (rows == np.arange(len(rows))).all() else rows
+        return self._rows
+
+    def update(self, ts, counters):
+        """Feed {name: (rx, tx)} read at AP time ts."""
+        rows = self._rows_of(counters)
+        n = len(self.names)
+        flat = np.fromiter(itertools.chain.from_iterable(counters.values()), dtype=np.uint64, count=2 * len(counters))
+        if rows is None:
+            cur = flat.reshape(n, 2)
+            present = np.ones(n, dtype=bool)
+        else:
+            cur = np.zeros((n, 2), dtype=np.uint64)
+            present = np.zeros(n, dtype=bool)
+            cur[rows] = flat.reshape(-1, 2)
+            present[rows] = True
+        prev, self._prev = self._prev, (ts, cur, present)
+        if prev is None or ts <= prev[0]:
+            self.scores = None
+            self.view = (n, np.full((n, 2), np.nan), present)
+            return
+        dt = ts - prev[0]
+        old, both = self._grow(prev[1], n), present & self._grow(prev[2], n)
+        back = cur < old
+        # prev < 2**32 can only have wrapped as a 32-bit counter; uint64 arithmetic
+        # already wraps at 2**64 for the rest
+        delta = np.where(back & (old < np.uint64(2 ** 32)), cur + np.uint64(2 ** 32) - old, cur - old)
+        rates = delta.astype(np.float64) / dt
+        ok = both[:, None] & (~back | (rates <= self.max_rate))
+        old_rates = self._grow(self.view[1], n, np.nan) if self.view else np.full((n, 2), np.nan)
+        rates = np.where(ok, rates, np.where(both[:, None], old_rates, np.nan))
+        # The score counts a reset as idle, like a never-negative delta would
+        total = np.where(ok, rates, 0.0).sum(axis=1)
+        scores = self._grow(self.scores, n, np.nan) if self.scores is not None else np.full(n, np.nan)
+        a = self.alpha
+        self.scores = np.where(both, np.where(np.isnan(scores), total, a * total + (1 - a) * scores), np.nan)
+        self.view = (n, rates, present)
+
+    @staticmethod
+    def _grow(arr, n, fill=0):
+        # Pad a previous snapshot's array with rows for interfaces that appeared since
+        if len(arr) == n:
+            return arr
+        out = np.full((n,) + arr.shape[1:], fill, dtype=arr.dtype)
+        out[:len(arr)] = arr
+        return out
+
+    def busiest(self):
+        """Return (name, bytes_per_s) of the highest score, or (None, 0.0) until known."""
+        scores = self.scores
+        if scores is None or not len(scores) or np.isnan(scores).all():
+            return None, 0.0
+        i = int(np.nanargmax(scores))
+        return self.names[i], float(scores[i])
+
+    def score(self, name):
+        i = self.index.get(name)
+        scores = self.scores
+        if i is None or scores is None or i >= len(scores) or np.isnan(scores[i]):
+            return 0.0
+        return float(scores[i])
+
+    def top(self, sort="total", count=10):
+        """Return [(name, rx_bps, tx_bps)] of up to count current interfaces, sorted by
+        "rx", "tx" or "total" (highest first; unknown rates last) or by "name"."""
+        view = self.view
+        if view is None:
+            return []
+        n, rates, present = view
+        rows = np.flatnonzero(present)
+        if sort == "name":
+            names = self.names
+            rows = sorted(rows.tolist(), key=names.__getitem__)[:count]
+        else:
+            col = rates[rows].sum(axis=1) if sort == "total" else rates[rows, 0 if sort == "rx" else 1]
+            col = np.where(np.isnan(col), -np.inf, col)
+            rows = rows[np.argsort(-col, kind="stable")[:count]]
+        sel = rates[rows]
+        return [
+            (self.names[i], None if math.isnan(rx) else rx, None if math.isnan(tx) else tx)
+            for i, (rx, tx) in zip(np.asarray(rows).tolist(), sel.tolist())
+        ]
+
+
+class InterfaceSelector:
+    """Tracks how busy every interface is from the snapshots the poller already takes.
+
+    Each interface keeps an EWMA of its rx+tx bytes/s; no extra round trips or sleeps
+    are needed. A challenger only replaces the current interface after beating it by
+    `ratio` (and `min_rate`) continuously for `hold` seconds of AP time. With numpy
+    installed (vectorized=None) the bookkeeping runs on an InterfaceRates table when
+    the AP has VECTOR_MIN_IFACES interfaces or more, or IFACE_TABLE needs one; below
+    that the per-call NumPy overhead outweighs the Python loop.
+    """
+
+    VECTOR_MIN_IFACES = 64
+
+    def __init__(self, alpha=0.3, ratio=4.0, min_rate=200 * 1024, hold=5.0, vectorized=None):
+        self.alpha = alpha
+        self.ratio = ratio
+        self.min_rate = min_rate
+        self.hold = hold
+        self.scores = {}
+        # InterfaceRates, or False for the pure Python path; None decides on first use,
+        # so numpy is imported by the sampling thread rather than at startup
+        self.table = None if vectorized is None else (InterfaceRates(alpha) if vectorized and load_numpy() else False)
+        self._prev = None  # (ts, counters)
+        self._candidate = None
+        self._since = None
+
+    def update(self, ts, counters):
+        if self.table is None:
+            wanted = IFACE_TABLE > 0 or len(counters) >= self.VECTOR_MIN_IFACES
+            self.table = InterfaceRates(self.alpha) if wanted and load_numpy() else False
+        if self.table:
+            self.table.update(ts, counters)
+            return
+        prev = self._prev
+        self._prev = (ts, counters)
+        if prev is None or ts <= prev[0]:
+            self.scores = {}
+            return
+        dt = ts - prev[0]
+        old_counters = prev[1]
+        a = self.alpha
+        scores = {}
+        for name, (rx, tx) in counters.items():
+            old = old_counters.get(name)
+            if old is None:
+                continue
+            rate = (max(rx - old[0], 0) + max(tx - old[1], 0)) / dt
+            score = self.scores.get(name)
+            scores[name] = rate if score is None else a * rate + (1 - a) * score
+        self.scores = scores
+
+    def busiest(self):
+        """Return (name, bytes_per_s) of the busiest interface, or (None, 0.0) until known."""
+        if self.table:
+            return self.table.busiest()
+        if not self.scores:
+            return None, 0.0
+        name = max(self.scores, key=self.scores.get)
+        return name, self.scores[name]
+
+    def score(self, name):
+        if self.table:
+            return self.table.score(name)
+        return self.scores.get(name, 0.0)
+
+    def challenger(self, current, ts):
+        """Return the interface to switch to once one has clearly outrun current, else None."""
+        best, best_rate = self.busiest()
+        if best is None or best == current or best_rate <= max(self.score(current) * self.ratio, self.min_rate):
+            self._candidate = self._since = None
+            return None
+        if best != self._candidate:
+            self._candidate, self._since = best, ts
+        if ts - self._since < self.hold:
+            return None
+        self._candidate = self._since = None
+        return best
+
+
+class RateHistory:
+    """Fixed-size ring buffer of (ts, rx, tx, down, up) samples backed by typed arrays.
+
+    append() is O(1) and allocates nothing; window()/stats() slice the arrays so
+    min/max/avg over the last n samples run in C. Safe to read from the Tk thread
+    while the sampling thread appends.
+    """
+
+    FIELDS = ("ts", "rx", "tx", "down", "up")
+    _TYPECODES = ("d", "Q", "Q", "d", "d")
+
+    def __init__(self, size):
+        self.size = max(int(size), 2)
+        self._cols = {
+            field: array(code, [0]) * self.size
+            for field, code in zip(self.FIELDS, self._TYPECODES)
+        }
+        self._next = 0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def append(self, ts, rx, tx, down, up):
+        with self._lock:
+            i = self._next
+            cols = self._cols
+            cols["ts"][i] = ts
+            cols["rx"][i] = rx
+            cols["tx"][i] = tx
+            cols["down"][i] = down
+            cols["up"][i] = up
+            self._next = (i + 1) % self.size
+            if self.count < self.size:
+                self.count += 1
+
+    def window(self, field, n=None):
+        """Return the last n values of field (all stored ones by default), oldest first."""
+        with self._lock:
+            n = self.count if n is None else max(0, min(n, self.count))
+            col = self._cols[field]
+            end = self._next
+            start = end - n
+            if start >= 0:
+                return col[start:end]
+            return col[start:] + col[:end]
+
+    def stats(self, field, n=None):
+        """Return (min, max, avg) of field over the last n samples, or (None, None, None)."""
+        values = self.window(field, n)
+        if not values:
+            return None, None, None
+        return min(values), max(values), sum(values) / len(values)
+
+    def latest(self):
+        """Return the newest (ts, rx, tx, down, up) sample, or None."""
+        with self._lock:
+            if not self.count:
+                return None
+            i = self._next - 1
+            return tuple(self._cols[field][i] for field in self.FIELDS)
+
+
+class SeriesLog:
+    """Append-only binary history of one AP interface at raw, 1 min and 1 h resolution.
+
+    Records are fixed-size little-endian structs sorted by wall-clock time, so reads
+    mmap the file and binary-search the range instead of loading it. A sample stamped
+    before the last one (the clock stepped back) is appended at the last one's time.
+    """
+
+    RAW = struct.Struct("<dQQdd")  # ts, rx, tx, down, up
+    ROLLUP = struct.Struct("<dQQdddd")  # bucket start, rx, tx (last), down/up avg, down/up max
+    RESOLUTIONS = (0, 60, 3600)  # seconds per record; 0 = raw samples
+
+    def __init__(self, directory, key):
+        self.key = key
+        self.paths = {
+            res: os.path.join(directory, f"{key}.{label}.bin")
+            for res, label in zip(self.RESOLUTIONS, ("raw", "1m", "1h"))
+        }
+        self._lock = threading.Lock()
+        self._raw = None
+        self._last_ts = None
+
+    def _struct(self, res):
+        return self.RAW if res == 0 else self.ROLLUP
+
+    def append(self, ts, rx, tx, down, up):
+        with self._lock:
+            if self._raw is None:
+                self._raw = open(self.paths[0], "ab", buffering=0)
+                if self._last_ts is None:
+                    self._last_ts = self._edge_ts(0, last=True)
+            # Keep the file sorted for _bisect
+            if self._last_ts is not None and ts < self._last_ts:
+                ts = self._last_ts
+            self._raw.write(self.RAW.pack(ts, rx, tx, down, up))
+            self._last_ts = ts
+
+    def close(self):
+        with self._lock:
+            if self._raw is not None:
+                try:
+                    self._raw.close()
+                finally:
+                    self._raw = None
+
+    @staticmethod
+    def _bisect(mm, st, n, ts):
+        # First record index with timestamp >= ts
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if st.unpack_from(mm, mid * st.size)[0] < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def read(self, res, start, end):
+        """Return records with start <= ts < end as (ts, rx, tx, down, up, down_max, up_max)."""
+        st = self._struct(res)
+        try:
+            n = os.path.getsize(self.paths[res]) // st.size
+        except OSError:
+            return []
+        if not n:
+            return []
+        with open(self.paths[res], "rb") as f, mmap.mmap(f.fileno(), n * st.size, access=mmap.ACCESS_READ) as mm:
+            lo = self._bisect(mm, st, n, start)
+            hi = self._bisect(mm, st, n, end)
+            records = list(st.iter_unpack(mm[lo * st.size:hi * st.size]))
+        if res == 0:
+            return [rec + (rec[3], rec[4]) for rec in records]
+        return records
+
+    def _edge_ts(self, res, last):
+        st = self._struct(res)
+        try:
+            with open(self.paths[res], "rb") as f:
+                n = os.fstat(f.fileno()).st_size // st.size
+                if not n:
+                    return None
+                f.seek((n - 1) * st.size if last else 0)
+                return st.unpack(f.read(st.size))[0]
+        except OSError:
+            return None
+
+    def rollup(self, now):
+        """Fold finished raw samples into 1 min buckets and 1 min buckets into 1 h buckets."""
+        for src, dst in ((0, 60), (60, 3600)):
+            last = self._edge_ts(dst, last=True)
+            since = last + dst if last is not None else (self._edge_ts(src, last=False) or now) // dst * dst
+            until = now // dst * dst  # only complete buckets
+            # Work through the backlog in bounded chunks
+            while since < until:
+                chunk_end = min(since + dst * 256, until)
+                out = []
+                bucket = None
+                for rec in self.read(src, since, chunk_end):
+                    start = rec[0] // dst * dst
+                    if bucket is None or bucket[0] != start:
+                        if bucket is not None:
+                            out.append(bucket)
+                        bucket = [start, rec[1], rec[2], 0.0, 0.0, rec[5], rec[6], 0]
+                    bucket[1], bucket[2] = rec[1], rec[2]
+                    bucket[3] += rec[3]
+                    bucket[4] += rec[4]
+                    bucket[5] = max(bucket[5], rec[5])
+                    bucket[6] = max(bucket[6], rec[6])
+                    bucket[7] += 1
+                if bucket is not None:
+                    out.append(bucket)
+                if out:
+                    with open(self.paths[dst], "ab") as f:
+                        f.write(b"".join(
+                            self.ROLLUP.pack(b[0], b[1], b[2], b[3] / b[7], b[4] / b[7], b[5], b[6]) for b in out
+                        ))
+                since = chunk_end
+
+    def evict(self, now, retention_days):
+        """Drop records older than the retention of each resolution."""
+        for res, days in zip(self.RESOLUTIONS, retention_days):
+            cutoff = now - days * 86400
+            first = self._edge_ts(res, last=False)
+            # Rewrite at most about once an hour per file
+            if first is None or first >= cutoff - max(3600, res):
+                continue
+            st = self._struct(res)
+            path = self.paths[res]
+            # Copy what's there now without holding the lock, so appends never wait on
+            # the rewrite; only the records appended meanwhile are copied under it
+            with self._lock:
+                n = os.path.getsize(path) // st.size
+            f, out = open(path, "rb"), open(path + ".tmp", "wb")
+            try:
+                with mmap.mmap(f.fileno(), n * st.size, access=mmap.ACCESS_READ) as mm:
+                    cut = self._bisect(mm, st, n, cutoff)
+                f.seek(cut * st.size)
+                left = (n - cut) * st.size
+                while left > 0:
+                    chunk = f.read(min(left, 1 << 20))
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    left -= len(chunk)
+                with self._lock:
+                    f.seek(n * st.size)
+                    shutil.copyfileobj(f, out)
+                    # Windows can't replace a file that is still open
+                    f.close()
+                    out.close()
+                    if res == 0 and self._raw is not None:
+                        self._raw.close()
+                        self._raw = None
+                    os.replace(path + ".tmp", path)
+            finally:
+                f.close()
+                out.close()
+
+
+class HistoryStore:
+    """On-disk history for every AP interface (one SeriesLog each) under HISTORY_DIR.
+
+    Samples are appended from the sampling threads; a background thread rolls them up
+    to 1 min / 1 h resolution and evicts records past HISTORY_RETENTION_DAYS.
+    """
+
+    def __init__(self, directory, retention_days=None):
+        self.directory = directory
+        self.retention_days = retention_days or HISTORY_RETENTION_DAYS
+        os.makedirs(directory, exist_ok=True)
+        self._series = {}
+        self._lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self._thread = None
+        # Pick up series written by earlier runs so they keep rolling up and expiring
+        for fname in os.listdir(directory):
+            if fname.endswith(".raw.bin"):
+                self._get(fname[:-len(".raw.bin")])
+
+    @staticmethod
+    def key(ap, iface):
+        return re.sub(r"[^0-9A-Za-z._-]", "_", f"{ap}_{iface}")
+
+    def _get(self, key):
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = SeriesLog(self.directory, key)
+            return series
+
+    def append(self, ap, iface, ts, rx, tx, down, up):
+        self._get(self.key(ap, iface)).append(ts, rx, tx, down, up)
+
+    def query(self, ap, iface, start, end, max_points=500):
+        """Return (resolution_seconds, records) for [start, end) at the finest resolution
+        that covers the range within max_points; resolution 0 means raw samples.
+
+        Records are (ts, rx, tx, down, up, down_max, up_max); rollups carry averages
+        in down/up and per-bucket peaks in down_max/up_max.
+        """
+        series = self._get(self.key(ap, iface))
+        now = time.time()
+        span = max(end - start, 0)
+        res = SeriesLog.RESOLUTIONS[-1]
+        for candidate, days in zip(SeriesLog.RESOLUTIONS, self.retention_days):
+            step = candidate or POLL_INTERVAL
+            if span / step <= max_points and start >= now - days * 86400:
+                res = candidate
+                break
+        return res, series.read(res, start, end)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        with self._lock:
+            series = list(self._series.values())
+        for s in series:
+            s.close()
+
+    def _run(self):
+        while not self.stop_event.wait(60.0):
+            with self._lock:
+                series = list(self._series.values())
+            now = time.time()
+            for s in series:
+                try:
+                    s.rollup(now)
+                    s.evict(now, self.retention_days)
+                except Exception:
+                    pass
+
+
+def load_fleet():
+    """Return the APs to monitor as a list of dicts.
+
+    AP_HOSTS is a comma-separated list of [name=]host[:port] entries; each AP inherits
+    AP_USER/AP_PASSWORD/AP_SSH_KEY/INTERFACE/AP_TRANSPORT/AP_UBUS_URL unless the
+    matching AP_<NAME>_* variable overrides it. Without AP_HOSTS the single AP_HOST
+    is used.
+    """
+    spec = os.getenv("AP_HOSTS", "").strip()
+    if not spec:
+        return [dict(name=AP_HOST, host=AP_HOST, port=AP_PORT, user=AP_USER,
+                     password=AP_PASSWORD or None, key=AP_SSH_KEY, iface=INTERFACE,
+                     transport=AP_TRANSPORT, ubus_url=AP_UBUS_URL)]
+    fleet = []
+    for entry in [e.strip() for e in spec.split(",") if e.strip()]:
+        name, sep, addr = entry.partition("=")
+        if not sep:
+            addr = name
+        name = name.strip()
+        host, _, port = addr.strip().partition(":")
+        prefix = "AP_" + re.sub(r"[^0-9A-Za-z]", "_", name).upper() + "_"
+        fleet.append(dict(
+            name=name,
+            host=host,
+            port=int(port or os.getenv(prefix + "PORT", AP_PORT)),
+            user=os.getenv(prefix + "USER", AP_USER),
+            password=os.getenv(prefix + "PASSWORD", AP_PASSWORD) or None,
+            key=os.getenv(prefix + "SSH_KEY", AP_SSH_KEY or "") or None,
+            iface=os.getenv(prefix + "INTERFACE", INTERFACE).strip(),
+            transport=os.getenv(prefix + "TRANSPORT", AP_TRANSPORT).strip().lower(),
+            ubus_url=os.getenv(prefix + "UBUS_URL", AP_UBUS_URL).strip(),
+        ))
+    return fleet
+
+
+def combine_link_status(statuses):
+    """Fold several link states into one: down if any is down, up if all are up."""
+    statuses = list(statuses)
+    if any(s == "down" for s in statuses):
+        return "down"
+    if statuses and all(s == "up" for s in statuses):
+        return "up"
+    return "unknown"
+
+
+def aggregate_link_status(statuses):
+    """Link state of an aggregate interface: up while any member is up, down when all are."""
+    statuses = list(statuses)
+    if any(s == "up" for s in statuses):
+        return "up"
+    if statuses and all(s == "down" for s in statuses):
+        return "down"
+    return "unknown"
+
+
+class APPoller:
+    """Turns one AP's snapshots into rates and link status, independently of any UI.
+
+    Callbacks run on the sampling thread: on_update(poller) after every computed sample,
+    on_iface(poller) when auto-detect switches interface, on_error(poller) when sampling
+    starts failing.
+    """
+
+    def __init__(self, name, monitor, iface, on_update=None, on_iface=None, on_error=None, store=None):
+        self.name = name
+        self.monitor = monitor
+        self.iface = iface
+        self.matcher = InterfaceMatcher(iface)
+        self.store = store
+        self.on_update = on_update
+        self.on_iface = on_iface
+        self.on_error = on_error
+        self.estimator = RateEstimator(RATE_SMOOTHING, RATE_EWMA_ALPHA, RATE_WINDOW)
+        self.lock = threading.Lock()
+        self.down_bps = None
+        self.up_bps = None
+        self.link_status = "unknown"
+        self.last_error = ""
+        self.snapshot = None  # latest (ts, counters, links) for all interfaces
+        self.samples = 0  # computed samples so far
+        self.sample_ts = None  # sampler clock of the latest computed sample
+        self.errors = 0
+        self.generation = 0  # bumped under lock on every change of the state above
+        self.finished = threading.Event()  # set when the source has nothing more (replays)
+        self.histories = {}  # iface spec -> RateHistory
+        self.selector = InterfaceSelector(
+            ratio=AUTO_SWITCH_RATIO, min_rate=AUTO_SWITCH_MIN_BPS, hold=AUTO_SWITCH_HOLD
+        )
+        self._prev_snapshot = None
+        # SAMPLER=burst: sub-interval rates of the last frame and of BURST_P95_WINDOW
+        self.burst = None  # (down_peak, up_peak, down_p95, up_p95)
+        self._burst_estimator = RateEstimator("none")
+        self._burst_recent = collections.deque()  # (ts, down_bps, up_bps)
+        self._burst_patterns = None
+        self._burst_frame_ts = None
+        # Top talkers: [(name, vap, down_bps, up_bps), ...], refreshed every TOP_TALKERS_INTERVAL
+        self.talkers = []
+        self._stations = StationTracker(TOP_TALKERS)
+
+    def state(self):
+        """Return (down_bps, up_bps, link_status, last_error)."""
+        with self.lock:
+            return self.down_bps, self.up_bps, self.link_status, self.last_error
+
+    def talkers_state(self):
+        """Return the latest top talkers as [(name, vap, down_bps, up_bps), ...]."""
+        with self.lock:
+            return list(self.talkers)
+
+    def burst_state(self):
+        """Return (down_peak, up_peak, down_p95, up_p95) or None (SAMPLER=burst only)."""
+        with self.lock:
+            return self.burst
+
+    def history(self, iface=None):
+        """Return the RateHistory for iface (the current interface by default)."""
+        iface = iface or self.iface
+        hist = self.histories.get(iface)
+        if hist is None:
+            hist = self.histories[iface] = RateHistory(HISTORY_SIZE)
+        return hist
+
+    def _auto_pending(self):
+        # INTERFACE=auto until the first busiest interface is known
+        return not self.iface or self.iface.lower() == "auto"
+
+    def _switch_iface(self, name):
+        self.iface = name
+        self.matcher = InterfaceMatcher(name)
+        self.estimator.reset()
+        self._burst_recent.clear()
+        # Baseline on the previous snapshot so the next rate is available immediately
+        if self._prev_snapshot is not None:
+            prev_ts, prev_allc, _ = self._prev_snapshot
+            self.estimator.update(prev_ts, self._members(prev_allc))
+        with self.lock:
+            self.generation += 1
+        if self.on_iface:
+            try:
+                self.on_iface(self)
+            except Exception:
+                pass
+
+    def tick(self):
+        """Take one combined probe and process it (SAMPLER=poll)."""
+        if self.finished.is_set():
+            return
+        t0 = time.perf_counter()
+        try:
+            self._handle_snapshot(*self.monitor.probe())
+        except Exception as e:
+            self._handle_error(e)
+        if STAGES:
+            STAGES.add("tick", time.perf_counter() - t0)
+
+    def run_stream(self, stop_event):
+        """Consume snapshots pushed by the remote sampling loop; restart it if the channel
+        dies. Returns when stopped or when the source is finished."""
+        while not stop_event.is_set() and not self.finished.is_set():
+            self._wait_connected(stop_event)
+            try:
+                if SAMPLER == "burst":
+                    if self._run_burst(stop_event):
+                        continue  # interface changed: restart with the new filter
+                elif SAMPLER == "agent":
+                    if self._run_agent(stop_event):
+                        continue
+                else:
+                    for snapshot in self.monitor.stream_snapshots(POLL_INTERVAL):
+                        if stop_event.is_set():
+                            return
+                        self._handle_snapshot(*snapshot)
+                    continue  # the link source changed (LINK_WATCH): restart right away
+            except Exception as e:
+                self._handle_error(e)
+                if self.finished.is_set():
+                    return
+            # Don't diff counters across the gap
+            self.estimator.reset()
+            self._prev_snapshot = None
+            stop_event.wait(POLL_INTERVAL)
+
+    def _wait_connected(self, stop_event):
+        # Like the poll scheduler: a connect still running isn't an outage to report,
+        # so start the stream the moment it's up (a failed connect goes to backoff)
+        conn = self.monitor.conn
+        while conn.state == "connecting" and not stop_event.is_set():
+            conn.connected.wait(0.25)
+
+    def _run_burst(self, stop_event):
+        # Returns True when the remote filter no longer matches the interface spec or
+        # the link source changed
+        self._burst_patterns = burst_patterns(self.iface)
+        self._burst_estimator.reset()
+        self._burst_frame_ts = None
+        frames = self.monitor.burst_snapshots(POLL_INTERVAL, BURST_INTERVAL_MS / 1000.0, self._burst_patterns)
+        for ts, allc, links, subs in frames:
+            if stop_event.is_set():
+                return False
+            self._handle_snapshot(ts, allc, links)
+            self._handle_burst(ts, allc, subs)
+            if burst_patterns(self.iface) != self._burst_patterns:
+                frames.close()
+                return True
+        return not stop_event.is_set()
+
+    def _agent_filter(self):
+        # Auto-switching compares every interface (idle ones cost the agent nothing);
+        # otherwise only the spec's interfaces are sent
+        return None if AUTO_SWITCH and not self._is_aggregate() else self.iface
+
+    def _run_agent(self, stop_event):
+        # Returns True when the agent's interface filter no longer fits the spec or the
+        # link source changed
+        spec = self._agent_filter()
+        snapshots = self.monitor.agent_snapshots(POLL_INTERVAL, spec)
+        for snapshot in snapshots:
+            if stop_event.is_set():
+                return False
+            self._handle_snapshot(*snapshot)
+            if self._agent_filter() != spec:
+                snapshots.close()
+                return True
+        return not stop_event.is_set()
+
+    def _handle_burst(self, ts, allc, subs):
+        """Turn a frame's sub-samples into per-frame peak and windowed p95 rates."""
+        if self._auto_pending():
+            return
+        est = self._burst_estimator
+        start, self._burst_frame_ts = self._burst_frame_ts, ts
+        for sub_ts, counters in [(ts, allc)] + subs:
+            rates = est.update(sub_ts, self._members(counters))
+            if rates is not None:
+                self._burst_recent.append((sub_ts, *self._perspective(*rates)))
+        recent = self._burst_recent
+        while recent and recent[0][0] < ts - BURST_P95_WINDOW:
+            recent.popleft()
+        # Peak over the span the average rate covers (previous frame to this one; this
+        # frame's sub-samples belong to the next), p95 over the whole window
+        frame = [r for r in recent if start is not None and start < r[0] <= ts]
+        if not frame:
+            return
+        downs = sorted(r[1] for r in recent)
+        ups = sorted(r[2] for r in recent)
+        i95 = max(0, math.ceil(len(downs) * 0.95) - 1)
+        burst = (max(r[1] for r in frame), max(r[2] for r in frame), downs[i95], ups[i95])
+        with self.lock:
+            self.burst = burst
+            self.generation += 1
+
+    def _perspective(self, rx_bps, tx_bps):
+        # Map rx/tx to down/up depending on perspective
+        if LAN_PERSPECTIVE:
+            return tx_bps, rx_bps  # AP transmits to clients, receives from them
+        return rx_bps, tx_bps  # RX from WAN
+
+    def _is_aggregate(self):
+        # Support aggregation: lists, globs and exclusions sum the matching ifaces
+        return self.matcher.aggregate
+
+    def _members(self, allc):
+        """Return {name: (rx, tx)} of the interfaces the current INTERFACE spec covers."""
+        return self.matcher.select(allc)
+
+    def _handle_snapshot(self, ts, allc, links):
+        with self.lock:
+            self.snapshot = (ts, allc, links)
+            self.generation += 1
+        self.selector.update(ts, allc)
+        if self._auto_pending():
+            best, _ = self.selector.busiest()
+            if best:
+                self._switch_iface(best)
+        elif AUTO_SWITCH and not self._is_aggregate():
+            # Dynamic auto-detect: follow another iface that stays much busier
+            best = self.selector.challenger(self.iface, ts)
+            if best:
+                self._switch_iface(best)
+        self._prev_snapshot = self.snapshot
+        if self._auto_pending():
+            return
+        members = self._members(allc)
+        self._handle_sample(members, self._link_status(members, links), ts)
+
+    def _link_status(self, members, links):
+        if self._is_aggregate():
+            return aggregate_link_status(links.get(name, "unknown") for name in members)
+        return links.get(self.iface, "unknown")
+
+    def _links_changed(self, links):
+        """Apply link states pushed by the monitor (LINK_WATCH) without waiting for the
+        next sample; called from the watcher thread."""
+        snapshot = self.snapshot
+        if snapshot is None or self._auto_pending():
+            return
+        status = self._link_status(self._members(snapshot[1]), links)
+        with self.lock:
+            if self.down_bps is None:
+                return  # nothing shown yet (or offline)
+            if status not in ("up", "down") and (self.down_bps > 0 or self.up_bps > 0):
+                status = "up"
+            if status == self.link_status:
+                return
+            self.link_status = status
+            self.generation += 1
+        if self.on_update:
+            try:
+                self.on_update(self)
+            except Exception:
+                pass
+
+    def poll_stations(self):
+        """Refresh the top talkers (one extra round trip, called by PollScheduler every
+        TOP_TALKERS_INTERVAL off the sampling thread); failures only blank the panel."""
+        spec = TOP_TALKERS_INTERFACES or self.iface
+        parts = _spec_globs(spec)
+        matcher = InterfaceMatcher(spec)
+        try:
+            ts, stations, names = self.monitor.read_stations("|".join(parts) if parts else "*")
+            if matcher.exclude:
+                stations = {mac: s for mac, s in stations.items() if not matcher.excludes(s[0])}
+            top = self._stations.update(ts, stations)
+        except Exception:
+            top, names = [], {}
+        talkers = [(names.get(mac, mac), vap, down, up) for mac, vap, down, up in top]
+        with self.lock:
+            self.talkers = talkers
+            self.generation += 1
+
+    def _handle_sample(self, members, status, now):
+        if not members:
+            return
+        t0 = time.perf_counter()
+        rates = self.estimator.update(now, members)
+        if STAGES:
+            STAGES.add("rate", time.perf_counter() - t0)
+        if rates is not None:
+            down_bps, up_bps = self._perspective(*rates)
+            if status not in ("up", "down") and (down_bps > 0 or up_bps > 0):
+                status = "up"
+            rx = sum(c[0] for c in members.values())
+            tx = sum(c[1] for c in members.values())
+            wall = time.time()
+            self.history().append(wall, rx, tx, down_bps, up_bps)
+            if self.store:
+                try:
+                    self.store.append(self.name, self.iface, wall, rx, tx, down_bps, up_bps)
+                except Exception:
+                    pass
+            with self.lock:
+                self.down_bps = down_bps
+                self.up_bps = up_bps
+                self.link_status = status or "unknown"
+                self.sample_ts = now
+                self.samples += 1
+                self.generation += 1
+                # Clear any previous error state
+                self.last_error = ""
+            if self.on_update:
+                try:
+                    self.on_update(self)
+                except Exception:
+                    pass
+
+    def _handle_error(self, e):
+        if isinstance(e, ReplayFinished):
+            self._finish()
+            return
+        if isinstance(e, APNotConnected):
+            # Reconnect already running in the background; e carries its status
+            msg = f"Offline: {e}"
+        else:
+            try:
+                self.monitor.close()
+            except Exception:
+                pass
+            msg = f"Connection failed: {str(e) or 'SSH connection failed'}"
+        with self.lock:
+            first = not self.last_error
+            self.last_error = msg
+            self.errors += 1
+            self.generation += 1
+            self.snapshot = None
+            self.down_bps = self.up_bps = None
+            self.burst = None
+            self.talkers = []
+            self.link_status = "unknown"
+        # Notify once per outage
+        if first and self.on_error:
+            try:
+                self.on_error(self)
+            except Exception:
+                pass
+
+    def _finish(self):
+        # End of a replay: not an error, and terminal. The last rates stay on show
+        with self.lock:
+            self.last_error = "Replay finished"
+            self.link_status = "unknown"
+            self.generation += 1
+        if self.on_error:
+            try:
+                self.on_error(self)
+            except Exception:
+                pass
+        self.finished.set()
+
+
+class PollScheduler:
+    """Drives every APPoller from one shared clock.
+
+    With SAMPLER=poll, ticks run on a thread pool and are staggered evenly across
+    POLL_INTERVAL so a fleet never polls in one burst. An AP whose previous tick is
+    still running skips its slot instead of queueing, so a slow or dead AP never
+    delays anyone else. With SAMPLER=stream, burst or agent each poller reads its own
+    remote loop.
+    Every AP starts connecting right away, and is polled as soon as its connection
+    comes up rather than at its next slot. Top talkers are refreshed on a clock and
+    pool of their own, so a slow station dump never delays a sample.
+    """
+
+    def __init__(self, pollers, interval):
+        self.pollers = list(pollers)
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self._thread = None
+        self._wake = threading.Event()
+        self._ready = set()  # indexes of pollers that just connected
+
+    def start(self):
+        for i, poller in enumerate(self.pollers):
+            conn = poller.monitor.conn
+            conn.on_change = lambda i=i, conn=conn: self._conn_changed(i, conn)
+            conn.request()
+            if LINK_WATCH:
+                poller.monitor.watch_links(poller._links_changed)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        if TOP_TALKERS > 0 and any(p.monitor.has_stations for p in self.pollers):
+            threading.Thread(target=self._run_stations, daemon=True).start()
+
+    def _conn_changed(self, i, conn):
+        if conn.state == "connected":
+            self._ready.add(i)
+            self._wake.set()
+
+    def stop(self):
+        self.stop_event.set()
+        self._wake.set()
+        for poller in self.pollers:
+            try:
+                poller.monitor.shutdown()
+            except Exception:
+                pass
+
+    def _run_stations(self):
+        pollers = [p for p in self.pollers if p.monitor.has_stations]
+        pool = ThreadPoolExecutor(max_workers=min(len(pollers), 4), thread_name_prefix="stations")
+        running = {}
+        try:
+            while not self.stop_event.is_set():
+                for poller in pollers:
+                    # Only APs that are sampling; a dump still running skips this round
+                    busy = running.get(poller.name)
+                    if poller.snapshot is not None and (busy is None or busy.done()):
+                        running[poller.name] = pool.submit(poller.poll_stations)
+                self.stop_event.wait(TOP_TALKERS_INTERVAL)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        # Replays always stream so they keep the recorded pace
+        if SAMPLER in ("stream", "burst", "agent") or REPLAY:
+            for poller in self.pollers:
+                threading.Thread(target=poller.run_stream, args=(self.stop_event,), daemon=True).start()
+            return
+        n = len(self.pollers)
+        pool = ThreadPoolExecutor(max_workers=max(n, 1), thread_name_prefix="poll")
+        start = time.monotonic()
+        due = [start + i * self.interval / n for i in range(n)]
+        running = [None] * n
+        try:
+            while not self.stop_event.is_set():
+                now = time.monotonic()
+                while self._ready:
+                    i = self._ready.pop()
+                    due[i] = min(due[i], now)
+                for i, poller in enumerate(self.pollers):
+                    if now < due[i]:
+                        continue
+                    # Nothing to read while the first connect is still running
+                    connecting = poller.monitor.conn.state == "connecting"
+                    if not connecting and (running[i] is None or running[i].done()):
+                        running[i] = pool.submit(poller.tick)
+                    # Skip missed slots instead of bursting to catch up
+                    while due[i] <= now:
+                        due[i] += self.interval
+                self._wake.wait(max(0.0, min(due) - time.monotonic()))
+                self._wake.clear()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _load_json_config(path, default_name):
+    """Return the parsed JSON of `path`, or of default_name in the CWD or next to the
+    script/EXE; None if there is none."""
+    if path:
+        paths = [Path(path)]
+    else:
+        app_dir = Path(sys.executable).parent if getattr(sys, "frozen", False) else Path(__file__).resolve().parent
+        paths = [Path.cwd() / default_name, app_dir / default_name]
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8-sig") as f:
+                return json.load(f)
+        except Exception:
+            continue
+    return None
+
+
+def load_actions():
+    """Return {name: command} from ACTIONS_FILE or commands.json ({} if none)."""
+    actions = _load_json_config(ACTIONS_FILE, "commands.json")
+    try:
+        return {str(k): str(v) for k, v in actions.items() if str(v).strip()}
+    except Exception:
+        return {}
+
+
+def action_label(name):
+    return name.replace("_", " ").capitalize()
+
+
+class ActionExecutor:
+    """Runs remote actions (commands.json) without touching the sampling path.
+
+    Requests are queued on a small thread pool and each runs on its own SSH channel
+    with ACTION_TIMEOUT, so the caller never waits. on_result(poller, name, ok,
+    message) is called from the worker thread when an action finishes. Asking for
+    an action that is already queued or running on the same AP is ignored.
+    """
+
+    def __init__(self, actions, on_result=None, timeout=ACTION_TIMEOUT, workers=2):
+        self.actions = actions
+        self.on_result = on_result
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="action")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def submit(self, poller, name, iface=None):
+        """Queue action `name` on poller's AP; returns a Future, or None if already pending.
+
+        iface fills {iface} instead of the poller's current interface.
+        """
+        key = (poller.name, name)
+        with self._lock:
+            if key in self._pending:
+                return None
+            self._pending.add(key)
+        try:
+            future = self._pool.submit(self._run, poller, name, iface)
+        except RuntimeError:
+            # Stopped: nothing will ever run it
+            self._release(key)
+            return None
+        # Also covers futures cancelled by stop() before _run started
+        future.add_done_callback(lambda _f: self._release(key))
+        return future
+
+    def _release(self, key):
+        with self._lock:
+            self._pending.discard(key)
+
+    def iface_for(self, poller, name, iface=None):
+        """Return the interface action `name` acts on (iface, else the poller's current
+        one), or None if it has no {iface}. Raises ValueError if there's no single one."""
+        if "{iface}" not in self.actions[name]:
+            return None
+        if iface is None:
+            if poller.matcher.aggregate or poller._auto_pending():
+                raise ValueError("needs a single INTERFACE")
+            iface = poller.iface
+        return iface
+
+    def _run(self, poller, name, iface=None):
+        t0 = time.monotonic()
+        try:
+            cmd = self.actions[name]
+            iface = self.iface_for(poller, name, iface)
+            if iface is not None:
+                # The name may come from the AP (auto-detect): never let the shell parse it
+                cmd = cmd.replace("{iface}", shlex.quote(iface))
+            status, out = poller.monitor.run_action(cmd, self.timeout)
+            took = time.monotonic() - t0
+            if status is None:
+                ok, message = True, f"sent, connection closed after {took:.0f}s"
+            elif status == 0:
+                ok, message = True, f"done in {took:.1f}s"
+            else:
+                tail = out.strip().splitlines()[-1:] or [""]
+                ok, message = False, f"exit {status}" + (f": {tail[0][:80]}" if tail[0] else "")
+        except Exception as e:
+            ok, message = False, str(e) or type(e).__name__
+        finally:
+            self._release((poller.name, name))
+        if self.on_result:
+            try:
+                self.on_result(poller, name, ok, message)
+            except Exception:
+                pass
+        return ok, message
 
-# Optional tray support
-try:
-    import pystray
-    from PIL import Image, ImageDraw, ImageFont
-    HAS_TRAY = True
-except Exception:
-    HAS_TRAY = False
+    def stop(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
 
 
-"""AP-only configuration (router is ignored).
+class SlidingWindow:
+    """Min, max and mean of the values seen in the last `span` seconds.
 
-Set these in .env (dist/.env when running the EXE):
-  AP_HOST, AP_USER, AP_PASSWORD/AP_SSH_KEY, INTERFACE (or INTERFACE=auto)
-"""
+    Monotonic deques keep the extremes, a running sum the mean, so each add is
+    O(1) amortized however long the window. `since` is the time of the first value
+    after the last reset, so callers can tell whether the window is fully covered.
+    """
 
-# AP connection
-AP_HOST = os.getenv("AP_HOST", os.getenv("ROUTER_HOST", "192.168.1.1"))
-AP_USER = os.getenv("AP_USER", os.getenv("ROUTER_USER", "admin"))
-AP_PASSWORD = os.getenv("AP_PASSWORD", os.getenv("PASSWORD", ""))
-AP_SSH_KEY = (os.getenv("AP_SSH_KEY", os.getenv("SSH_KEY", "")) or None)
-AP_PORT = int(os.getenv("AP_PORT", os.getenv("ROUTER_PORT", "22")))
+    def __init__(self, span):
+        self.span = span
+        self.reset()
 
-# Monitoring
-INTERFACE = os.getenv("INTERFACE", "auto").strip()  # "auto" picks the busiest iface on the AP
-# When monitoring from the AP's LAN perspective, the data flowing "down" to clients
-# is TX on the client-facing interface(s). Set LAN_PERSPECTIVE=1 to swap directions
-# so Down=TX and Up=RX on the chosen interface/pattern.
-LAN_PERSPECTIVE = os.getenv("LAN_PERSPECTIVE", "0") in ("1", "true", "True")
-POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "1.0"))  # seconds
-ALWAYS_ON_TOP = os.getenv("ALWAYS_ON_TOP", "0") in ("1", "true", "True")
-START_MINIMIZED = os.getenv("START_MINIMIZED", "0") in ("1", "true", "True")
-TEXT_OVERLAY = os.getenv("TEXT_OVERLAY", "1") in ("1", "true", "True")
+    def reset(self):
+        self.values = collections.deque()  # (ts, value)
+        self._min = collections.deque()  # increasing values
+        self._max = collections.deque()  # decreasing values
+        self.total = 0.0
+        self.since = None
 
+    def add(self, ts, value):
+        if self.since is None:
+            self.since = ts
+        self.values.append((ts, value))
+        self.total += value
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((ts, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((ts, value))
+        cutoff = ts - self.span
+        values = self.values
+        while values[0][0] < cutoff:
+            self.total -= values.popleft()[1]
+        while self._min[0][0] < cutoff:
+            self._min.popleft()
+        while self._max[0][0] < cutoff:
+            self._max.popleft()
 
-class APMonitor:
-    def __init__(self, host, user, password=None, key_filename=None):
-        self.host = host
-        self.user = user
-        self.password = password
-        self.key_filename = key_filename
-        self._ssh = None
-        self._lock = threading.Lock()
+    def covered(self, ts):
+        """True once values have been added for at least `span` seconds."""
+        return self.since is not None and ts - self.since >= self.span
 
-    def connect(self):
-        with self._lock:
-            if self._ssh:
-                return
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(
-                self.host,
-                port=AP_PORT,
-                username=self.user,
-                password=self.password,
-                key_filename=self.key_filename,
-                timeout=15,
-                banner_timeout=15,
-                auth_timeout=15,
-                look_for_keys=False,
-                allow_agent=False,
-            )
-            self._ssh = ssh
+    def min(self):
+        return self._min[0][1]
 
-    def close(self):
-        with self._lock:
-            if self._ssh:
-                try:
-                    self._ssh.close()
-                finally:
-                    self._ssh = None
+    def max(self):
+        return self._max[0][1]
 
-    def _ensure(self):
-        if not self._ssh:
-            self.connect()
+    def avg(self):
+        return self.total / len(self.values)
 
-    def read_counters(self, iface):
-        """Return (rx_bytes, tx_bytes) for iface, or (None, None)."""
-        self._ensure()
-        with self._lock:
-            _, stdout, _ = self._ssh.exec_command("cat /proc/net/dev 2>/dev/null || true")
-            data = stdout.read().decode(errors="ignore")
-        target = iface + ":"
-        for line in data.splitlines():
-            line = line.strip()
-            if not line or ":" not in line:
-                continue
-            name, rest = line.split(":", 1)
-            if name.strip() != iface:
-                continue
-            parts = rest.split()
-            if not parts:
-                continue
+
+class AlertRule:
+    """One threshold rule from ALERTS_FILE, e.g.
+
+    {"name": "4g_stalled", "metric": "down", "below": 51200, "for": 60, "link": "up",
+     "action": "reconnect_4g"}
+
+    fires when the AP's down rate stayed under 50 KB/s for 60 s while the link was up.
+    `above` is the opposite test; `agg` picks what must cross the threshold over the
+    window (default: every sample, i.e. max for below and min for above; or avg).
+    `clear` seconds of the condition not holding resolve the alert (debounce), and it
+    fires again at most every `cooldown` seconds while it keeps holding. `ap` limits
+    the rule to one AP of a fleet, `action` runs a commands.json action when it fires.
+    An action using {iface} needs the rule's own `iface`: the monitored interface may
+    have been picked by auto-detect, or be the LAN side.
+    """
+
+    METRICS = ("down", "up", "total")
+
+    def __init__(self, spec):
+        self.metric = str(spec.get("metric", "down"))
+        if self.metric not in self.METRICS:
+            raise ValueError(f"metric must be one of {', '.join(self.METRICS)}")
+        if ("below" in spec) == ("above" in spec):
+            raise ValueError("needs exactly one of below/above")
+        self.below = "below" in spec
+        self.threshold = float(spec["below" if self.below else "above"])
+        self.duration = max(0.0, float(spec.get("for", 0)))
+        self.agg = str(spec.get("agg", "max" if self.below else "min"))
+        if self.agg not in ("min", "max", "avg"):
+            raise ValueError("agg must be min, max or avg")
+        self.link = spec.get("link")
+        if self.link not in (None, "up", "down"):
+            raise ValueError("link must be up or down")
+        self.clear = max(0.0, float(spec.get("clear", 10)))
+        self.cooldown = max(0.0, float(spec.get("cooldown", 600)))
+        self.ap = spec.get("ap")
+        self.action = spec.get("action") or None
+        self.iface = spec.get("iface") or None
+        op = "<" if self.below else ">"
+        self.name = str(spec.get("name") or f"{self.metric} {op} {format_rate_bytes_per_sec(self.threshold)}")
+
+    def value(self, down, up):
+        if self.metric == "down":
+            return down
+        if self.metric == "up":
+            return up
+        return down + up
+
+    def holds(self, window):
+        level = getattr(window, self.agg)()
+        return level < self.threshold if self.below else level > self.threshold
+
+    def describe(self, window):
+        level = format_rate_bytes_per_sec(getattr(window, self.agg)())
+        span = f" for {self.duration:g}s" if self.duration else ""
+        return f"{self.metric} {level}{span}"
+
+
+class _AlertState:
+    __slots__ = ("window", "active", "fired_at", "false_since")
+
+    def __init__(self, rule):
+        self.window = SlidingWindow(rule.duration)
+        self.active = False
+        self.fired_at = None
+        self.false_since = None
+
+
+def load_alert_rules(actions=None):
+    """Return the valid AlertRules from ALERTS_FILE or alerts.json ([] if none).
+
+    Invalid rules and unknown actions are reported and left out.
+    """
+    specs = _load_json_config(ALERTS_FILE, "alerts.json")
+    if isinstance(specs, dict):
+        specs = specs.get("rules", [])
+    rules = []
+    for i, spec in enumerate(specs or []):
+        try:
+            rule = AlertRule(spec)
+        except Exception as e:
+            print(f"Alert rule {i + 1} ignored: {e}", flush=True)
+            continue
+        if rule.action and rule.action not in (actions or {}):
+            print(f"Alert rule {rule.name}: unknown action {rule.action}", flush=True)
+            rule.action = None
+        elif rule.action and "{iface}" in actions[rule.action] and not rule.iface:
+            print(f"Alert rule {rule.name}: action {rule.action} needs \"iface\" in the rule", flush=True)
+            rule.action = None
+        rules.append(rule)
+    return rules
+
+
+class AlertEngine:
+    """Evaluates AlertRules on every sample, off the sampling and Tk threads.
+
+    feed(poller) is meant for APPoller.on_update and only queues the latest rates, so
+    rules never delay sampling or rendering; a worker thread keeps one SlidingWindow
+    per AP and rule. on_alert(poller, rule, firing, message) is called from that
+    thread when an alert fires or resolves; firing alerts also submit the rule's
+    action to `executor`. A gap in the samples (errors, reconnects) restarts the windows.
+    """
+
+    def __init__(self, rules, on_alert=None, executor=None, gap=None):
+        self.rules = rules
+        self.on_alert = on_alert
+        self.executor = executor
+        self.gap = gap or max(5.0, POLL_INTERVAL * 3)
+        self._queue = queue.SimpleQueue()
+        self._states = {}  # poller name -> [(rule, _AlertState)]
+        self._last = {}  # poller name -> ts of the last sample
+        self._thread = None
+
+    def start(self):
+        if self.rules:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def feed(self, poller):
+        if self._thread:
+            with poller.lock:
+                self._queue.put((poller, poller.sample_ts, poller.down_bps, poller.up_bps, poller.link_status))
+
+    def active(self):
+        """Return [(poller name, rule)] of the alerts currently firing."""
+        return [
+            (name, rule) for name, states in list(self._states.items())
+            for rule, state in states if state.active
+        ]
+
+    def stop(self):
+        if self._thread:
+            self._queue.put(None)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            t0 = time.perf_counter()
             try:
-                rx_bytes = int(parts[0])
-                tx_bytes = int(parts[8]) if len(parts) > 8 else int(parts[-1])
-                return rx_bytes, tx_bytes
+                self.evaluate(*item)
             except Exception:
-                continue
-        return None, None
+                pass
+            if STAGES:
+                STAGES.add("alerts", time.perf_counter() - t0)
 
-    def read_all_counters(self):
-        """Return dict{name:(rx_bytes, tx_bytes)} parsed from /proc/net/dev (excludes 'lo')."""
-        self._ensure()
-        with self._lock:
-            _, stdout, _ = self._ssh.exec_command("cat /proc/net/dev 2>/dev/null || true")
-            data = stdout.read().decode(errors="ignore")
-        result = {}
-        for line in data.splitlines():
-            line = line.strip()
-            if not line or ":" not in line:
-                continue
-            name, rest = line.split(":", 1)
-            name = name.strip()
-            if name == "lo":
-                continue
-            parts = rest.split()
-            if len(parts) < 2:
-                continue
+    def evaluate(self, poller, ts, down, up, link):
+        """Check every rule against one sample (normally called by the worker thread)."""
+        if ts is None or down is None:
+            return
+        states = self._states.get(poller.name)
+        if states is None:
+            states = self._states[poller.name] = [
+                (rule, _AlertState(rule)) for rule in self.rules if rule.ap in (None, poller.name)
+            ]
+        last = self._last.get(poller.name)
+        if ts == last:
+            # A pushed link change between samples (LINK_WATCH): just drop the windows
+            # of link rules it invalidates
+            for rule, state in states:
+                if rule.link and link != rule.link:
+                    state.window.reset()
+            return
+        self._last[poller.name] = ts
+        restart = last is None or ts - last > self.gap
+        for rule, state in states:
+            window = state.window
+            if restart or (rule.link and link != rule.link):
+                window.reset()
+            if not rule.link or link == rule.link:
+                window.add(ts, rule.value(down, up))
+            if window.covered(ts) and rule.holds(window):
+                state.false_since = None
+                if state.fired_at is None or ts - state.fired_at >= rule.cooldown:
+                    state.active = True
+                    state.fired_at = ts
+                    self._fire(poller, rule, True, rule.describe(window))
+            elif state.active:
+                if state.false_since is None:
+                    state.false_since = ts
+                if ts - state.false_since >= rule.clear:
+                    state.active = False
+                    state.false_since = None
+                    self._fire(poller, rule, False, "resolved")
+
+    def _fire(self, poller, rule, firing, message):
+        if firing and rule.action and self.executor:
+            self.executor.submit(poller, rule.action, rule.iface)
+            message += f", running {action_label(rule.action)}"
+        if self.on_alert:
             try:
-                rx_bytes = int(parts[0])
-                tx_bytes = int(parts[8]) if len(parts) > 8 else int(parts[-1])
-                result[name] = (rx_bytes, tx_bytes)
+                self.on_alert(poller, rule, firing, message)
             except Exception:
-                continue
-        return result
+                pass
 
-    def read_link_status(self, iface):
-        """Return 'up', 'down', or 'unknown' for interface link status on the AP."""
-        self._ensure()
+
+def open_history_store():
+    """Return a started HistoryStore when HISTORY_DIR is set, else None."""
+    if not HISTORY_DIR:
+        return None
+    try:
+        store = HistoryStore(HISTORY_DIR)
+        store.start()
+        return store
+    except Exception:
+        return None
+
+
+def build_pollers(store=None, on_update=None, on_iface=None, on_error=None):
+    """Return one APPoller per configured AP (see load_fleet), or per REPLAY file."""
+    callbacks = dict(on_update=on_update, on_iface=on_iface, on_error=on_error, store=store)
+    if REPLAY:
+        # Replayed samples stay out of the persistent history
+        callbacks["store"] = None
+        return replay_pollers([p.strip() for p in REPLAY.split(",") if p.strip()], **callbacks)
+    pollers = []
+    for ap in load_fleet():
+        monitor = open_monitor(ap)
+        if RECORD_DIR:
+            monitor.recorder = open_recorder(ap)
+        pollers.append(APPoller(ap["name"], monitor, ap["iface"], **callbacks))
+    return pollers
+
+
+def _prom_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsExporter:
+    """Serves the pollers' latest state in Prometheus text format at /metrics.
+
+    Scrapes only read what the sampling threads already cached: the body is rendered
+    at most once per change of a poller or its connection (see their generation) and
+    shared by every concurrent scraper, so a scrape never causes an SSH round trip.
+    """
+
+    def __init__(self, pollers, bind="0.0.0.0", port=9464):
+        self.pollers = pollers
+        self.bind = bind
+        self.port = port
+        self._lock = threading.Lock()
+        self._key = None
+        self._body = b""
+        self._server = None
+
+    def render(self):
+        key = tuple((p.generation, p.monitor.conn.generation) for p in self.pollers)
         with self._lock:
-            try:
-                cmd = f"cat /sys/class/net/{iface}/operstate 2>/dev/null || true"
-                _, stdout, _ = self._ssh.exec_command(cmd)
-                s = stdout.read().decode(errors="ignore").strip().lower()
-                if s in ("up", "down", "dormant", "unknown"):
-                    return "up" if s == "up" else ("down" if s == "down" else "unknown")
-            except Exception:
+            if key != self._key:
+                self._body = self._render().encode()
+                self._key = key
+            return self._body
+
+    def _render(self):
+        out = []
+
+        def metric(name, kind, help_text, rows):
+            out.append(f"# HELP traffic_widget_{name} {help_text}")
+            out.append(f"# TYPE traffic_widget_{name} {kind}")
+            for labels, value in rows:
+                lbl = ",".join(f'{k}="{_prom_label(v)}"' for k, v in labels.items())
+                out.append(f"traffic_widget_{name}{{{lbl}}} {value:.17g}")
+
+        states = [(p, p.state(), p.snapshot) for p in self.pollers]
+        metric("ap_up", "gauge", "1 if the last sample from the AP succeeded.", [
+            ({"ap": p.name}, 0 if st[3] or snap is None else 1) for p, st, snap in states
+        ])
+        metric("down_bytes_per_second", "gauge", "Down rate of the monitored interface spec.", [
+            ({"ap": p.name, "interface": p.iface}, st[0]) for p, st, _ in states if st[0] is not None
+        ])
+        metric("up_bytes_per_second", "gauge", "Up rate of the monitored interface spec.", [
+            ({"ap": p.name, "interface": p.iface}, st[1]) for p, st, _ in states if st[1] is not None
+        ])
+        metric("link_up", "gauge", "Link state of the monitored interface spec (1 up, 0 down).", [
+            ({"ap": p.name, "interface": p.iface}, 1 if st[2] == "up" else 0)
+            for p, st, _ in states if st[2] in ("up", "down")
+        ])
+        metric("ssh_command_seconds", "gauge", "Smoothed round trip of SSH commands to the AP.", [
+            ({"ap": p.name}, p.monitor.conn.rtt_ms / 1000) for p, _, _ in states if p.monitor.conn.rtt_ms is not None
+        ])
+        metric("ssh_connect_failures", "gauge", "Consecutive failed SSH connection attempts.", [
+            ({"ap": p.name}, p.monitor.conn.failures) for p, _, _ in states
+        ])
+        bursts = [(p, p.burst_state()) for p, _, _ in states]
+        bursts = [(p, b) for p, b in bursts if b]
+        if bursts:
+            for i, (name, what) in enumerate((
+                ("down_peak_bytes_per_second", "Peak sub-second down rate over the last interval (SAMPLER=burst)."),
+                ("up_peak_bytes_per_second", "Peak sub-second up rate over the last interval (SAMPLER=burst)."),
+                ("down_p95_bytes_per_second", "95th percentile of sub-second down rates over BURST_P95_WINDOW."),
+                ("up_p95_bytes_per_second", "95th percentile of sub-second up rates over BURST_P95_WINDOW."),
+            )):
+                metric(name, "gauge", what, [({"ap": p.name, "interface": p.iface}, b[i]) for p, b in bursts])
+        station_rows = []
+        for p, _, _ in states:
+            for name, vap, d, u in p.talkers_state():
+                station_rows.append(({"ap": p.name, "interface": vap, "station": name}, d, u))
+        if station_rows:
+            metric("station_down_bytes_per_second", "gauge", "Download rate of the top talkers (TOP_TALKERS).", [
+                (labels, d) for labels, d, _ in station_rows
+            ])
+            metric("station_up_bytes_per_second", "gauge", "Upload rate of the top talkers (TOP_TALKERS).", [
+                (labels, u) for labels, _, u in station_rows
+            ])
+        rx_rows, tx_rows, oper_rows = [], [], []
+        for p, _, snap in states:
+            if snap is None:
+                continue
+            _, allc, links = snap
+            for name, (rx, tx) in allc.items():
+                rx_rows.append(({"ap": p.name, "interface": name}, rx))
+                tx_rows.append(({"ap": p.name, "interface": name}, tx))
+            for name, state in links.items():
+                if state in ("up", "down"):
+                    oper_rows.append(({"ap": p.name, "interface": name}, 1 if state == "up" else 0))
+        metric("receive_bytes_total", "counter", "Bytes received per AP interface (/proc/net/dev).", rx_rows)
+        metric("transmit_bytes_total", "counter", "Bytes transmitted per AP interface (/proc/net/dev).", tx_rows)
+        metric("interface_oper_up", "gauge", "Interface operstate per AP interface (1 up, 0 down).", oper_rows)
+        return "\n".join(out) + "\n"
+
+    def start(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = exporter.render()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
                 pass
+
+        self._server = ThreadingHTTPServer((self.bind, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self._server:
             try:
-                cmd = f"ip link show {iface} 2>/dev/null || true"
-                _, stdout, _ = self._ssh.exec_command(cmd)
-                out = stdout.read().decode(errors="ignore")
-                if " state UP" in out or "<UP," in out:
-                    return "up"
-                if " state DOWN" in out:
-                    return "down"
+                self._server.shutdown()
+                self._server.server_close()
             except Exception:
                 pass
-        return "unknown"
+
+
+def start_metrics_exporter(pollers):
+    """Return a started MetricsExporter when METRICS_PORT is set, else None."""
+    if not METRICS_PORT:
+        return None
+    try:
+        exporter = MetricsExporter(pollers, METRICS_BIND, METRICS_PORT)
+        exporter.start()
+        return exporter
+    except Exception as e:
+        print(f"Metrics exporter disabled: {e}", flush=True)
+        return None
+
+
+def start_instrument_dump():
+    if STAGES and INSTRUMENT_DUMP:
+        STAGES.start_dump(INSTRUMENT_DUMP, INSTRUMENT_DUMP_INTERVAL)
+
+
+def run_headless():
+    """Poll without any window; state is served by the metrics exporter."""
+    store = open_history_store()
+
+    def on_error(poller):
+        print(f"{poller.name}: {poller.state()[3]}", flush=True)
+
+    def on_action_result(poller, name, ok, message):
+        print(f"{poller.name}: {action_label(name)}: {message}", flush=True)
+
+    def on_alert(poller, rule, firing, message):
+        print(f"{poller.name}: alert {rule.name}: {message}", flush=True)
+
+    actions = ActionExecutor(load_actions(), on_result=on_action_result)
+    alerts = AlertEngine(load_alert_rules(actions.actions), on_alert=on_alert, executor=actions).start()
+    pollers = build_pollers(store, on_update=alerts.feed, on_error=on_error)
+    scheduler = PollScheduler(pollers, POLL_INTERVAL)
+    scheduler.start()
+    exporter = start_metrics_exporter(pollers)
+    start_instrument_dump()
+    print(
+        f"Polling {len(pollers)} AP(s) every {POLL_INTERVAL:g}s"
+        + (f"; metrics on http://{METRICS_BIND}:{METRICS_PORT}/metrics" if exporter else ""),
+        flush=True,
+    )
+    try:
+        # Live APs never finish; replays return once every recording is played
+        while not all(p.finished.wait(1) for p in pollers):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if exporter:
+            exporter.stop()
+        scheduler.stop()
+        alerts.stop()
+        actions.stop()
+        if store:
+            store.stop()
 
 
 def format_rate_bytes_per_sec(bps):
@@ -185,13 +3391,21 @@ def format_rate_bytes_per_sec(bps):
 
 class App:
     def __init__(self):
-        self.monitor = APMonitor(AP_HOST, AP_USER, AP_PASSWORD or None, AP_SSH_KEY)
-        self.iface = INTERFACE
+        self.store = open_history_store()
+        self.pollers = build_pollers(
+            self.store,
+            on_update=self._on_poller_update,
+            on_iface=self._on_poller_iface,
+            on_error=self._on_poller_error,
+        )
+        self.fleet = len(self.pollers) > 1
 
         # UI
         self.root = tk.Tk()
-        self.root.title("Live Traffic (AP)")
-        self.root.geometry("260x150")
+        self.root.title(f"Live Traffic ({len(self.pollers)} APs)" if self.fleet else "Live Traffic (AP)")
+        height = 195 + (34 if SAMPLER == "burst" else 0)
+        self._size = (300, height + 20 * len(self.pollers)) if self.fleet else (260, height)
+        self.root.geometry("{}x{}".format(*self._size))
         self.root.resizable(False, False)
         try:
             self.root.attributes("-topmost", ALWAYS_ON_TOP)
@@ -203,6 +3417,19 @@ class App:
         self.lbl_rx.pack(pady=(10, 2))
         self.lbl_tx.pack(pady=(0, 6))
 
+        # Peak and p95 of the sub-second rates (SAMPLER=burst)
+        self.lbl_peak = None
+        if SAMPLER == "burst":
+            self.lbl_peak = tk.Label(self.root, text="Peak --\np95  --", font=("Segoe UI", 9), fg="#666666", justify=tk.LEFT)
+            self.lbl_peak.pack(pady=(0, 4))
+
+        # Rate history (totals across APs in fleet mode) and its sparkline
+        self.history = RateHistory(HISTORY_SIZE)
+        self._history_seq = 0
+        self._history_pushed = 0.0
+        self.spark = Sparkline(self.root, 240, 40, 60, self.root.cget("bg"), "blue", "green")
+        self.spark.canvas.pack(pady=(0, 6))
+
         # Controls row (place early so it's always visible)
         controls = tk.Frame(self.root)
         controls.pack(pady=(0, 4))
@@ -227,17 +3454,52 @@ class App:
         self._status_item = self.status_dot.create_oval(1, 1, 11, 11, fill="#999999", outline="")
         self.status_dot.pack(pady=(0, 6))
 
-        # Connection error message (shown in red when SSH fails)
-        self.lbl_err = tk.Label(self.root, text="", font=("Segoe UI", 10), fg="#e74c3c")
+        # Connection status line (red error while SSH is down, gray state/latency otherwise)
+        self.lbl_err = tk.Label(self.root, text="connecting...", font=("Segoe UI", 10), fg="#999999")
         self.lbl_err.pack(pady=(0, 4))
 
-        
+        # Per-AP rows in fleet mode
+        self.ap_rows = []
+        if self.fleet:
+            rows = tk.Frame(self.root)
+            rows.pack(fill=tk.X, padx=8)
+            for poller in self.pollers:
+                lbl = tk.Label(rows, text=f"{poller.name}: --", font=("Segoe UI", 9), anchor="w", fg="#999999")
+                lbl.pack(fill=tk.X)
+                self.ap_rows.append(lbl)
+
+        # Top talkers panel, added once an AP reports stations
+        self.talker_rows = []
+
+        # All-interfaces table (IFACE_TABLE), added once the first rates are in
+        self.iface_rows = []
+        self._iface_heads = {}
+        self._iface_sort = "down"
+
+        # Remote actions from commands.json: right-click menu and tray submenu
+        self.actions = ActionExecutor(load_actions(), on_result=self._on_action_result)
+        self._action_note = None  # (text, color, shown until) in the status line
+        self._action_menu = None
+        if self.actions.actions:
+            self.root.bind("<Button-3>", self._popup_actions)
+
+        # Alert rules from alerts.json, checked on their own thread; they notify in
+        # the status line, tray and overlay and may run one of the actions above
+        self.alerts = AlertEngine(
+            load_alert_rules(self.actions.actions), on_alert=self._on_alert, executor=self.actions
+        )
 
-        # Tray icon
+        # Tray icon (started with its imports once the window is up)
         self.tray = None
-        if HAS_TRAY:
-            self.tray = TrayManager(self.show_window, self.exit_app, on_toggle_overlay=self.toggle_overlay, on_toggle_topmost=self.toggle_topmost)
-            self.tray.start(title="Traffic", down_text="--", up_text="--")
+        if tray_available():
+            self.tray = TrayManager(
+                self.show_window,
+                self.exit_app,
+                on_toggle_overlay=self.toggle_overlay,
+                on_toggle_topmost=self.toggle_topmost,
+                on_debug=(lambda: self.root.after(0, self.toggle_debug)) if STAGES else None,
+                actions=self._action_items() if self.actions.actions else None,
+            )
 
         # Overlay (persistent until explicitly hidden)
         self.overlay = TextOverlay(self.root)
@@ -247,19 +3509,25 @@ class App:
             except Exception:
                 pass
 
-        # State
-        self.prev = None  # (rx, tx, t)
-        self.lock = threading.Lock()
-        self.down_bps = None
-        self.up_bps = None
-        self.link_status = "unknown"
-        self.stop_event = threading.Event()
-        self._error_shown = False
-        self._last_error_text = ""
+        # UI refresh state (see request_ui)
+        self._ui_lock = threading.Lock()
+        self._ui_pending = False
+        self._ui_last = 0.0
+        self._ui_requested = 0.0
+        self._rendered = {}  # widget key -> options last applied
+        if IFACE_TABLE > 0 and importlib.util.find_spec("numpy") is None:
+            self._note("IFACE_TABLE needs numpy (pip install numpy)", "#e67e22", 30)
+
+        # Stage timings window (INSTRUMENT=1)
+        self._debug = None
+        if STAGES:
+            self.root.bind("<F12>", lambda e: self.toggle_debug())
 
-        # Start polling thread
-        self.thread = threading.Thread(target=self.poll_loop, daemon=True)
-        self.thread.start()
+        # Polling, the tray and their imports start after the first paint (see _start)
+        self.scheduler = PollScheduler(self.pollers, POLL_INTERVAL)
+        self.exporter = None
+        self._closing = False
+        self.root.after_idle(self._start)
 
         if START_MINIMIZED:
             try:
@@ -267,30 +3535,166 @@ class App:
             except Exception:
                 pass
 
+    def _start(self):
+        # Idle callbacks run after the pending redraws, so the window has painted
+        # its "connecting..." state by now; the connect and the auto-detect follow
+        # from the first poll, paramiko/requests are imported by the connect thread
+        if self._closing:
+            return
+        self.alerts.start()
+        self.scheduler.start()
+        self.exporter = start_metrics_exporter(self.pollers)
+        start_instrument_dump()
+        if self.tray:
+            threading.Thread(target=self._start_tray, daemon=True).start()
+
+    def _start_tray(self):
+        # Pillow and pystray take a while to import; the window doesn't wait for them
+        if not load_tray():
+            self.tray = None
+            return
+        if not self._closing:
+            self.tray.start(title="Traffic", down_text="--", up_text="--")
+            self.request_ui()
+
     def toggle_topmost(self):
         try:
             self.root.attributes("-topmost", self.var_topmost.get())
         except Exception:
             pass
 
-    def update_ui(self):
-        with self.lock:
-            down = self.down_bps
-            up = self.up_bps
-            status = self.link_status
-            last_err = self._last_error_text
-        self.lbl_rx.config(text=f"Down: {format_rate_bytes_per_sec(down)}")
-        self.lbl_tx.config(text=f"Up:   {format_rate_bytes_per_sec(up)}")
-        # Status dot color
-        color = "#2ecc71" if status == "up" else ("#e74c3c" if status == "down" else "#999999")
+    def _on_poller_update(self, poller):
+        self.alerts.feed(poller)
+        self.request_ui()
+
+    def _on_poller_iface(self, poller):
+        if self.fleet:
+            return
         try:
-            self.status_dot.itemconfig(self._status_item, fill=color)
+            self.root.after(0, lambda: self.root.title(f"Live Traffic (AP:{poller.iface})"))
         except Exception:
             pass
+
+    def _on_poller_error(self, poller):
+        # Failures show in the status line / per-AP rows; reconnects run in the background
+        self.request_ui()
+
+    def request_ui(self):
+        """Schedule a redraw from any thread; coalesces with one already pending and
+        keeps redraws at least UI_REFRESH_MS apart."""
+        with self._ui_lock:
+            if self._ui_pending:
+                return
+            self._ui_pending = True
+            self._ui_requested = time.perf_counter()
+            delay = self._ui_last + UI_REFRESH_MS / 1000.0 - time.monotonic()
+        try:
+            self.root.after(max(0, int(delay * 1000)), self._refresh_ui)
+        except Exception:
+            with self._ui_lock:
+                self._ui_pending = False
+
+    def _refresh_ui(self):
+        with self._ui_lock:
+            self._ui_pending = False
+            self._ui_last = time.monotonic()
+        if not STAGES:
+            self.update_ui()
+            return
+        # Enqueue-to-render includes the UI_REFRESH_MS rate limit
+        t0 = time.perf_counter()
+        STAGES.add("ui_wait", t0 - self._ui_requested)
+        self.update_ui()
+        STAGES.add("ui_render", time.perf_counter() - t0)
+
+    def _config(self, key, widget, **options):
+        # Reconfigure a widget only when what it shows changed
+        if self._rendered.get(key) != options:
+            widget.config(**options)
+            self._rendered[key] = options
+
+    def update_ui(self):
+        states = [p.state() for p in self.pollers]
+        known = [s for s in states if s[0] is not None]
+        down = sum(s[0] for s in known) if known else None
+        up = sum(s[1] for s in known) if known else None
+        status = combine_link_status(s[2] for s in states)
+        last_err = ""
+        for poller, (_, _, _, err) in zip(self.pollers, states):
+            if err:
+                last_err = f"{poller.name}: {err}" if self.fleet else err
+                break
+        note = self._action_note
+        if last_err:
+            err_color = "#e74c3c"
+        elif note and time.monotonic() < note[2]:
+            # Progress/result of a remote action
+            last_err, err_color = note[0], note[1]
+        else:
+            # No error: show connection state and command latency instead
+            err_color = "#999999"
+            if not self.fleet:
+                last_err = self.pollers[0].monitor.conn.describe()
+        self._config("rx", self.lbl_rx, text=f"Down: {format_rate_bytes_per_sec(down)}")
+        self._config("tx", self.lbl_tx, text=f"Up:   {format_rate_bytes_per_sec(up)}")
+        peak = None
+        if self.lbl_peak:
+            bursts = [b for b in (p.burst_state() for p in self.pollers) if b]
+            if bursts:
+                # Fleet: sum of per-AP peaks (an upper bound of the combined peak)
+                peak = [sum(b[i] for b in bursts) for i in range(4)]
+                self._config(
+                    "peak",
+                    self.lbl_peak,
+                    text=f"Peak {format_rate_bytes_per_sec(peak[0])} / {format_rate_bytes_per_sec(peak[1])}\n"
+                    f"p95  {format_rate_bytes_per_sec(peak[2])} / {format_rate_bytes_per_sec(peak[3])}",
+                )
+        self._push_history(down, up)
+        # Status dot color
+        color = "#2ecc71" if status == "up" else ("#e74c3c" if status == "down" else "#999999")
+        if self._rendered.get("dot") != color:
+            try:
+                self.status_dot.itemconfig(self._status_item, fill=color)
+                self._rendered["dot"] = color
+            except Exception:
+                pass
+        # Per-AP rows
+        for i, (poller, lbl, (d, u, st, err)) in enumerate(zip(self.pollers, self.ap_rows, states)):
+            try:
+                if err:
+                    conn = poller.monitor.conn
+                    text = f"{poller.name}: " + ("replay finished" if poller.finished.is_set() else "offline")
+                    if conn.state == "backoff" and conn.retry_at is not None:
+                        text += f" (retry in {max(0, conn.retry_at - time.monotonic()):.0f}s)"
+                    elif conn.state == "connecting":
+                        text += " (connecting)"
+                    self._config(("row", i), lbl, text=text, fg="#e74c3c")
+                else:
+                    row_color = "#2ecc71" if st == "up" else ("#e74c3c" if st == "down" else "#999999")
+                    self._config(
+                        ("row", i),
+                        lbl,
+                        text=f"{poller.name}: D {format_rate_bytes_per_sec(d)} | U {format_rate_bytes_per_sec(u)}",
+                        fg=row_color,
+                    )
+            except Exception:
+                pass
         # Tray update
         if self.tray:
             try:
-                self.tray.update(down or 0, up or 0)
+                title = None
+                if self.fleet:
+                    lines = [f"{len(known)}/{len(states)} APs | Down: {format_rate_bytes_per_sec(down)} | Up: {format_rate_bytes_per_sec(up)}"]
+                    for poller, (d, u, _, err) in zip(self.pollers, states):
+                        lines.append(f"{poller.name}: offline" if err else f"{poller.name}: {format_rate_bytes_per_sec(d)} / {format_rate_bytes_per_sec(u)}")
+                    # Windows caps tray tooltips at 128 characters
+                    title = "\n".join(lines)[:127]
+                elif peak:
+                    title = (
+                        f"Down: {format_rate_bytes_per_sec(down)} | Up: {format_rate_bytes_per_sec(up)}\n"
+                        f"Peak: {format_rate_bytes_per_sec(peak[0])} | {format_rate_bytes_per_sec(peak[1])}"
+                    )
+                self.tray.update(down or 0, up or 0, title=title)
             except Exception:
                 pass
         # Overlay update (always update text; visibility controlled by user)
@@ -298,141 +3702,156 @@ class App:
             dr = format_rate_bytes_per_sec(down)
             ur = format_rate_bytes_per_sec(up)
             pretty_status = {"up": "up", "down": "down"}.get(status, "unknown")
+            alerts = self.alerts.active()
+            alert = ", ".join(sorted({rule.name for _, rule in alerts})) or None
             if self.overlay:
-                self.overlay.set_text(dr, ur, status_text=pretty_status)
+                self.overlay.set_text(dr, ur, status_text=pretty_status, alert=alert)
         except Exception:
             pass
         # Error label
         try:
-            self.lbl_err.config(text=last_err)
+            self._config("err", self.lbl_err, text=last_err, fg=err_color)
         except Exception:
             pass
-
-    def poll_loop(self):
-        next_time = time.perf_counter()
-        # If INTERFACE is 'auto', detect the busiest iface on AP at startup
-        if not self.iface or self.iface.lower() == "auto":
-            try:
-                first = self.monitor.read_all_counters()
-                time.sleep(0.5)
-                second = self.monitor.read_all_counters()
-                best_name = None
-                best_delta = -1
-                for name, (rx1, tx1) in first.items():
-                    rx2, tx2 = second.get(name, (rx1, tx1))
-                    delta = max(rx2 - rx1, 0) + max(tx2 - tx1, 0)
-                    if delta > best_delta:
-                        best_delta = delta
-                        best_name = name
-                if best_name:
-                    self.iface = best_name
-                    try:
-                        self.root.after(0, lambda: self.root.title(f"Live Traffic (AP:{self.iface})"))
-                    except Exception:
-                        pass
-            except Exception:
-                pass
-        last_auto_check = time.monotonic()
-        while not self.stop_event.is_set():
-            try:
-                # Support aggregation: if INTERFACE contains ',' or '*' then sum matching ifaces
-                aggregate = ("," in self.iface) or ("*" in self.iface) or ("?" in self.iface)
-                if aggregate:
-                    allc = self.monitor.read_all_counters()
-                    total_rx = total_tx = 0
-                    for part in [p.strip() for p in self.iface.split(",") if p.strip()]:
-                        for name, (arx, atx) in allc.items():
-                            if fnmatch.fnmatchcase(name, part):
-                                total_rx += arx
-                                total_tx += atx
-                    rx, tx = total_rx, total_tx
-                else:
-                    rx, tx = self.monitor.read_counters(self.iface)
-                status = self.monitor.read_link_status(self.iface)
-                now = time.time()
-                if rx is not None and tx is not None:
-                    # Clear any previous error state
-                    if self._last_error_text:
-                        self._last_error_text = ""
-                        self._error_shown = False
-                    if self.prev is not None:
-                        prx, ptx, pt = self.prev
-                        dt = max(now - pt, 1e-6)
-                        drx = rx - prx
-                        dtx = tx - ptx
-                        if drx < 0 or dtx < 0:
-                            drx = dtx = 0
-                        # Map down/up depending on perspective
-                        if LAN_PERSPECTIVE:
-                            down_bps = dtx / dt  # AP transmits to clients
-                            up_bps = drx / dt    # AP receives from clients
-                        else:
-                            down_bps = drx / dt  # RX from WAN
-                            up_bps = dtx / dt
-                        if status not in ("up", "down") and (down_bps > 0 or up_bps > 0):
-                            status = "up"
-                        with self.lock:
-                            self.down_bps = down_bps
-                            self.up_bps = up_bps
-                            self.link_status = status or "unknown"
-                        try:
-                            self.root.after(0, self.update_ui)
-                        except Exception:
-                            pass
-                    self.prev = (rx, tx, now)
-
-                    # Periodic dynamic auto-detect: if speeds are very low but another iface is busy, switch
-                    if (time.monotonic() - last_auto_check) > 5.0:
-                        try:
-                            all1 = self.monitor.read_all_counters()
-                            time.sleep(0.25)
-                            all2 = self.monitor.read_all_counters()
-                            best_name = None
-                            best_delta = -1
-                            for name, (r1, t1) in all1.items():
-                                r2, t2 = all2.get(name, (r1, t1))
-                                d = max(r2 - r1, 0) + max(t2 - t1, 0)
-                                if d > best_delta:
-                                    best_delta = d
-                                    best_name = name
-                            # if current aggregate not used and observed delta is tiny while another iface busy -> switch
-                            current_delta = (drx + dtx)
-                            if not aggregate and best_name and best_delta > max(current_delta * 4, 200*1024):
-                                self.iface = best_name
-                                self.prev = None
-                                try:
-                                    self.root.after(0, lambda: self.root.title(f"Live Traffic (AP:{self.iface})"))
-                                except Exception:
-                                    pass
-                        except Exception:
-                            pass
-                        last_auto_check = time.monotonic()
-            except Exception as e:
+        if IFACE_TABLE > 0:
+            self._update_iface_table()
+        # Top talkers across APs
+        if TOP_TALKERS > 0:
+            talkers = []
+            for poller in self.pollers:
+                for name, _, d, u in poller.talkers_state():
+                    talkers.append((d + u, f"{poller.name}/{name}" if self.fleet else name, d, u))
+            if talkers and not self.talker_rows:
+                self._show_talkers()
+            top = heapq.nlargest(TOP_TALKERS, talkers)
+            for i, lbl in enumerate(self.talker_rows):
+                text = ""
+                if i < len(top):
+                    _, name, d, u = top[i]
+                    text = f"{name[:16]:<16} {format_rate_bytes_per_sec(d)} / {format_rate_bytes_per_sec(u)}"
                 try:
-                    self.monitor.close()
+                    self._config(("talker", i), lbl, text=text)
                 except Exception:
                     pass
-                # Record and notify error once
-                msg = str(e) or "SSH connection failed"
-                self._last_error_text = f"Connection failed: {msg}"
-                if not self._error_shown:
-                    try:
-                        messagebox.showerror("Connection failed", self._last_error_text)
-                    except Exception:
-                        pass
-                    self._error_shown = True
-            next_time += POLL_INTERVAL
-            time.sleep(max(0.0, next_time - time.perf_counter()))
+
+    def _update_iface_table(self):
+        # Each AP sorts its own table; a fleet merges the per-AP tops
+        sort = self._iface_sort
+        column = {"down": "tx" if LAN_PERSPECTIVE else "rx", "up": "rx" if LAN_PERSPECTIVE else "tx"}.get(sort, sort)
+        rows = []
+        for poller in self.pollers:
+            table = poller.selector.table
+            if not table:
+                continue
+            for name, rx, tx in table.top(column, IFACE_TABLE):
+                down, up = poller._perspective(rx, tx)
+                rows.append((f"{poller.name}/{name}" if self.fleet else name, down, up))
+        if not rows:
+            return
+        if self.fleet:
+            if sort == "name":
+                rows.sort()
+            else:
+                i = 1 if sort == "down" else 2
+                rows.sort(key=lambda r: -1.0 if r[i] is None else r[i], reverse=True)
+            rows = rows[:IFACE_TABLE]
+        if not self.iface_rows:
+            self._show_iface_table()
+        for i, lbl in enumerate(self.iface_rows):
+            text = ""
+            if i < len(rows):
+                name, d, u = rows[i]
+                text = f"{name[:13]:<13} {format_rate_bytes_per_sec(d):>10} {format_rate_bytes_per_sec(u):>10}"
+            try:
+                self._config(("iface", i), lbl, text=text)
+            except Exception:
+                pass
+
+    def _show_iface_table(self):
+        frame = tk.Frame(self.root)
+        head = tk.Frame(frame)
+        head.pack(fill=tk.X)
+        for key, title, width, anchor in (("name", "Interface", 14, "w"), ("down", "Down", 10, "e"), ("up", "Up", 11, "e")):
+            lbl = tk.Label(head, text=title, font=("Consolas", 8, "bold"), width=width, anchor=anchor, cursor="hand2")
+            lbl.pack(side=tk.LEFT)
+            lbl.bind("<Button-1>", lambda e, key=key: self._sort_ifaces(key))
+            self._iface_heads[key] = (lbl, title)
+        for _ in range(IFACE_TABLE):
+            lbl = tk.Label(frame, text="", font=("Consolas", 8), anchor="w", fg="#555555")
+            lbl.pack(fill=tk.X)
+            self.iface_rows.append(lbl)
+        frame.pack(fill=tk.X, padx=8, pady=(0, 6))
+        self._sort_ifaces(self._iface_sort)
+        width, height = self._size
+        self._size = (width, height + 24 + 16 * IFACE_TABLE)
+        self.root.geometry("{}x{}".format(*self._size))
+
+    def _sort_ifaces(self, key):
+        """Sort the interface table by a column (names ascending, rates highest first)."""
+        self._iface_sort = key
+        for k, (lbl, title) in self._iface_heads.items():
+            lbl.config(text=title + (" ▲" if key == k == "name" else " ▼" if key == k else ""))
+        self.request_ui()
+
+    def _show_talkers(self):
+        frame = tk.Frame(self.root)
+        tk.Label(frame, text="Top talkers (down / up)", font=("Segoe UI", 9, "bold"), anchor="w").pack(fill=tk.X)
+        for _ in range(TOP_TALKERS):
+            lbl = tk.Label(frame, text="", font=("Consolas", 8), anchor="w", fg="#555555")
+            lbl.pack(fill=tk.X)
+            self.talker_rows.append(lbl)
+        frame.pack(fill=tk.X, padx=8, pady=(0, 6))
+        width, height = self._size
+        self._size = (width, height + 24 + 16 * TOP_TALKERS)
+        self.root.geometry("{}x{}".format(*self._size))
+
+    def _push_history(self, down, up):
+        # One point per new sample; a fleet reports staggered samples, so totals are
+        # recorded at most once per POLL_INTERVAL
+        seq = 0
+        rx = tx = 0
+        for poller in self.pollers:
+            seq += poller.samples
+            latest = poller.history().latest()
+            if latest:
+                rx += latest[1]
+                tx += latest[2]
+        now = time.monotonic()
+        if seq == self._history_seq or down is None:
+            return
+        if self.fleet and now - self._history_pushed < POLL_INTERVAL * 0.9:
+            return
+        self._history_seq = seq
+        self._history_pushed = now
+        self.history.append(time.time(), rx, tx, down, up)
+        # Keep the scale on the peak still visible in the sparklines
+        _, peak_down, _ = self.history.stats("down", self.spark.points)
+        _, peak_up, _ = self.history.stats("up", self.spark.points)
+        peak = max(peak_down, peak_up)
+        try:
+            self.spark.push(down, up, peak)
+            if self.overlay:
+                self.overlay.spark.push(down, up, peak)
+        except Exception:
+            pass
 
     def exit_app(self):
+        self._closing = True
         try:
-            self.stop_event.set()
             if self.tray:
                 try:
                     self.tray.stop()
                 except Exception:
                     pass
-            self.monitor.close()
+            self.scheduler.stop()
+            self.alerts.stop()
+            self.actions.stop()
+            if self.exporter:
+                self.exporter.stop()
+            if self.store:
+                self.store.stop()
+            if STAGES:
+                STAGES.stop()
         finally:
             try:
                 self.root.destroy()
@@ -440,9 +3859,16 @@ class App:
                 pass
 
     def run(self):
-        self.root.protocol("WM_DELETE_WINDOW", self.minimize_to_tray if self.tray else self.exit_app)
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
         self.root.mainloop()
 
+    def _on_close(self):
+        # The tray may still be loading (or have failed to); decide when it matters
+        if self.tray:
+            self.minimize_to_tray()
+        else:
+            self.exit_app()
+
     def show_window(self):
         try:
             self.root.deiconify()
@@ -471,40 +3897,161 @@ class App:
         except Exception:
             pass
 
+    def _action_items(self):
+        # [(label, callback)], or per-AP submenus [(ap name, [(label, callback)])] in fleet mode
+        def item(poller, name):
+            # Tray callbacks arrive on pystray's thread; confirm on the Tk thread
+            return action_label(name), lambda: self.root.after(0, self.run_action, poller, name)
+
+        if not self.fleet:
+            return [item(self.pollers[0], name) for name in self.actions.actions]
+        return [(p.name, [item(p, name) for name in self.actions.actions]) for p in self.pollers]
+
+    def _popup_actions(self, event):
+        if self._action_menu is None:
+            self._action_menu = self._build_menu(tk.Menu(self.root, tearoff=0), self._action_items())
+        try:
+            self._action_menu.tk_popup(event.x_root, event.y_root)
+        finally:
+            self._action_menu.grab_release()
+
+    def _build_menu(self, menu, items):
+        for label, target in items:
+            if callable(target):
+                menu.add_command(label=label, command=target)
+            else:
+                menu.add_cascade(label=label, menu=self._build_menu(tk.Menu(menu, tearoff=0), target))
+        return menu
+
+    def run_action(self, poller, name):
+        """Confirm and queue a remote action; progress and result show in the status line."""
+        target = f"{action_label(name)} on {poller.name}" if self.fleet else action_label(name)
+        try:
+            iface = self.actions.iface_for(poller, name)
+        except ValueError as e:
+            self._note(f"{target}: {e}", "#e74c3c")
+            return
+        question = f"{target} now?" + (f"\n\nInterface: {iface}" if iface else "")
+        if not messagebox.askyesno("Remote action", question, parent=self.root):
+            return
+        # Pin the confirmed interface in case auto-detect switches meanwhile
+        if self.actions.submit(poller, name, iface) is None:
+            self._note(f"{target}: already running", "#999999")
+        else:
+            self._note(f"{target}: running...", "#999999", ACTION_TIMEOUT)
+
+    def _on_action_result(self, poller, name, ok, message):
+        target = f"{action_label(name)} on {poller.name}" if self.fleet else action_label(name)
+        text = f"{target}: {message}"
+        self._note(text, "#2ecc71" if ok else "#e74c3c")
+        if self.tray:
+            self.tray.notify(text)
+
+    def _on_alert(self, poller, rule, firing, message):
+        target = f"{rule.name} on {poller.name}" if self.fleet else rule.name
+        text = f"Alert {target}: {message}"
+        self._note(text, "#e67e22" if firing else "#999999", 30 if firing else 10)
+        if self.tray:
+            self.tray.notify(text)
+
+    def _note(self, text, color, seconds=10):
+        self._action_note = (text, color, time.monotonic() + seconds)
+        self.request_ui()
+
+    def toggle_debug(self):
+        """Show or hide the stage timings window (refreshed every second while open)."""
+        if self._debug is not None:
+            try:
+                self._debug.destroy()
+            except Exception:
+                pass
+            self._debug = None
+            return
+        top = tk.Toplevel(self.root)
+        top.title("Stage timings (ms)")
+        top.resizable(False, False)
+        lbl = tk.Label(top, text="", font=("Consolas", 9), justify=tk.LEFT, anchor="nw")
+        lbl.pack(padx=8, pady=8)
+        top.protocol("WM_DELETE_WINDOW", self.toggle_debug)
+        self._debug = top
+
+        def refresh():
+            if self._debug is not top:
+                return
+            try:
+                lbl.config(text=STAGES.table())
+                top.after(1000, refresh)
+            except Exception:
+                pass
+
+        refresh()
+
 
 # Minimal tray manager to show live speeds and menu
 class TrayManager:
-    def __init__(self, on_show, on_exit, on_toggle_overlay=None, on_toggle_topmost=None):
+    # Rendered icons kept for reuse, keyed by their short down/up texts
+    IMAGE_CACHE_SIZE = 128
+
+    def __init__(self, on_show, on_exit, on_toggle_overlay=None, on_toggle_topmost=None, on_debug=None, actions=None):
         self.on_show = on_show
         self.on_exit = on_exit
         self.on_toggle_overlay = on_toggle_overlay
         self.on_toggle_topmost = on_toggle_topmost
+        self.on_debug = on_debug
+        self.actions = actions  # [(label, callback or [(label, callback), ...]), ...]
         self.icon = None
         self._thread = None
+        self._base = None
+        self._font = None
+        self._images = collections.OrderedDict()
+        self._shown_key = None
+        self._shown_title = None
+
+    def _base_image(self):
+        # Background and the static "D:"/"U:" labels are drawn once
+        if self._base is None:
+            try:
+                self._font = ImageFont.load_default()
+            except Exception:
+                self._font = None
+            img = Image.new("RGBA", (32, 32), (0, 0, 0, 0))
+            draw = ImageDraw.Draw(img)
+            draw.rounded_rectangle([0, 0, 31, 31], radius=6, fill=(32, 32, 32, 240))
+            draw.text((3, 4), "D:", fill=(100, 160, 255, 255), font=self._font)
+            draw.text((3, 16), "U:", fill=(120, 220, 120, 255), font=self._font)
+            self._base = img
+        return self._base
 
     def _make_image(self, down_text, up_text):
-        img = Image.new("RGBA", (32, 32), (0, 0, 0, 0))
+        key = (down_text, up_text)
+        img = self._images.get(key)
+        if img is not None:
+            self._images.move_to_end(key)
+            return img
+        img = self._base_image().copy()
         draw = ImageDraw.Draw(img)
-        try:
-            font = ImageFont.load_default()
-        except Exception:
-            font = None
-        draw.rounded_rectangle([0, 0, 31, 31], radius=6, fill=(32, 32, 32, 240))
-        draw.text((3, 4), "D:", fill=(100, 160, 255, 255), font=font)
-        draw.text((3, 16), "U:", fill=(120, 220, 120, 255), font=font)
-        draw.text((14, 4), down_text, fill=(220, 220, 220, 255), font=font)
-        draw.text((14, 16), up_text, fill=(220, 220, 220, 255), font=font)
+        draw.text((14, 4), down_text, fill=(220, 220, 220, 255), font=self._font)
+        draw.text((14, 16), up_text, fill=(220, 220, 220, 255), font=self._font)
+        self._images[key] = img
+        if len(self._images) > self.IMAGE_CACHE_SIZE:
+            self._images.popitem(last=False)
         return img
 
     def start(self, title="Traffic", down_text="--", up_text="--"):
         if not HAS_TRAY:
             return
         image = self._make_image(down_text, up_text)
+        self._shown_key = (down_text, up_text)
+        self._shown_title = title
         items = [pystray.MenuItem("Show", lambda: self.on_show())]
         if self.on_toggle_overlay:
             items.append(pystray.MenuItem("Toggle Overlay", lambda: self.on_toggle_overlay()))
         if self.on_toggle_topmost:
             items.append(pystray.MenuItem("Toggle Always On Top", lambda: self.on_toggle_topmost()))
+        if self.on_debug:
+            items.append(pystray.MenuItem("Stage Timings", lambda: self.on_debug()))
+        if self.actions:
+            items.append(pystray.MenuItem("Actions", self._menu(self.actions)))
         items.append(pystray.MenuItem("Exit", lambda: self.on_exit()))
         menu = pystray.Menu(*items)
         self.icon = pystray.Icon("traffic_widget", image, title, menu)
@@ -517,7 +4064,22 @@ class TrayManager:
         self._thread = threading.Thread(target=run, daemon=True)
         self._thread.start()
 
-    def update(self, down_bytes_per_s, up_bytes_per_s):
+    def _menu(self, entries):
+        return pystray.Menu(*[
+            pystray.MenuItem(label, target if callable(target) else self._menu(target))
+            for label, target in entries
+        ])
+
+    def notify(self, message, title="Traffic"):
+        if not HAS_TRAY or not self.icon:
+            return
+        try:
+            if getattr(self.icon, "HAS_NOTIFICATION", False):
+                self.icon.notify(message, title)
+        except Exception:
+            pass
+
+    def update(self, down_bytes_per_s, up_bytes_per_s, title=None):
         if not HAS_TRAY or not self.icon:
             return
         def short(v):
@@ -526,11 +4088,16 @@ class TrayManager:
             if v >= 1024 * 1024:
                 return f"{v/(1024*1024):.1f}M"
             return f"{max(v/1024, 0):.0f}K"
-        d = short(down_bytes_per_s)
-        u = short(up_bytes_per_s)
+        key = (short(down_bytes_per_s), short(up_bytes_per_s))
+        title = title or f"Down: {format_rate_bytes_per_sec(down_bytes_per_s)} | Up: {format_rate_bytes_per_sec(up_bytes_per_s)}"
+        # Only touch pystray (a native icon update each) when something visible changed
         try:
-            self.icon.title = f"Down: {format_rate_bytes_per_sec(down_bytes_per_s)} | Up: {format_rate_bytes_per_sec(up_bytes_per_s)}"
-            self.icon.icon = self._make_image(d, u)
+            if title != self._shown_title:
+                self.icon.title = title
+                self._shown_title = title
+            if key != self._shown_key:
+                self.icon.icon = self._make_image(*key)
+                self._shown_key = key
         except Exception:
             pass
 
@@ -543,6 +4110,63 @@ class TrayManager:
             pass
 
 
+class Sparkline:
+    """Down/up sparkline on a Tk canvas, redrawn incrementally.
+
+    Each sample shifts the existing segments left with one canvas.move, appends one
+    segment per series and drops the oldest; when the visible peak changes enough the
+    whole plot is rescaled with one canvas.scale instead of being rebuilt.
+    """
+
+    def __init__(self, parent, width, height, points, bg, down_color, up_color):
+        self.width = width
+        self.height = height
+        self.points = max(points, 2)
+        self.step = width / (self.points - 1)
+        self.down_color = down_color
+        self.up_color = up_color
+        self.canvas = tk.Canvas(parent, width=width, height=height, bg=bg, highlightthickness=0, bd=0)
+        self._segments = collections.deque()
+        self._last = None
+        self._scale_max = 1024.0  # bytes/s at the top edge
+        self._base = height - 1
+
+    def _y(self, value):
+        return self._base - min(value / self._scale_max, 1.0) * (self.height - 2)
+
+    def _rescale(self, new_max):
+        factor = self._scale_max / new_max
+        self._scale_max = new_max
+        self.canvas.scale("spark", 0, self._base, 1.0, factor)
+
+    def push(self, down, up, peak=None):
+        """Append one sample; peak is the max rate in the visible window (for rescaling)."""
+        down = down or 0.0
+        up = up or 0.0
+        peak = max(peak or 0.0, down, up, 1024.0)
+        # Grow immediately, shrink only once the visible peak falls well below the scale
+        if peak > self._scale_max or peak < self._scale_max / 4:
+            self._rescale(peak * 1.2)
+        if self._last is not None:
+            c = self.canvas
+            c.move("spark", -self.step, 0)
+            x0 = self.width - 1 - self.step
+            x1 = self.width - 1
+            self._segments.append((
+                c.create_line(x0, self._y(self._last[0]), x1, self._y(down), fill=self.down_color, tags="spark"),
+                c.create_line(x0, self._y(self._last[1]), x1, self._y(up), fill=self.up_color, tags="spark"),
+            ))
+            while len(self._segments) > self.points - 1:
+                for item in self._segments.popleft():
+                    c.delete(item)
+        self._last = (down, up)
+
+    def clear(self):
+        self.canvas.delete("spark")
+        self._segments.clear()
+        self._last = None
+
+
 class TextOverlay:
     def __init__(self, root):
         self.root = root
@@ -560,11 +4184,13 @@ class TextOverlay:
         self.dot = tk.Canvas(self.row, width=10, height=10, highlightthickness=0, bg=self.bg, bd=0)
         self._dot_item = self.dot.create_oval(1, 1, 9, 9, fill="#999999", outline="")
         self.text = tk.Label(self.row, text="Down: -- | Up: --", fg="#FFFFFF", bg=self.bg, font=("Segoe UI", 11))
+        self.spark = Sparkline(self.row, 60, 16, 30, self.bg, "#64a0ff", "#78dc78")
         self.dot.pack(side=tk.LEFT, padx=(0, 6))
         self.text.pack(side=tk.LEFT)
+        self.spark.canvas.pack(side=tk.LEFT, padx=(6, 0))
         # Drag behavior
         self._drag = None
-        for w in (self.row, self.dot, self.text):
+        for w in (self.row, self.dot, self.text, self.spark.canvas):
             try:
                 w.bind("<ButtonPress-1>", self._on_press)
                 w.bind("<B1-Motion>", self._on_drag)
@@ -584,6 +4210,8 @@ class TextOverlay:
         except Exception:
             pass
         self._visible = False
+        self._shown_text = None
+        self._shown_color = None
         # Intercept close to hide instead of destroy
         try:
             self.top.protocol("WM_DELETE_WINDOW", self.hide)
@@ -628,15 +4256,27 @@ class TextOverlay:
     def visible(self):
         return bool(self._visible)
 
-    def set_text(self, down_text, up_text, status_text="unknown"):
+    def set_text(self, down_text, up_text, status_text="unknown", alert=None):
         try:
-            self.text.config(text=f"Down: {down_text} | Up: {up_text}")
+            text = f"Down: {down_text} | Up: {up_text}"
+            if alert:
+                text += f" | ! {alert}"
+            if text != self._shown_text:
+                self.text.config(text=text, fg="#e67e22" if alert else "#FFFFFF")
+                self._shown_text = text
             color = "#2ecc71" if status_text == "up" else ("#e74c3c" if status_text == "down" else "#999999")
-            self.dot.itemconfig(self._dot_item, fill=color)
+            if color != self._shown_color:
+                self.dot.itemconfig(self._dot_item, fill=color)
+                self._shown_color = color
         except Exception:
             pass
 
 
 if __name__ == "__main__":
-    app = App()
-    app.run()
+    if HEADLESS:
+        run_headless()
+    else:
+        if tk is None:
+            raise SystemExit("Missing dependency: tkinter. Install Tk support or run with HEADLESS=1.")
+        app = App()
+        app.run()